@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: encoding a page of marshalled locations and the response timestamp.
+
+Run from the repository root: python -m bench.encoders
+"""
+
+from __future__ import annotations
+
+import timeit
+from datetime import datetime, timezone
+
+from ocpi.encoders import orjson, orjsonDumps, stdlibDumps, timestamp
+
+location = {
+    "id": "LOC1",
+    "address": "Street 1",
+    "city": "Gent",
+    "postal_code": "9000",
+    "country": "BEL",
+    "coordinates": {"latitude": "51.05", "longitude": "3.72"},
+    "evses": [
+        {
+            "uid": f"EVSE{i}",
+            "status": "AVAILABLE",
+            "connectors": [
+                {"id": str(j), "voltage": 230, "amperage": 32, "tariff_id": None}
+                for j in range(2)
+            ],
+            "last_updated": "2024-01-01T00:00:00+00:00",
+        }
+        for i in range(4)
+    ],
+    "last_updated": "2024-01-01T00:00:00+00:00",
+}
+
+
+if __name__ == "__main__":
+    page = {"data": [location] * 500, "status_code": 1000, "timestamp": timestamp()}
+    runs = 20
+    for name, function in [("stdlib", stdlibDumps), ("orjson", orjson and orjsonDumps)]:
+        if function is None:
+            print(f"{name}: not installed")
+            continue
+        duration = timeit.timeit(lambda: function(page), number=runs) / runs
+        print(f"{name}: {duration * 1000:.2f} ms per page of 500 locations")
+    duration = timeit.timeit(lambda: datetime.now(timezone.utc).isoformat(), number=10000)
+    print(f"timestamp per response: {duration * 100:.2f} us formatted,", end=" ")
+    duration = timeit.timeit(timestamp, number=10000)
+    print(f"{duration * 100:.2f} us precomputed")
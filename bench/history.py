@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: utilization and heatmap of 50000 EVSEs with a year of status history.
+
+Run from the repository root: python -m bench.history
+"""
+
+from __future__ import annotations
+
+import random
+import time
+
+from ocpi.history import STATUSES, StatusHistory, summarize
+
+if __name__ == "__main__":
+    history = StatusHistory()
+    count, per_evse = 50000, 200
+    now = int(time.time())
+    start = time.perf_counter()
+    for n in range(count):
+        t = now - 365 * 86400
+        for _ in range(per_evse):
+            t += random.randint(60, 2 * 86400 * 365 // per_evse)
+            history.record(n, t, random.choice(STATUSES))
+    print(f"recorded {count * per_evse} transitions in {time.perf_counter() - start:.1f}s")
+    keys = history.keys()
+    for days in (1, 30, 365):
+        start = time.perf_counter()
+        result = summarize(history.utilization(keys, now - days * 86400, now))
+        middle = time.perf_counter()
+        history.heatmap(keys, now - days * 86400, now)
+        print(
+            f"{days:3d} days: utilization {middle - start:.3f}s,"
+            f" heatmap {time.perf_counter() - middle:.3f}s, charging {result['charging']:.3f}"
+        )
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: energy rollups over the charging periods of 200000 sessions.
+
+Run from the repository root: python -m bench.periods
+"""
+
+from __future__ import annotations
+
+import random
+import time
+
+from ocpi.periods import ChargingPeriods
+
+if __name__ == "__main__":
+    periods = ChargingPeriods()
+    count, per_session = 200000, 20
+    now = int(time.time())
+    start = time.perf_counter()
+    for n in range(count):
+        t = now - random.randint(0, 365 * 86400)
+        session = {
+            "start_datetime": t,
+            "location": {"id": f"LOC{n % 5000}"},
+            "country_code": "BE",
+            "party_id": f"P{n % 20}",
+            "currency": "EUR",
+            "total_cost": 10.0,
+            "charging_periods": [
+                {
+                    "start_date_time": t + 900 * i,
+                    "dimensions": [
+                        {"type": "ENERGY", "volume": 2.5},
+                        {"type": "TIME", "volume": 0.25},
+                    ],
+                }
+                for i in range(per_session)
+            ],
+        }
+        periods.update(n, session)
+    print(f"stored {len(periods)} dimensions in {time.perf_counter() - start:.1f}s")
+    for by, interval in ((None, 0), ("location", 0), ("party", 0), ("interval", 86400)):
+        start = time.perf_counter()
+        result = periods.rollup(now - 365 * 86400, now, by=by, interval=interval)
+        print(
+            f"by {by}: {len(result)} groups, {sum(v['kwh'] for _, v in result):.0f} kWh"
+            f" in {time.perf_counter() - start:.3f}s"
+        )
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: validation cost per request, flask-restx vs compiled validators.
+
+Run from the repository root: python -m bench.validators
+"""
+
+from __future__ import annotations
+
+import timeit
+import warnings
+
+from flask_restx.model import ModelBase
+
+import ocpi.models.location as ml
+import ocpi.models.sessions as ms
+from ocpi.validators import _definitions, compileValidator
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    from jsonschema import RefResolver
+
+connector = {
+    "id": "1",
+    "standard": "IEC_62196_T2",
+    "format": "SOCKET",
+    "power_type": "AC_3_PHASE",
+    "voltage": 230,
+    "amperage": 32,
+    "last_updated": "2024-01-01T00:00:00Z",
+}
+evse = {
+    "uid": "EVSE1",
+    "status": "CHARGING",
+    "capabilities": ["RFID_READER"],
+    "connectors": [connector, dict(connector, id="2")],
+    "last_updated": "2024-01-01T00:00:00Z",
+}
+location = {
+    "id": "LOC1",
+    "address": "Street 1",
+    "city": "Gent",
+    "postal_code": "9000",
+    "country": "BEL",
+    "coordinates": {"latitude": "51.05", "longitude": "3.72"},
+    "evses": [evse],
+    "operator": {"name": "Operator"},
+    "last_updated": "2024-01-01T00:00:00Z",
+}
+session = {
+    "id": "SESSION1",
+    "start_datetime": "2024-01-01T00:00:00Z",
+    "kwh": 12.5,
+    "auth_id": "AUTH1",
+    "location": location,
+    "currency": "EUR",
+    "charging_periods": [
+        {
+            "start_date_time": "2024-01-01T00:00:00Z",
+            "dimensions": [{"type": "ENERGY", "volume": 1.5}],
+        }
+    ],
+    "status": "ACTIVE",
+    "last_updated": "2024-01-01T00:00:00Z",
+}
+
+
+if __name__ == "__main__":
+    runs = 200
+    for model, payload in [
+        (ml.Connector, connector),
+        (ml.EVSE, evse),
+        (ml.Location, location),
+        (ms.Session, session),
+    ]:
+        # flask-restx resolves the references against the swagger definitions
+        resolver = RefResolver.from_schema({"definitions": _definitions(model)})
+        compiled = compileValidator(model)
+        generic = timeit.timeit(
+            lambda: ModelBase.validate(model, payload, resolver), number=runs
+        )
+        fast = timeit.timeit(lambda: compiled.validate(payload), number=runs)
+        print(
+            f"{model.name:12} flask-restx {generic / runs * 1e6:8.1f} us"
+            f"  compiled {fast / runs * 1e6:8.1f} us  ({generic / fast:.1f}x)"
+        )
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gunicorn hooks: with PUSH_SPOOL set the arbiter runs the spool worker
+(python -m ocpi.spool) as a child process, restarts it when it exits and
+stops it with SIGTERM on shutdown, so pending pushes are written back.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+
+RESTART_DELAY = 5
+STOP_TIMEOUT = 30
+
+_spool = {"process": None, "stopping": threading.Event()}
+
+
+def _supervise(server, directory):
+    stopping = _spool["stopping"]
+    while not stopping.is_set():
+        process = subprocess.Popen([sys.executable, "-m", "ocpi.spool", directory])
+        _spool["process"] = process
+        server.log.info(f"spool worker started on {directory} (pid {process.pid})")
+        code = process.wait()
+        if stopping.is_set():
+            break
+        server.log.error(f"spool worker exited with {code}, restarting in {RESTART_DELAY}s")
+        stopping.wait(RESTART_DELAY)
+
+
+def when_ready(server):
+    directory = os.getenv("PUSH_SPOOL")
+    if directory:
+        threading.Thread(target=_supervise, args=(server, directory), daemon=True).start()
+
+
+def on_exit(server):
+    _spool["stopping"].set()
+    process = _spool["process"]
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        server.log.warning("spool worker did not stop, killing it")
+        process.kill()
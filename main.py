@@ -14,7 +14,10 @@ import os
 import logging
 from ocpi import createOcpiBlueprint
 import ocpi.managers as om
+from ocpi.storage import SqliteStore
+from ocpi.spool import Spool
 from ocpi.namespaces import SingleCredMan
+from ocpi.namespaces.internal import event_streams
 
 from flask import Flask, redirect, request
 
@@ -57,12 +60,29 @@ cred_roles = [{
 
 # inject dependencies here
 # must have expected method signatures
-ses = om.SessionManager()
-loc = om.LocationManager()
+# with a shared store all gunicorn workers see the same locations and sessions
+store_db = os.getenv('STORE_DB')
+if store_db:
+    ses = om.SessionManager(SqliteStore(store_db, 'sessions'))
+    loc = om.LocationManager(SqliteStore(store_db, 'locations'))
+else:
+    ses = om.SessionManager()
+    loc = om.LocationManager()
 #commands = om.CommandsManager()
 #reservations = om.ReservationManager()
 # TODO maybe provide interface and inject with decorator..?
-cm = om.CredentialsDictMan(cred_roles, HOST_URL)
+# a sqlite database is shared safely between multiple gunicorn workers
+creds_db = os.getenv('CREDENTIALS_DB')
+if creds_db:
+    cm = om.CredentialsSqliteMan(cred_roles, HOST_URL, filename=creds_db)
+else:
+    cm = om.CredentialsDictMan(cred_roles, HOST_URL)
+# pushes are spooled to disk and sent by a separate process: python -m ocpi.spool
+push_spool = os.getenv('PUSH_SPOOL')
+if push_spool:
+    cm.spool = Spool(push_spool)
+# open Server-Sent Event streams per worker, each one holds one of its threads
+event_streams.limit = int(os.getenv('EVENT_STREAMS', 1))
 
 
 injected_objects = {
@@ -16,6 +16,10 @@ import logging
 from flask import Blueprint
 from flask_restx import Api
 
+import ocpi.models.credentials
+import ocpi.models.location
+import ocpi.models.sessions
+from ocpi.encoders import defaultDumps, jsonRepresentation, setDumps
 from ocpi.managers import VersionManager
 from ocpi.namespaces import SingleCredMan
 from ocpi.namespaces.internal import internal_ns
@@ -23,6 +27,9 @@ from ocpi.namespaces.credentials import credentials_ns
 from ocpi.namespaces.locations import makeLocationNamespace
 from ocpi.namespaces.versions import versions_ns
 from ocpi.namespaces.sessions import makeSessionNamespace
+from ocpi.serializers import compileModels
+from ocpi.sync import SyncClient
+from ocpi.validators import installValidators
 
 log = logging.getLogger("ocpi")
 
@@ -36,7 +43,7 @@ injected = {
 }
 
 
-def createOcpiBlueprint(base_url, injected_objects=injected, ocpi_version="2.1.1",url_prefix:str="/ocpi"):
+def createOcpiBlueprint(base_url, injected_objects=injected, ocpi_version="2.1.1",url_prefix:str="/ocpi", json_dumps=None):
     """
     Creates API blueprint with injected Objects.
     Must contain a sessionmanager and others.
@@ -46,12 +53,24 @@ def createOcpiBlueprint(base_url, injected_objects=injected, ocpi_version="2.1.1
     ----------
     injected_objects : dict
         DESCRIPTION.
+    json_dumps : callable, optional
+        encoder for the JSON responses, dumps(data) -> bytes.
+        Defaults to orjson if installed, else the stdlib json module.
 
     Returns
     -------
     blueprint
 
     """
+    # build the serializers for the models once instead of on first use
+    compileModels(ocpi.models.location, ocpi.models.sessions, ocpi.models.credentials)
+    # validate the expected payloads with precompiled validators
+    ml, ms = ocpi.models.location, ocpi.models.sessions
+    installValidators(
+        ml.Location, ml.EVSE, ml.Connector, ms.Session,
+        ml.LocationOptional, ml.EVSEOptional, ml.ConnectorOptional, ms.SessionOptional,
+    )
+
     blueprint = Blueprint("ocpi_api", __name__, url_prefix=url_prefix)
     authorizations = {
         "Bearer": {"type": "apiKey", "in": "header", "name": "Authorization"}
@@ -67,6 +86,10 @@ def createOcpiBlueprint(base_url, injected_objects=injected, ocpi_version="2.1.1
         default="Project-Backend",
         default_label="Beschreibung der API für das App-Framework",
     )
+    json_dumps = json_dumps or defaultDumps()
+    setDumps(json_dumps)
+    api.representation("application/json")(jsonRepresentation(json_dumps))
+    log.debug(f"encoding responses with {json_dumps.__name__}")
 
     if "credentials" not in injected_objects:
         raise Exception("a credentials_manager must be injected")
@@ -98,6 +121,10 @@ def createOcpiBlueprint(base_url, injected_objects=injected, ocpi_version="2.1.1
         endpoints[key] = value["role"].upper()
 
     inj_obj["versions"] = VersionManager(base_url, endpoints, ocpi_version)
+    # pulls the partners' locations and sessions into the injected managers
+    inj_obj["sync"] = SyncClient(
+        inj_obj["credentials"], inj_obj.get("locations"), inj_obj.get("sessions")
+    )
 
     # setting custom Namespaces should work too
     # import numpy as np
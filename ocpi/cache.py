@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache for already marshalled location, EVSE and connector responses.
+"""
+
+from __future__ import annotations
+
+import threading
+
+
+class ResponseCache:
+    """
+    Keeps the JSON bytes of marshalled objects keyed by
+    (country_code, party_id, location_id, evse_uid, connector_id),
+    where evse_uid and connector_id are None for the upper levels.
+
+    The LocationManager invalidates exactly the entries a write touches.
+    Every invalidation bumps the generation of the location, a value
+    rendered from an older generation is not stored. The check and the
+    store happen under the same lock as the invalidation, so a value
+    rendered before a concurrent write never outlives it.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def generation(self, location_id) -> int:
+        return self._generations.get(location_id, 0)
+
+    def get(self, key):
+        country_code, party_id, location_id, evse_uid, connector_id = key
+        entries = self._entries.get(location_id)
+        if entries is None:
+            return None
+        return entries.get((evse_uid, connector_id, country_code, party_id))
+
+    def set(self, key, value: bytes, generation: int):
+        country_code, party_id, location_id, evse_uid, connector_id = key
+        with self._lock:
+            if generation != self.generation(location_id):
+                return
+            entries = self._entries.setdefault(location_id, {})
+            entries[(evse_uid, connector_id, country_code, party_id)] = value
+
+    def invalidate(self, location_id, evse_uid=None, connector_id=None):
+        """
+        drops the location itself and, if given, the EVSE and connector
+        below it. Without evse_uid everything of the location is dropped.
+        """
+        with self._lock:
+            self._generations[location_id] = self.generation(location_id) + 1
+            if evse_uid is None:
+                self._entries.pop(location_id, None)
+                return
+            entries = self._entries.get(location_id)
+            if not entries:
+                return
+            for entry in list(entries):
+                entry_evse, entry_connector = entry[0], entry[1]
+                if (
+                    entry_evse is None
+                    or entry_evse == evse_uid
+                    and (
+                        connector_id is None
+                        or entry_connector is None
+                        or entry_connector == connector_id
+                    )
+                ):
+                    entries.pop(entry, None)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP client for all requests to the partners.
+
+Every partner (scheme and host of the url) gets its own requests.Session,
+so connections are kept alive and reused. Requests have a default
+timeout and are retried with backoff on connection errors and on
+429/502/503/504. Read timeouts are not retried and the wait for a
+Retry-After is capped at backoff_max, so a request takes at most about
+the connect timeout per attempt plus the read timeout once.
+
+A circuit breaker per partner counts consecutive failures. After
+failure_threshold of them the partner is not contacted for reset_timeout
+seconds, requests fail right away with CircuitOpenError. Then a single
+request is let through to probe the partner.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+log = logging.getLogger("ocpi")
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """the partner failed too often recently, the request was not sent"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened is None:
+            return "closed"
+        if time.monotonic() - self.opened < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        """whether a request may be sent now"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                # let a single request through to test the partner
+                self._probing = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+            self._probing = False
+
+    def release(self):
+        """the request neither proved the partner up nor down"""
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold:
+                if self.opened is None:
+                    log.warning(f"circuit opened after {self.failures} failures")
+                self.opened = time.monotonic()
+
+
+class _Retry(Retry):
+    """Retry which waits at most backoff_max seconds for a Retry-After as well"""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, self.backoff_max)
+
+
+class OcpiClient:
+    def __init__(
+        self,
+        timeout=(3.05, 10.0),
+        retries: int = 2,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 2.0,
+        pool_maxsize: int = 8,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.pool_maxsize = pool_maxsize
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._sessions = {}
+        self._breakers = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def partner(url: str) -> str:
+        """the base url identifying the partner of an url"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _newSession(self) -> requests.Session:
+        retry = _Retry(
+            total=self.retries,
+            connect=self.retries,
+            # a read timeout is raised at once: a retry would multiply the
+            # timeout of the request, and the partner may have applied it
+            read=False,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            backoff_max=self.backoff_max,
+            status_forcelist=(429, 502, 503, 504),
+            # PUT is idempotent in OCPI as well, POST and PATCH are not retried once sent
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"PUT"},
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=self.pool_maxsize)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get(self, partner):
+        with self._lock:
+            if self._pid != os.getpid():
+                # connections must not be shared with the parent after a fork
+                self._sessions = {}
+                self._pid = os.getpid()
+            session = self._sessions.get(partner)
+            if session is None:
+                session = self._sessions[partner] = self._newSession()
+            breaker = self._breakers.get(partner)
+            if breaker is None:
+                breaker = self._breakers[partner] = CircuitBreaker(
+                    self.failure_threshold, self.reset_timeout
+                )
+            return session, breaker
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        return self._get(self.partner(url))[1]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        partner = self.partner(url)
+        session, breaker = self._get(partner)
+        if not breaker.allow():
+            raise CircuitOpenError(f"circuit of {partner} is open, not sending {method} {url}")
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            breaker.failure()
+            raise
+        except BaseException:
+            breaker.release()
+            raise
+        if response.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
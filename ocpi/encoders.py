@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+JSON encoders for the responses of the Api.
+
+An encoder is a function dumps(data) -> bytes. orjson is used when it
+is installed, otherwise the stdlib json module. createOcpiBlueprint
+registers the encoder as representation of application/json.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from collections.abc import Mapping, Sequence
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from flask import current_app, make_response
+from flask_restx.representations import output_json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+log = logging.getLogger("ocpi")
+
+
+def _default(value):
+    """converts values the encoders do not support natively"""
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, (Sequence, set, frozenset)) and not isinstance(value, str):
+        return list(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def stdlibDumps(data) -> bytes:
+    return json.dumps(data, default=_default).encode("utf-8")
+
+
+def orjsonDumps(data) -> bytes:
+    return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def defaultDumps():
+    """the fastest installed encoder"""
+    return stdlibDumps if orjson is None else orjsonDumps
+
+
+_dumps = stdlibDumps
+
+
+def setDumps(dumps):
+    """sets the encoder used for responses built outside of the Api (e.g. cached ones)"""
+    global _dumps
+    _dumps = dumps
+
+
+def dumps(data) -> bytes:
+    return _dumps(data)
+
+
+def jsonRepresentation(dumps):
+    """
+    returns an Api representation for application/json encoding with dumps.
+    With RESTX_JSON settings or in debug mode (pretty printing)
+    the default representation of flask-restx is used.
+    """
+
+    def output(data, code, headers=None):
+        if current_app.debug or current_app.config.get("RESTX_JSON"):
+            return output_json(data, code, headers)
+        resp = make_response(dumps(data) + b"\n", code)
+        resp.headers.extend(headers or {})
+        return resp
+
+    return output
+
+
+class _Timestamp:
+    """the current UTC time as ISO 8601 string, formatted once per second"""
+
+    def __init__(self):
+        self._second = None
+        self._value = None
+
+    def __call__(self) -> str:
+        second = int(time.time())
+        if second != self._second:
+            # value before second, so a concurrent reader never sees a stale value
+            self._value = datetime.fromtimestamp(second, timezone.utc).isoformat()
+            self._second = second
+        return self._value
+
+
+timestamp = _Timestamp()
+
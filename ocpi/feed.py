@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Change feeds of the LocationManager and SessionManager.
+
+Every change a manager commits, or picks up from other worker processes
+on a refresh, is published as an event with the sequence number of the
+store. A feed keeps the latest events in memory, so consumers can wait
+for new events and resume after the last event they saw.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+
+
+class ChangeFeed:
+    def __init__(self, seq: int = 0, size: int = 10000):
+        self._events = deque(maxlen=size)
+        self._cond = threading.Condition()
+        # events up to this sequence number are not in the buffer,
+        # at first those before the feed was created
+        self._dropped = seq
+        self.seq = seq
+
+    def publish(self, seq: int, events: list):
+        """adds the events of the change with the sequence number seq"""
+        with self._cond:
+            for event in events:
+                if len(self._events) == self._events.maxlen:
+                    self._dropped = self._events[0]["seq"]
+                event["seq"] = seq
+                self._events.append(event)
+            self.seq = max(self.seq, seq)
+            self._cond.notify_all()
+
+    def since(self, seq: int):
+        """
+        returns the events after seq, the sequence number they go up to
+        and whether these are all of them, older events may have been
+        dropped already
+        """
+        with self._cond:
+            complete = self._dropped <= seq <= self.seq
+            events = [event for event in self._events if event["seq"] > seq]
+            return events, self.seq, complete
+
+    def wait(self, seq: int, timeout: float) -> bool:
+        """waits up to timeout seconds for an event after seq"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.seq > seq, timeout)
+
+
+def matches(event, country_code=None, party_id=None, location_id=None) -> bool:
+    return (
+        (country_code is None or event.get("country_code") == country_code)
+        and (party_id is None or event.get("party_id") == party_id)
+        and (location_id is None or event.get("location_id") == location_id)
+    )
+
+
+def _unchanged(old, new, ignore=()) -> bool:
+    if old is new:
+        return True
+    keys = (old.keys() | new.keys()).difference(ignore)
+    return all(old.get(key) == new.get(key) for key in keys)
+
+
+def locationEvents(location_id, old, new) -> list:
+    """
+    the events of a changed location: the whole location if it is new or
+    one of its own fields changed, else one event per changed EVSE
+    """
+    event = {
+        "country_code": new.get("country_code"),
+        "party_id": new.get("party_id"),
+        "location_id": location_id,
+    }
+    # last_updated follows the children, so it does not count as own change
+    if old is None or not _unchanged(old, new, ("evses", "last_updated")):
+        return [{"type": "location", **event, "data": new}]
+    old_evses = old.get("evses") or {}
+    events = []
+    for uid, evse in (new.get("evses") or {}).items():
+        previous = old_evses.get(uid)
+        if previous is None or not _unchanged(previous, evse):
+            events.append({"type": "evse", **event, "evse_uid": uid, "data": evse})
+    return events
+
+
+def sessionEvents(session_id, old, new) -> list:
+    if old is not None and _unchanged(old, new):
+        return []
+    return [
+        {
+            "type": "session",
+            "country_code": new.get("country_code"),
+            "party_id": new.get("party_id"),
+            "location_id": (new.get("location") or {}).get("id"),
+            "session_id": session_id,
+            "data": new,
+        }
+    ]
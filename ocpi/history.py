@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Status history of the EVSEs and utilization analytics on it.
+
+Every status transition of an EVSE is appended to two columns of the
+EVSE: the time in seconds since the epoch (array "I") and the status
+code (array "B"), 5 bytes per transition. A year of history of 50k
+EVSEs with 10 transitions a day takes about 900 MB.
+
+The analytics cut the history to a time window, one segment per status
+period, and sum up the segments at once with numpy.
+Time before the first recorded transition of an EVSE is unknown and
+not counted.
+"""
+
+from __future__ import annotations
+
+import logging
+from array import array
+from bisect import bisect_left, bisect_right
+
+from ocpi.models.location import status as STATUSES
+
+import numpy as np
+
+log = logging.getLogger("ocpi")
+
+CODES = {value: code for code, value in enumerate(STATUSES)}
+# statuses counted as outage
+OUTAGE = ("OUTOFORDER", "INOPERATIVE")
+MAX_TIME = 2**32 - 1
+
+
+class StatusHistory:
+    def __init__(self):
+        # key -> (times, codes)
+        self._series = {}
+
+    def __len__(self):
+        return len(self._series)
+
+    def keys(self) -> list:
+        return list(self._series)
+
+    def record(self, key, timestamp: float, status: str):
+        """appends a transition of key to status at timestamp"""
+        code = CODES.get(status)
+        if code is None:
+            return
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = (array("I"), array("B"))
+        times, codes = series
+        # the time column holds unsigned 32 bit seconds
+        timestamp = min(max(int(timestamp), 0), MAX_TIME)
+        if times and timestamp < times[-1]:
+            # a transition arriving late is sorted in
+            i = bisect_right(times, timestamp)
+            times.insert(i, timestamp)
+            codes.insert(i, code)
+        else:
+            times.append(timestamp)
+            codes.append(code)
+
+    def transitions(self, key, begin=0, end=2**32) -> list:
+        """(time, status) of the transitions of key with begin <= time < end"""
+        times, codes = self._series.get(key, ((), ()))
+        lo, hi = bisect_left(times, begin), bisect_left(times, end)
+        return [(times[i], STATUSES[codes[i]]) for i in range(lo, hi)]
+
+    def _collect(self, keys, begin, end):
+        """
+        the transitions of the keys from the last one before begin up to end,
+        returns the indexes of the keys with transitions in the window,
+        their numbers of transitions and the joined times and codes
+        """
+        owners, lengths = [], []
+        all_times, all_codes = array("I"), array("B")
+        series = self._series
+        for n, key in enumerate(keys):
+            columns = series.get(key)
+            if columns is None:
+                continue
+            times, codes = columns
+            lo = max(bisect_right(times, begin) - 1, 0)
+            hi = bisect_left(times, end)
+            if lo < hi:
+                # copies, so the columns can grow meanwhile
+                all_times += times[lo:hi]
+                all_codes += codes[lo:hi]
+                owners.append(n)
+                lengths.append(hi - lo)
+        return owners, lengths, all_times, all_codes
+
+    def _segments(self, keys, begin, end):
+        """
+        (owner, start, end, code) columns of the status periods within the window,
+        owner is the index of the key in keys
+        """
+        owners, lengths, times, codes = self._collect(keys, begin, end)
+        lengths = np.array(lengths, dtype=np.int64)
+        starts = np.frombuffer(times, dtype=np.uint32).astype(np.int64)
+        ends = np.empty_like(starts)
+        ends[:-1] = starts[1:]
+        # a period ends with the next transition of the same key or the window
+        ends[np.cumsum(lengths) - 1] = end
+        return (
+            np.repeat(np.array(owners, dtype=np.int64), lengths),
+            np.maximum(starts, begin),
+            ends,
+            np.frombuffer(codes, dtype=np.uint8).astype(np.int64),
+        )
+
+    def utilization(self, keys: list, begin: int, end: int) -> list:
+        """
+        seconds per status code of each key within [begin, end),
+        a list of len(keys) lists of len(STATUSES) numbers
+        """
+        size = len(STATUSES)
+        owners, starts, ends, codes = self._segments(keys, begin, end)
+        seconds = np.bincount(
+            owners * size + codes, weights=ends - starts, minlength=len(keys) * size
+        )
+        return seconds.reshape(len(keys), size).tolist()
+
+    def heatmap(self, keys: list, begin: int, end: int, status: str = "CHARGING") -> list:
+        """
+        share of the observed time the keys spent in status within [begin, end)
+        per weekday (0 is Monday) and hour of the day (UTC), 7 lists of 24 floats
+        """
+        code = CODES[status]
+        _, starts, ends, codes = self._segments(keys, begin, end)
+        first = begin - begin % 3600
+        edges = np.clip(np.arange(first, end + 3600, 3600, dtype=np.int64), begin, end)
+        observed = np.diff(_covered(starts, ends, edges))
+        selected = codes == code
+        busy = np.diff(_covered(starts[selected], ends[selected], edges))
+        hours = np.arange(first, first + 3600 * len(busy), 3600, dtype=np.int64)
+        # 1970-01-01 was a Thursday
+        cells = ((hours // 86400 + 3) % 7) * 24 + (hours // 3600) % 24
+        busy = np.bincount(cells, weights=busy, minlength=168)
+        observed = np.bincount(cells, weights=observed, minlength=168)
+        share = np.divide(busy, observed, out=np.zeros(168), where=observed > 0)
+        return share.reshape(7, 24).tolist()
+
+
+def _covered(starts, ends, edges):
+    """
+    total length of the periods [starts, ends) before each edge, with
+    sorted starts and ends the sum is a lookup in the prefix sums
+    """
+    starts, ends = np.sort(starts), np.sort(ends)
+    before_start = np.searchsorted(starts, edges)
+    before_end = np.searchsorted(ends, edges)
+    start_sums = np.concatenate([[0], np.cumsum(starts)])
+    end_sums = np.concatenate([[0], np.cumsum(ends)])
+    return (before_start * edges - start_sums[before_start]) - (
+        before_end * edges - end_sums[before_end]
+    )
+
+
+def summarize(seconds: list) -> dict:
+    """totals of the seconds per status of StatusHistory.utilization"""
+    totals = [sum(column) for column in zip(*seconds)] or [0] * len(STATUSES)
+    observed = sum(totals)
+    return {
+        "observed_seconds": observed,
+        "seconds": {value: totals[code] for code, value in enumerate(STATUSES)},
+        "charging": totals[CODES["CHARGING"]] / observed if observed else 0.0,
+        "outage_minutes": sum(totals[CODES[value]] for value in OUTAGE) / 60,
+    }
+
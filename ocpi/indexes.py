@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory secondary indexes used by the managers.
+"""
+
+from __future__ import annotations
+
+import itertools
+import math
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timezone
+from numbers import Number
+
+from flask_restx.inputs import datetime_from_iso8601
+
+import numpy as np
+
+
+def toTimestamp(value) -> float:
+    """
+    converts an OCPI DateTime (string or datetime) to a POSIX timestamp.
+    Naive values are treated as UTC, missing values as 0.
+    """
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            value = datetime_from_iso8601(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def toRange(begin, end) -> tuple:
+    """the timestamps of a range, a missing begin or end leaves it open"""
+    return (
+        None if begin is None else toTimestamp(begin),
+        None if end is None else toTimestamp(end),
+    )
+
+
+class SortedIndex:
+    """
+    Keeps keys sorted by a value (e.g. the last_updated timestamp).
+    Range lookups are binary searches on a sorted list of (value, key).
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._values = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def update(self, key, value):
+        old = self._values.get(key)
+        if old is not None:
+            if old == value:
+                return
+            del self._entries[bisect_left(self._entries, (old, key))]
+        insort(self._entries, (value, key))
+        self._values[key] = value
+
+    def remove(self, key):
+        old = self._values.pop(key, None)
+        if old is not None:
+            del self._entries[bisect_left(self._entries, (old, key))]
+
+    def _bounds(self, begin=None, end=None):
+        entries = self._entries
+        lo = 0 if begin is None else bisect_left(entries, (begin,))
+        hi = len(entries) if end is None else bisect_left(entries, (end,))
+        return lo, max(lo, hi)
+
+    def count(self, begin=None, end=None) -> int:
+        """number of keys with begin <= value < end"""
+        lo, hi = self._bounds(begin, end)
+        return hi - lo
+
+    def keys(self, begin=None, end=None, offset: int = 0, limit: int = None) -> list:
+        """keys with begin <= value < end ordered by value"""
+        lo, hi = self._bounds(begin, end)
+        lo += offset
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return [key for _, key in self._entries[lo:hi]]
+
+    def entriesAfter(self, after=None, begin=None, end=None, limit: int = None) -> list:
+        """
+        (value, key) entries with begin <= value < end following the entry after,
+        to walk through the index in batches while it is changed
+        """
+        lo, hi = self._bounds(begin, end)
+        if after is not None:
+            lo = max(lo, bisect_right(self._entries, after))
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return self._entries[lo:hi]
+
+
+class PostingIndex:
+    """
+    Maps each value to the set of keys having that value,
+    e.g. a status to the ids of all sessions with that status.
+    A key can have several values.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._values = {}
+
+    def __len__(self):
+        return len(self._postings)
+
+    def update(self, key, values=()):
+        values = frozenset(values)
+        old = self._values.get(key, frozenset())
+        for value in old - values:
+            postings = self._postings[value]
+            postings.discard(key)
+            if not postings:
+                del self._postings[value]
+        for value in values - old:
+            self._postings.setdefault(value, set()).add(key)
+        if values:
+            self._values[key] = values
+        else:
+            self._values.pop(key, None)
+
+    def remove(self, key):
+        self.update(key, ())
+
+    def get(self, value) -> frozenset:
+        return frozenset(self._postings.get(value, ()))
+
+    def values(self) -> list:
+        return list(self._postings)
+
+
+class BitmapIndex:
+    """
+    Like PostingIndex, but the keys are numbered and the keys having a
+    value are the set bits of a Python int, so filters over several
+    values are combined with & and | on whole bitmaps.
+    The values are (field, value) pairs, e.g. ("status", "AVAILABLE").
+    """
+
+    def __init__(self):
+        self._bitmaps = {}
+        self._values = {}
+        self._slots = {}
+        self._keys = []
+        self._free = []
+        # bitmap of all keys
+        self.all = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def update(self, key, values=()):
+        values = frozenset(values)
+        old = self._values.get(key, frozenset())
+        if values == old and key in self._slots:
+            return
+        slot = self._slots.get(key)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self._keys[slot] = key
+            else:
+                slot = len(self._keys)
+                self._keys.append(key)
+            self._slots[key] = slot
+            self.all |= 1 << slot
+        bit = 1 << slot
+        for value in old - values:
+            bitmap = self._bitmaps[value] & ~bit
+            if bitmap:
+                self._bitmaps[value] = bitmap
+            else:
+                del self._bitmaps[value]
+        for value in values - old:
+            self._bitmaps[value] = self._bitmaps.get(value, 0) | bit
+        self._values[key] = values
+
+    def remove(self, key):
+        if key not in self._slots:
+            return
+        self.update(key, ())
+        slot = self._slots.pop(key)
+        del self._values[key]
+        self.all &= ~(1 << slot)
+        self._keys[slot] = None
+        self._free.append(slot)
+
+    def get(self, field, value) -> int:
+        """bitmap of the keys with the value"""
+        return self._bitmaps.get((field, value), 0)
+
+    def anyOf(self, field, values) -> int:
+        """bitmap of the keys with one of the values"""
+        bitmap = 0
+        for value in values:
+            bitmap |= self.get(field, value)
+        return bitmap
+
+    def allOf(self, field, values) -> int:
+        """bitmap of the keys with all of the values"""
+        bitmap = self.all
+        for value in values:
+            bitmap &= self.get(field, value)
+        return bitmap
+
+    def atLeast(self, field, minimum) -> int:
+        """bitmap of the keys with a numeric value >= minimum"""
+        bitmap = 0
+        for (name, value), bits in list(self._bitmaps.items()):
+            if name == field and isinstance(value, Number) and value >= minimum:
+                bitmap |= bits
+        return bitmap
+
+    def keys(self, bitmap: int, limit: int = None) -> list:
+        """the keys of the set bits, in slot order"""
+        bits = bin(bitmap)[:1:-1]
+        keys = self._keys
+        found = []
+        i = bits.find("1")
+        while i >= 0 and (limit is None or len(found) < limit):
+            key = keys[i]
+            if key is not None:
+                found.append(key)
+            i = bits.find("1", i + 1)
+        return found
+
+
+EARTH_RADIUS = 6371008.8  # meters
+
+
+def geoPoint(location) -> tuple:
+    """(latitude, longitude) of a location as floats, None if missing or invalid"""
+    coordinates = location.get("coordinates") or {}
+    try:
+        latitude = float(coordinates["latitude"])
+        longitude = float(coordinates["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+class CounterIndex:
+    """
+    Counts the keys by value (e.g. the EVSEs by status) within groups
+    (e.g. per location, party and city). The counts are changed by the
+    transitions of single keys, so reading the counts of a group takes
+    the same time however many keys there are.
+    """
+
+    def __init__(self):
+        self._counts = {}
+
+    def add(self, groups, value, n: int = 1):
+        for group in groups:
+            counts = self._counts.setdefault(group, {})
+            count = counts.get(value, 0) + n
+            if count:
+                counts[value] = count
+            else:
+                del counts[value]
+                if not counts:
+                    del self._counts[group]
+
+    def move(self, groups, old, new):
+        """a key of the groups changed its value from old to new"""
+        if old != new:
+            self.add(groups, old, -1)
+            self.add(groups, new)
+
+    def get(self, group) -> dict:
+        """{value: count} of the group"""
+        return dict(self._counts.get(group, ()))
+
+
+def evseValues(evse) -> list:
+    """the (field, value) pairs of an EVSE and its connectors for a BitmapIndex"""
+    values = [("status", evse.get("status"))]
+    values.extend(("capability", capability) for capability in evse.get("capabilities") or [])
+    connectors = evse.get("connectors") or {}
+    if isinstance(connectors, dict):
+        connectors = connectors.values()
+    for connector in connectors:
+        for field in ("standard", "format", "power_type", "voltage", "amperage"):
+            values.append((field, connector.get(field)))
+    return values
+
+
+def _lonRanges(lon_min, lon_max) -> list:
+    """splits a longitude range crossing the antimeridian"""
+    if lon_max - lon_min >= 360:
+        return [(-180.0, 180.0)]
+    if lon_min < -180:
+        return [(lon_min + 360, 180.0), (-180.0, lon_max)]
+    if lon_max > 180:
+        return [(lon_min, 180.0), (-180.0, lon_max - 360)]
+    return [(lon_min, lon_max)]
+
+
+class GeoIndex:
+    """
+    Grid index of (latitude, longitude) points for radius and bounding box
+    queries. A cell of cell_size degrees holds the slots of the points in
+    it, the coordinates are kept in one array by slot. The candidates from
+    the cells of a query are filtered at once with numpy.
+    """
+
+    def __init__(self, cell_size: float = 0.1):
+        self.cell_size = cell_size
+        # cell -> frozenset of slots, replaced on change so readers need no lock
+        self._cells = {}
+        self._slots = {}
+        self._keys = []
+        self._free = []
+        # rows of (latitude, longitude), grown by swapping in a larger array
+        self._points = np.zeros((0, 2))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _cell(self, latitude, longitude):
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def _allocate(self, key) -> int:
+        if self._free:
+            slot = self._free.pop()
+            self._keys[slot] = key
+        else:
+            slot = len(self._keys)
+            self._keys.append(key)
+            if slot >= len(self._points):
+                points = np.zeros((max(1024, 2 * len(self._points)), 2))
+                points[: len(self._points)] = self._points
+                self._points = points
+        self._slots[key] = slot
+        return slot
+
+    def update(self, key, point):
+        """sets the (latitude, longitude) point of key, None removes the key"""
+        if point is None:
+            self.remove(key)
+            return
+        slot = self._slots.get(key)
+        old = None
+        if slot is not None:
+            latitude, longitude = self._points[slot]
+            if (latitude, longitude) == point:
+                return
+            old = self._cell(latitude, longitude)
+        else:
+            slot = self._allocate(key)
+        self._points[slot] = point
+        cell = self._cell(*point)
+        if cell != old:
+            self._cells[cell] = self._cells.get(cell, frozenset()) | {slot}
+            if old is not None:
+                self._discard(old, slot)
+
+    def _discard(self, cell, slot):
+        slots = self._cells[cell] - {slot}
+        if slots:
+            self._cells[cell] = slots
+        else:
+            del self._cells[cell]
+
+    def remove(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        self._discard(self._cell(*self._points[slot]), slot)
+        self._keys[slot] = None
+        self._free.append(slot)
+
+    def _cellCount(self, lat_min, lat_max, lon_min, lon_max) -> int:
+        i0, j0 = self._cell(lat_min, lon_min)
+        i1, j1 = self._cell(lat_max, lon_max)
+        return (i1 - i0 + 1) * (j1 - j0 + 1)
+
+    def _candidates(self, lat_min, lat_max, lon_min, lon_max) -> list:
+        """slots of the cells overlapping the box"""
+        i0, j0 = self._cell(lat_min, lon_min)
+        i1, j1 = self._cell(lat_max, lon_max)
+        cells = self._cells
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(cells):
+            # a large box, cheaper to go through the occupied cells
+            return [
+                slot
+                for (i, j), slots in list(cells.items())
+                if i0 <= i <= i1 and j0 <= j <= j1
+                for slot in slots
+            ]
+        return [
+            slot
+            for i in range(i0, i1 + 1)
+            for j in range(j0, j1 + 1)
+            for slot in cells.get((i, j), ())
+        ]
+
+    def _boxCandidates(self, lat_min, lat_max, lon_ranges):
+        """slots and coordinates of the points within the box"""
+        points = self._points
+        cells = sum(self._cellCount(lat_min, lat_max, lo, hi) for lo, hi in lon_ranges)
+        if cells > len(self._cells) // 4:
+            # most of the points are in the box, faster to check them all at once
+            slots = np.arange(min(len(self._keys), len(points)), dtype=np.intp)
+        else:
+            slots = []
+            for lon_min, lon_max in lon_ranges:
+                slots.extend(self._candidates(lat_min, lat_max, lon_min, lon_max))
+        slots = np.asarray(slots, dtype=np.intp)
+        latitudes, longitudes = points[slots, 0], points[slots, 1]
+        inside = (latitudes >= lat_min) & (latitudes <= lat_max)
+        inside &= np.logical_or.reduce(
+            [(longitudes >= lo) & (longitudes <= hi) for lo, hi in lon_ranges]
+        )
+        return slots[inside], latitudes[inside], longitudes[inside]
+
+    def _keysOf(self, slots, limit=None) -> list:
+        keys = self._keys
+        found = (key for key in map(keys.__getitem__, slots.tolist()) if key is not None)
+        return list(found if limit is None else itertools.islice(found, limit))
+
+    def box(self, lat_min, lon_min, lat_max, lon_max, limit: int = None) -> list:
+        """
+        keys of the points within the bounding box,
+        lon_min > lon_max for a box crossing the antimeridian
+        """
+        if lon_min > lon_max:
+            lon_max += 360
+        slots, _, _ = self._boxCandidates(lat_min, lat_max, _lonRanges(lon_min, lon_max))
+        return self._keysOf(slots, limit)
+
+    def radius(self, latitude, longitude, meters, limit: int = None) -> list:
+        """(distance in meters, key) of the points within meters, nearest first"""
+        dlat = math.degrees(meters / EARTH_RADIUS)
+        lat_min, lat_max = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+        cos = math.cos(math.radians(max(abs(lat_min), abs(lat_max))))
+        if lat_min == -90 or lat_max == 90 or meters >= EARTH_RADIUS * cos * math.pi:
+            lon_ranges = [(-180.0, 180.0)]
+        else:
+            dlon = math.degrees(meters / (EARTH_RADIUS * cos))
+            lon_ranges = _lonRanges(longitude - dlon, longitude + dlon)
+        slots, latitudes, longitudes = self._boxCandidates(lat_min, lat_max, lon_ranges)
+        distances = _haversine(latitude, longitude, latitudes, longitudes)
+        within = distances <= meters
+        slots, distances = slots[within], distances[within]
+        order = np.argsort(distances, kind="stable")
+        results = zip(distances[order].tolist(), slots[order].tolist())
+        keys = self._keys
+        found = [(distance, keys[slot]) for distance, slot in results if keys[slot] is not None]
+        return found if limit is None else found[:limit]
+
+
+def _haversine(latitude, longitude, latitudes, longitudes):
+    """great circle distances in meters from a point to arrays of latitudes/longitudes"""
+    phi = math.radians(latitude)
+    phis = np.radians(latitudes)
+    a = np.sin((phis - phi) / 2) ** 2 + math.cos(phi) * np.cos(phis) * np.sin(
+        np.radians(longitudes - longitude) / 2
+    ) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
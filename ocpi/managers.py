@@ -12,12 +12,35 @@ import json
 import logging
 import os
 import secrets
+import threading
+import time
+from datetime import datetime, timezone
 from multiprocessing import RLock
 import copy
 
 import requests
 
 import ocpi.models.credentials as mc
+from ocpi.cache import ResponseCache
+from ocpi.client import CircuitOpenError, OcpiClient
+from ocpi.exceptions import InvalidMissingParamsError
+from ocpi.feed import ChangeFeed, locationEvents, sessionEvents
+from ocpi.history import StatusHistory, summarize
+from ocpi.indexes import (
+    BitmapIndex,
+    CounterIndex,
+    GeoIndex,
+    PostingIndex,
+    SortedIndex,
+    evseValues,
+    geoPoint,
+    toRange,
+    toTimestamp,
+)
+from ocpi.outbound import NORMAL, FanOut, classify, coalesce
+from ocpi.periods import ChargingPeriods
+from ocpi.storage import MemoryStore, localConnection
+from ocpi.views import EvseView, LocationView
 
 
 def createOcpiHeader(token,encode:bool=False):
@@ -33,6 +56,16 @@ log = logging.getLogger("ocpi")
 
 
 class CredentialsManager:
+    # pushes to the partners: threads in total, concurrent requests per
+    # partner and (connect, read) timeout of a request in seconds
+    push_workers = 16
+    push_per_partner = 4
+    push_timeout = (3.05, 10.0)
+    # an ocpi.spool.Spool, pushes are then sent by the spool worker process
+    spool = None
+    _fanout_lock = threading.Lock()
+    _client_lock = threading.Lock()
+
     def __init__(self, credentials_roles: mc.CredentialsRole, url, **kwds):
         self.credentials_roles = credentials_roles
         self.url = url
@@ -42,7 +75,7 @@ class CredentialsManager:
         endpoints = []
         header = createOcpiHeader(access_client)
         try:
-            response = requests.get(f"{client_url}/{client_version}",headers=header)
+            response = self.client.get(f"{client_url}/{client_version}",headers=header)
             endpoints = response.json()["data"]["endpoints"]
         except requests.exceptions.ConnectionError:
             log.error(f"no version details, connection to {client_url} failed")
@@ -62,9 +95,9 @@ class CredentialsManager:
             }
         header = createOcpiHeader(access_client)
         log.info(f"sending post request {data}")
-        resp = requests.post(f"{url}/{version}/credentials", json=data, headers=header)
+        resp = self.client.post(f"{url}/{version}/credentials", json=data, headers=header)
         if resp.status_code == 405:
-            resp = requests.put(
+            resp = self.client.put(
                 f"{url}/{version}/credentials", json=data, headers=header
             )
         resp.raise_for_status()
@@ -77,35 +110,85 @@ class CredentialsManager:
         # TODO check roles and business details
         # data['data']['roles']
 
-    def _pushObjects(self, objects, method, token, endpoint_url, with_path=True):
+    def _pushObject(self, obj, method, token, endpoint_url, with_path=True):
+        """sends a single object, returns {"url", "method", "status", "error"}"""
         headers = createOcpiHeader(token)
-        for r in objects:
-            try:
-                if with_path:
-                    url = (
-                        f"{endpoint_url}/{r['country_code']}/{r['party_id']}/{r['id']}"
-                    )
-                else:
-                    url = endpoint_url
-
-                if method == "PUT":
-                    res = requests.put(url, headers=headers, json=r)
-                elif method == "PATCH":
-                    res = requests.patch(url, headers=headers, json=r)
-                elif method == "POST":
-                    res = requests.post(url, headers=headers, json=r)
-                else:
-                    raise Exception("invalid method provided: {method}")
+        url = endpoint_url
+        status = None
+        error = None
+        try:
+            url = self._pushUrl(obj, endpoint_url, with_path)
+            if method not in ("PUT", "PATCH", "POST"):
+                raise Exception(f"invalid method provided: {method}")
+            res = self.client.request(
+                method, url, headers=headers, json=obj, timeout=self.push_timeout
+            )
 
-                res.raise_for_status()
-            except requests.exceptions.HTTPError as e:
-                log.warning(
-                    f"ocpi {method} object {e.response.status_code} - {e.response.text} - {url}"
-                )
-            except requests.exceptions.ConnectionError:
-                log.warning(f"could not connect to {url}")
-            except Exception:
-                log.exception(f"error sending to {url}")
+            status = res.status_code
+            res.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            log.warning(
+                f"ocpi {method} object {e.response.status_code} - {e.response.text} - {url}"
+            )
+            error = f"HTTP {e.response.status_code}"
+        except CircuitOpenError:
+            log.debug(f"not sending to {url}, circuit is open")
+            error = "circuit open"
+        except requests.exceptions.Timeout:
+            log.warning(f"timeout sending to {url}")
+            error = "timeout"
+        except requests.exceptions.ConnectionError:
+            log.warning(f"could not connect to {url}")
+            error = "connection failed"
+        except Exception as e:
+            log.exception(f"error sending to {url}")
+            error = str(e)
+        return {"url": url, "method": method, "status": status, "error": error}
+
+    @staticmethod
+    def _pushUrl(obj, endpoint_url, with_path=True):
+        if with_path:
+            return f"{endpoint_url}/{obj['country_code']}/{obj['party_id']}/{obj['id']}"
+        return endpoint_url
+
+    def _pushObjects(self, objects, method, token, endpoint_url, with_path=True):
+        """sends the objects concurrently, returns the results in order"""
+        return self._sendJobs(
+            {endpoint_url: self._pushJobs(objects, method, token, endpoint_url, with_path)}
+        )[endpoint_url]
+
+    def _pushJobs(self, objects, method, token, endpoint_url, with_path=True):
+        return [
+            lambda obj=obj: self._pushObject(obj, method, token, endpoint_url, with_path)
+            for obj in objects
+        ]
+
+    @staticmethod
+    def _coalesceObjects(objects, method, with_path=True):
+        if not with_path or len(objects) < 2:
+            # without the path the objects share the url of the module
+            return objects
+        entries = coalesce(
+            [{"method": method, "body": obj} for obj in objects],
+            lambda e: (e["body"]["country_code"], e["body"]["party_id"], e["body"]["id"]),
+        )
+        return [e["body"] for e in entries]
+
+    @property
+    def client(self) -> OcpiClient:
+        """pooled HTTP client for all requests to the partners"""
+        with CredentialsManager._client_lock:
+            client = self.__dict__.get("_client")
+            if client is None:
+                client = self._client = OcpiClient(pool_maxsize=self.push_per_partner)
+        return client
+
+    def _sendJobs(self, jobs, priority=NORMAL):
+        with CredentialsManager._fanout_lock:
+            fanout = self.__dict__.get("_fanout")
+            if fanout is None:
+                fanout = self._fanout = FanOut(self.push_workers, self.push_per_partner)
+        return fanout.run(jobs, priority)
 
     def makeRegistration(self, payload: mc.Credentials, tokenA: str):
         # tokenA used to get here for initial handshake
@@ -136,9 +219,64 @@ class CredentialsManager:
     def isAuthenticated(self, token):
         raise NotImplementedError()
 
-    def sendToModule(self, objects, module, method="PUT", with_path=True):
+    def getTokens(self) -> dict:
+        """
+        returns all registered tokens as
+        {token: {"client_url", "client_token", "endpoints"}}
+        """
         raise NotImplementedError()
 
+    def sendToModule(self, objects, module, method="PUT", with_path=True, priority=None):
+        """
+        sends the objects to the module of every registered partner,
+        all partners and objects concurrently.
+        Returns {"sent": n, "failed": n, "results": {client_url: [result]}}.
+        With a spool the requests are only spooled, then {"spooled": n} is returned.
+        Several PUTs or PATCHes of the same object are sent as one request.
+        The priority (outbound.HIGH, NORMAL or LOW) defaults to that of the
+        module and method, see outbound.classify.
+        """
+        if priority is None:
+            priority = classify(module, method)
+        objects = self._coalesceObjects(list(objects), method, with_path)
+        jobs = {}
+        spooled = []
+        for token in self.getTokens().values():
+            actual_module = list(
+                filter(lambda t: t["identifier"] == module, token["endpoints"] or [])
+            )
+            if not actual_module:
+                continue
+            endpoint_url = actual_module[0]["url"]
+            if self.spool is not None:
+                spooled.extend(
+                    self.spool.request(
+                        method,
+                        self._pushUrl(obj, endpoint_url, with_path),
+                        token["client_token"],
+                        obj,
+                        merge=with_path,
+                        priority=priority,
+                    )
+                    for obj in objects
+                )
+            else:
+                jobs[token["client_url"]] = self._pushJobs(
+                    objects, method, token["client_token"], endpoint_url, with_path
+                )
+        if self.spool is not None:
+            self.spool.append(spooled)
+            return {"spooled": len(spooled)}
+        results = self._sendJobs(jobs, priority)
+        failed = sum(
+            1 for rs in results.values() for r in rs
+            if not isinstance(r, dict) or r["error"] is not None
+        )
+        sent = sum(len(rs) for rs in results.values()) - failed
+        if failed:
+            log.warning(f"{module} {method}: {sent} objects sent, {failed} failed")
+        return {"sent": sent, "failed": failed, "results": results}
+
     def _updateToken(self, token, client_url, client_token, endpoint_list=None):
         raise NotImplementedError()
 
@@ -158,9 +296,21 @@ class CredentialsDictMan(CredentialsManager):
     lock = RLock()
 
     def __init__(
-        self, credentials_roles: mc.CredentialsRole, url, filename="ocpi_creds.json"
+        self,
+        credentials_roles: mc.CredentialsRole,
+        url,
+        filename="ocpi_creds.json",
+        negative_ttl: float = 5.0,
+        negative_max: int = 4096,
     ):
         self.filename = filename
+        # in-process token index, only rebuilt if the file changes on disk
+        self._tokens = {}
+        self._stamp = None
+        # unknown tokens are remembered for negative_ttl seconds
+        self.negative_ttl = negative_ttl
+        self.negative_max = negative_max
+        self._negative = {}
         with CredentialsDictMan.lock:
             if not os.path.isfile(filename):
                 self.writeJson({})
@@ -172,22 +322,54 @@ class CredentialsDictMan(CredentialsManager):
                 return json.load(f)
 
     def writeJson(self, endpoints):
+        # write to a temporary file and swap it in, so other processes never
+        # read a half written file and always see a new inode
+        tmp = f"{self.filename}.{os.getpid()}.tmp"
         with CredentialsDictMan.lock:
-            with open(self.filename, "w") as f:
+            with open(tmp, "w") as f:
                 json.dump(endpoints, f, indent=4, sort_keys=False)
+            os.replace(tmp, self.filename)
+
+    def _fileStamp(self):
+        st = os.stat(self.filename)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _loadTokens(self):
+        """
+        returns the cached token index.
+        The file is only parsed again if its inode, mtime or size changed,
+        e.g. because another worker process registered a token.
+        """
+        if self._fileStamp() != self._stamp:
+            with CredentialsDictMan.lock:
+                # take the stamp before reading, so a concurrent write
+                # is detected again on the next call
+                stamp = self._fileStamp()
+                if stamp != self._stamp:
+                    self._tokens = self.readJson()
+                    self._stamp = stamp
+                    self._negative = {}
+        return self._tokens
+
+    def _setTokens(self, tokens):
+        self.writeJson(tokens)
+        self._tokens = tokens
+        self._stamp = self._fileStamp()
+        self._negative = {}
 
     def isAuthenticated(self, token):
-        return token in self.readJson()
+        expiry = self._negative.get(token)
+        if expiry is not None and expiry > time.monotonic():
+            return False
+        if token in self._loadTokens():
+            return True
+        if len(self._negative) >= self.negative_max:
+            self._negative = {}
+        self._negative[token] = time.monotonic() + self.negative_ttl
+        return False
 
-    def sendToModule(self, objects, module, method="PUT", with_path=True):
-        for token in self.readJson().values():
-            actual_module = list(
-                filter(lambda t: t["identifier"] == module, token["endpoints"])
-            )
-            if actual_module:
-                self._pushObjects(
-                    objects, method, token["client_token"], actual_module[0]["url"]
-                )
+    def getTokens(self):
+        return self._loadTokens()
 
     def _updateToken(self, token, client_url, client_token, endpoint_list=None):
         data = {
@@ -198,82 +380,523 @@ class CredentialsDictMan(CredentialsManager):
         with CredentialsDictMan.lock:
             tokens = self.readJson()
             tokens[token] = data
-            self.writeJson(tokens)
+            self._setTokens(tokens)
         log.debug(f"current tokens: {tokens}")
 
     def _deleteToken(self, token):
         with CredentialsDictMan.lock:
             tokens = self.readJson()
             tokens.pop(token, None)
-            self.writeJson(tokens)
+            self._setTokens(tokens)
+
+
+class CredentialsSqliteMan(CredentialsManager):
+    """
+    Keeps the tokens in an indexed SQLite table in WAL mode.
+    SQLite locks the database file itself, so this is safe to use from
+    multiple gunicorn worker processes: token lookups are a primary key
+    search and updates only touch a single row.
+    """
+
+    def __init__(
+        self,
+        credentials_roles: mc.CredentialsRole,
+        url,
+        filename="ocpi_creds.db",
+        timeout: float = 30.0,
+    ):
+        self.filename = filename
+        self.timeout = timeout
+        self._local = threading.local()
+        con = self._connection()
+        with con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                "token TEXT PRIMARY KEY, "
+                "client_url TEXT, "
+                "client_token TEXT, "
+                "endpoints TEXT NOT NULL DEFAULT '[]')"
+            )
+            con.execute(
+                "CREATE INDEX IF NOT EXISTS tokens_client_url ON tokens (client_url)"
+            )
+        super().__init__(credentials_roles, url)
+
+    def _connection(self):
+        return localConnection(self._local, self.filename, self.timeout)
+
+    def isAuthenticated(self, token):
+        row = (
+            self._connection()
+            .execute("SELECT 1 FROM tokens WHERE token = ?", (token,))
+            .fetchone()
+        )
+        return row is not None
+
+    def getTokens(self):
+        rows = self._connection().execute(
+            "SELECT token, client_url, client_token, endpoints FROM tokens"
+        )
+        return {
+            token: {
+                "client_url": client_url,
+                "client_token": client_token,
+                "endpoints": json.loads(endpoints),
+            }
+            for token, client_url, client_token, endpoints in rows
+        }
+
+    def _updateToken(self, token, client_url, client_token, endpoint_list=None):
+        con = self._connection()
+        with con:
+            con.execute(
+                "INSERT INTO tokens (token, client_url, client_token, endpoints) "
+                "VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (token) DO UPDATE SET "
+                "client_url = excluded.client_url, "
+                "client_token = excluded.client_token, "
+                "endpoints = excluded.endpoints",
+                (token, client_url, client_token, json.dumps(endpoint_list or [])),
+            )
+        log.debug(f"updated token for {client_url}")
+
+    def _deleteToken(self, token):
+        con = self._connection()
+        with con:
+            con.execute("DELETE FROM tokens WHERE token = ?", (token,))
+
+
+def setParty(document, country_id, party_id):
+    """keeps the party owning a document on it, e.g. to filter the change feeds"""
+    if country_id is not None:
+        document["country_code"] = country_id
+    if party_id is not None:
+        document["party_id"] = party_id
 
 
 class LocationManager(object):
-    def __init__(self):
-        self.locations = {}
-    
-    def populateEvses(self, location_id, evses):
-        self.locations[location_id]["evses"]={}
-        for evse in evses:
-            self.locations[location_id]["evses"][evse["uid"]]=evse
-            self.populateConnectors(location_id, evse["uid"],evse["connectors"].copy())
-
-    def translateEvses(self, location):
-        for evse_id,evse in location["evses"].items():
-            location["evses"][evse_id]=self.translateConnectors(evse)
-        location["evses"]=list(location["evses"].values())
-        return location
-
-    def populateConnectors(self, location_id, evse_id, connectors):
-        self.locations[location_id]["evses"][evse_id]["connectors"]={}
-        for connector in connectors:
-            self.locations[location_id]["evses"][evse_id]["connectors"][connector["id"]]=connector
-    
-    def translateConnectors(self, evse):
-        evse["connectors"]=list(evse["connectors"].values())
+    def __init__(self, store: MemoryStore = None):
+        self.store = store or MemoryStore()
+        self._seq, documents = self.store.load()
+        self.locations = dict(documents)
+        # location ids sorted by last_updated
+        self._updated = SortedIndex()
+        # location ids by coordinates
+        self._geo = GeoIndex()
+        # (location id, uid) of the EVSEs by status, capabilities and connectors
+        self._evses = BitmapIndex()
+        # the EVSEs as last indexed, unchanged EVSEs are the same objects
+        self._indexed = {}
+        # EVSEs by status per location, party, city and overall
+        self._statusCounts = CounterIndex()
+        # the groups the EVSEs of a location are counted in
+        self._counted = {}
+        # status transitions of the EVSEs seen by this process
+        self.history = StatusHistory()
+        for location_id in self.locations:
+            self._index(location_id)
+        # marshalled GET responses, filled by the locations namespace
+        self.responses = ResponseCache()
+        self.feed = ChangeFeed(self._seq)
+
+    def _index(self, location_id):
+        location = self.locations[location_id]
+        self._updated.update(location_id, toTimestamp(location.get("last_updated")))
+        self._geo.update(location_id, geoPoint(location))
+        evses = location.get("evses") or {}
+        indexed = self._indexed.setdefault(location_id, {})
+        counts = self._statusCounts
+        groups = self._statusGroups(location_id, location)
+        counted = self._counted.get(location_id, groups)
+        if counted != groups:
+            # the party or city changed, move all EVSEs of the location over
+            for evse in indexed.values():
+                counts.add(counted, evse.get("status"), -1)
+                counts.add(groups, evse.get("status"))
+        self._counted[location_id] = groups
+        for uid, evse in evses.items():
+            old = indexed.get(uid)
+            if old is not evse:
+                self._evses.update((location_id, uid), evseValues(evse))
+                if old is None:
+                    counts.add(groups, evse.get("status"))
+                else:
+                    counts.move(groups, old.get("status"), evse.get("status"))
+                if old is None or old.get("status") != evse.get("status"):
+                    self.history.record(
+                        (location_id, uid),
+                        toTimestamp(evse.get("last_updated")) or time.time(),
+                        evse.get("status"),
+                    )
+                indexed[uid] = evse
+        for uid in [uid for uid in indexed if uid not in evses]:
+            self._evses.remove((location_id, uid))
+            counts.add(groups, indexed.pop(uid).get("status"), -1)
+
+    @staticmethod
+    def _statusGroups(location_id, location):
+        return (
+            ("location", location_id),
+            ("party", location.get("country_code"), location.get("party_id")),
+            ("city", location.get("city")),
+            ("all",),
+        )
+
+    def getStatusCounts(self, location_id=None, country_code=None, party_id=None, city=None):
+        """
+        returns {status: number of EVSEs} of a location, a party (country_code
+        and party_id), a city or of all locations, whichever is given first.
+        EVSEs without a status are not counted.
+        """
+        if (country_code is None) != (party_id is None):
+            raise InvalidMissingParamsError("country_code and party_id go together")
+        self._refresh()
+        if location_id is not None:
+            group = ("location", location_id)
+        elif country_code is not None:
+            group = ("party", country_code, party_id)
+        elif city is not None:
+            group = ("city", city)
+        else:
+            group = ("all",)
+        counts = self._statusCounts.get(group)
+        counts.pop(None, None)
+        return counts
+
+    def refresh(self):
+        """picks up the locations which other worker processes wrote"""
+        self._refresh()
+
+    def _refresh(self):
+        """apply locations which other worker processes wrote to the store"""
+        changes = self.store.changes(self._seq)
+        if changes:
+            with self.store.lock:
+                for seq, location_id, location in changes:
+                    if seq > self._seq:
+                        old = self.locations.get(location_id)
+                        self.locations[location_id] = location
+                        self._index(location_id)
+                        self.responses.invalidate(location_id)
+                        self.feed.publish(seq, locationEvents(location_id, old, location))
+                        self._seq = seq
+
+    def _commit(self, location_id, evse_id=None, connector_id=None, old=None):
+        """
+        write the location to the store, must be called within a transaction.
+        evse_id and connector_id narrow down what was changed,
+        old is the previous version of the location for the change feed.
+        """
+        self._index(location_id)
+        location = self.locations[location_id]
+        seq = self.store.put(location_id, location)
+        self._seq = max(self._seq, seq)
+        self.responses.invalidate(location_id, evse_id, connector_id)
+        self.feed.publish(seq, locationEvents(location_id, old, location))
+
+    def _propagateLastUpdated(self, last_updated, *parents):
+        """
+        a Location (and EVSE) is updated whenever one of its children is updated,
+        so take over a newer last_updated of a child
+        """
+        if last_updated is None:
+            return
+        updated = toTimestamp(last_updated)
+        for parent in parents:
+            if updated > toTimestamp(parent.get("last_updated")):
+                parent["last_updated"] = last_updated
+
+    # The stored locations are never changed in place: writers build new
+    # dicts for everything on the path they change and swap them in.
+    # Readers get views on the stored dicts, so reads need neither copies
+    # nor locks and can run in parallel with writes.
+
+    def populateEvses(self, evses):
+        """returns the EVSEs (and their connectors) as dicts by uid/id"""
+        return {evse["uid"]: self.populateConnectors(evse) for evse in evses}
+
+    def populateConnectors(self, evse):
+        """returns a copy of the EVSE with its connectors as dict by id"""
+        evse = dict(evse)
+        connectors = evse.get("connectors") or []
+        if not isinstance(connectors, dict):
+            connectors = {connector["id"]: connector for connector in connectors}
+        evse["connectors"] = connectors
         return evse
 
+    # PATCHes are deep merged: the EVSEs and connectors of a PATCH are merged
+    # into the existing ones by uid/id, all other children are kept as they are.
+
+    def _mergeConnectors(self, connectors, patches):
+        """returns new connectors by id with the connector PATCHes merged"""
+        connectors = dict(connectors)
+        for patch in patches:
+            connector_id = patch.get("id")
+            if connector_id is None:
+                raise InvalidMissingParamsError("id of a patched connector")
+            connectors[connector_id] = {**connectors.get(connector_id, {}), **patch}
+        return connectors
+
+    def _mergeEVSE(self, evse, patch):
+        """returns a new EVSE with the PATCH merged"""
+        merged = {**evse, **patch}
+        if "connectors" in patch:
+            patches = patch["connectors"] or []
+            merged["connectors"] = self._mergeConnectors(evse.get("connectors") or {}, patches)
+            for connector in patches:
+                self._propagateLastUpdated(connector.get("last_updated"), merged)
+        return merged
+
+    def _mergeEVSEs(self, evses, patches):
+        """returns new EVSEs by uid with the EVSE PATCHes merged"""
+        evses = dict(evses)
+        for patch in patches:
+            uid = patch.get("uid")
+            if uid is None:
+                raise InvalidMissingParamsError("uid of a patched EVSE")
+            old = evses.get(uid)
+            evses[uid] = self.populateConnectors(patch) if old is None else self._mergeEVSE(old, patch)
+        return evses
+
     def getLocations(self, begin, end, offset, limit):
+        """
+        returns the locations with begin <= last_updated < end,
+        ordered by last_updated
+        """
         log.info(f"getting locations")
-        return list(self.locations.values())[offset : offset + limit], {}
+        self._refresh()
+        begin, end = toRange(begin, end)
+        location_ids = self._updated.keys(begin, end, offset, limit)
+        headers = {
+            "X-Total-Count": self._updated.count(begin, end),
+            "X-Limit": limit,
+        }
+        locations = self.locations
+        return [LocationView(locations[location_id]) for location_id in location_ids], headers
+
+    def iterLocations(self, begin, end, batch=500):
+        """
+        yields all locations with begin <= last_updated < end,
+        ordered by last_updated. The index is read in batches,
+        so a location updated meanwhile can be yielded again.
+        """
+        log.info(f"iterating locations")
+        begin, end = toRange(begin, end)
+        after = None
+        while True:
+            self._refresh()
+            entries = self._updated.entriesAfter(after, begin, end, batch)
+            if not entries:
+                return
+            for _, location_id in entries:
+                location = self.locations.get(location_id)
+                if location is not None:
+                    yield LocationView(location)
+            after = entries[-1]
+
+    def findLocationsNear(self, latitude, longitude, radius, limit=None):
+        """returns [(distance, location)] within radius meters, nearest first"""
+        self._refresh()
+        locations = self.locations
+        return [
+            (distance, LocationView(locations[location_id]))
+            for distance, location_id in self._geo.radius(latitude, longitude, radius, limit)
+        ]
+
+    def findLocationsInBox(self, lat_min, lon_min, lat_max, lon_max, limit=None):
+        """returns the locations within the bounding box"""
+        self._refresh()
+        locations = self.locations
+        return [
+            LocationView(locations[location_id])
+            for location_id in self._geo.box(lat_min, lon_min, lat_max, lon_max, limit)
+        ]
+
+    def findEvses(
+        self,
+        status=(),
+        capabilities=(),
+        standard=(),
+        format=(),
+        power_type=(),
+        min_voltage=None,
+        min_amperage=None,
+        limit=None,
+    ):
+        """
+        returns [(location_id, EVSE)] of the EVSEs matching all given criteria.
+        An EVSE needs one of the given statuses, standards, formats and power
+        types, but all of the capabilities. The connector criteria are
+        checked against all connectors of the EVSE together.
+        """
+        self._refresh()
+        index = self._evses
+        bitmap = index.all
+        for field, values in (
+            ("status", status),
+            ("standard", standard),
+            ("format", format),
+            ("power_type", power_type),
+        ):
+            if values:
+                bitmap &= index.anyOf(field, values)
+        if capabilities:
+            bitmap &= index.allOf("capability", capabilities)
+        if min_voltage is not None:
+            bitmap &= index.atLeast("voltage", min_voltage)
+        if min_amperage is not None:
+            bitmap &= index.atLeast("amperage", min_amperage)
+        locations = self.locations
+        found = []
+        for location_id, uid in index.keys(bitmap, limit):
+            evse = locations.get(location_id, {}).get("evses", {}).get(uid)
+            if evse is not None:
+                found.append((location_id, EvseView(evse)))
+        return found
+
+    def _historyKeys(self, location_id=None, evse_uid=None):
+        if location_id is None:
+            return self.history.keys()
+        if evse_uid is not None:
+            return [(location_id, evse_uid)]
+        return [(location_id, uid) for uid in self._indexed.get(location_id, ())]
+
+    def getUtilization(self, begin, end, location_id=None, evse_uid=None):
+        """
+        time per status, share of time charging and outage minutes of the
+        EVSEs (all, of a location or a single one) between begin and end
+        """
+        self._refresh()
+        begin, end = int(toTimestamp(begin)), int(toTimestamp(end))
+        keys = self._historyKeys(location_id, evse_uid)
+        seconds = self.history.utilization(keys, begin, end)
+        result = {"evses": len(keys), **summarize(seconds)}
+        if location_id is not None:
+            result["by_evse"] = {
+                uid: summarize([evse_seconds]) for (_, uid), evse_seconds in zip(keys, seconds)
+            }
+        return result
+
+    def getHeatmap(self, begin, end, status="CHARGING", location_id=None, evse_uid=None):
+        """share of time in status by weekday and hour (UTC) of the EVSEs"""
+        self._refresh()
+        begin, end = int(toTimestamp(begin)), int(toTimestamp(end))
+        return self.history.heatmap(self._historyKeys(location_id, evse_uid), begin, end, status)
 
     def getLocation(self, country_id, party_id, location_id):
         log.info(f"getting location {location_id}")
-        return self.translateEvses(self.locations[location_id].copy())
+        self._refresh()
+        return LocationView(self.locations[location_id])
 
     def putLocation(self, country_id, party_id, location_id, location):
         log.info(f"putting location: {location}")
-        self.locations[location_id] = location
-        self.populateEvses(location_id, location["evses"].copy())
+        location = dict(location)
+        location["evses"] = self.populateEvses(location.get("evses") or [])
+        setParty(location, country_id, party_id)
+        with self.store.transaction():
+            self._refresh()
+            old = self.locations.get(location_id)
+            self.locations[location_id] = location
+            self._commit(location_id, old=old)
         
+    def putLocations(self, country_id, party_id, locations):
+        """
+        adds/replaces many locations at once, e.g. on the initial sync of a CPO.
+        The store is written in a single transaction, the last of several
+        locations with the same id wins. Returns the number of locations.
+        """
+        populated = {}
+        for location in locations:
+            location = dict(location)
+            location["evses"] = self.populateEvses(location.get("evses") or [])
+            setParty(location, country_id, party_id)
+            populated[location["id"]] = location
+        log.info(f"putting {len(populated)} locations")
+        with self.store.transaction():
+            self._refresh()
+            old = {location_id: self.locations.get(location_id) for location_id in populated}
+            self.locations.update(populated)
+            for location_id in populated:
+                self._index(location_id)
+            last = self.store.putMany(populated.items())
+            self._seq = max(self._seq, last)
+            # the locations got consecutive sequence numbers
+            for seq, (location_id, location) in enumerate(populated.items(), last - len(populated) + 1):
+                self.responses.invalidate(location_id)
+                self.feed.publish(seq, locationEvents(location_id, old[location_id], location))
+        return len(populated)
+
     def patchLocation(self, country_id, party_id, location_id, location):
         log.info(f"patching location: {location}")
-        self.locations[location_id].update(location)
+        with self.store.transaction():
+            self._refresh()
+            old = self.locations[location_id]
+            merged = {**old, **location}
+            if "evses" in location:
+                patches = location["evses"] or []
+                merged["evses"] = self._mergeEVSEs(old.get("evses") or {}, patches)
+                for patch in patches:
+                    self._propagateLastUpdated(merged["evses"][patch["uid"]].get("last_updated"), merged)
+            self.locations[location_id] = merged
+            self._commit(location_id, old=old)
 
     def getEVSE(self, country_id, party_id, location_id, evse_id):
         log.info(f"getting evse {location_id}/{evse_id}")
-        return self.translateConnectors(self.locations[location_id]["evses"][evse_id].copy())
+        self._refresh()
+        return EvseView(self.locations[location_id]["evses"][evse_id])
+
+    def _replaceEVSE(self, location_id, evse_id, evse):
+        """swaps in a new version of the location with the given EVSE"""
+        location = dict(self.locations[location_id])
+        location["evses"] = {**location["evses"], evse_id: evse}
+        self._propagateLastUpdated(evse.get("last_updated"), location)
+        self.locations[location_id] = location
 
     def putEVSE(self, country_id, party_id, location_id, evse_id, evse):
         log.info(f"putting evse {location_id}/{evse_id}: {evse}")
-        self.locations[location_id]["evses"][evse_id] = evse
-        self.populateConnectors(location_id, evse_id, evse["connectors"].copy())
+        evse = self.populateConnectors(evse)
+        with self.store.transaction():
+            self._refresh()
+            old = self.locations[location_id]
+            self._replaceEVSE(location_id, evse_id, evse)
+            self._commit(location_id, evse_id, old=old)
 
     def patchEVSE(self, country_id, party_id, location_id, evse_id, evse):
         log.info(f"patching evse {location_id}/{evse_id}: {evse}")
-        self.locations[location_id]["evses"][evse_id].update(evse)
+        with self.store.transaction():
+            self._refresh()
+            old = self.locations[location_id]
+            self._replaceEVSE(location_id, evse_id, self._mergeEVSE(old["evses"][evse_id], evse))
+            self._commit(location_id, evse_id, old=old)
 
     def getConnector(self, country_id, party_id, location_id, evse_id, connector_id):
         log.info(f"getting connector {location_id}/{evse_id}/{connector_id}")
+        self._refresh()
         return self.locations[location_id]["evses"][evse_id]["connectors"][connector_id]
 
+    def _replaceConnector(self, location_id, evse_id, connector_id, connector):
+        """swaps in a new version of the location with the given connector"""
+        evse = dict(self.locations[location_id]["evses"][evse_id])
+        evse["connectors"] = {**evse["connectors"], connector_id: connector}
+        self._propagateLastUpdated(connector.get("last_updated"), evse)
+        self._replaceEVSE(location_id, evse_id, evse)
+
     def putConnector(self, country_id, party_id, location_id, evse_id, connector_id, connector):
         log.info(f"putting connector {location_id}/{evse_id}/{connector_id}: {connector}")
-        self.locations[location_id]["evses"][evse_id]["connectors"][connector_id] = connector
+        with self.store.transaction():
+            self._refresh()
+            old = self.locations[location_id]
+            self._replaceConnector(location_id, evse_id, connector_id, connector)
+            self._commit(location_id, evse_id, connector_id, old=old)
 
     def patchConnector(self, country_id, party_id, location_id, evse_id, connector_id, connector):
         log.info(f"patching connector {location_id}/{evse_id}/{connector_id}: {connector}")
-        self.locations[location_id]["evses"][evse_id]["connectors"][connector_id].update(connector)
+        with self.store.transaction():
+            self._refresh()
+            old = self.locations[location_id]
+            connectors = old["evses"][evse_id]["connectors"]
+            self._replaceConnector(location_id, evse_id, connector_id, {**connectors[connector_id], **connector})
+            self._commit(location_id, evse_id, connector_id, old=old)
 
 
 class VersionManager:
@@ -308,23 +931,166 @@ class VersionManager:
     
     
 class SessionManager:
-    def __init__(self):
-        self.sessions = {}
+    def __init__(self, store: MemoryStore = None):
+        self.store = store or MemoryStore()
+        self._seq, documents = self.store.load()
+        self.sessions = dict(documents)
+        # secondary indexes, maintained on every commit
+        self._updated = SortedIndex()
+        self._status = PostingIndex()
+        self._auth_id = PostingIndex()
+        # location id and (location id, evse uid)
+        self._location = PostingIndex()
+        # columns of the charging periods for the energy rollups
+        self.periods = ChargingPeriods()
+        for session_id in self.sessions:
+            self._index(session_id)
+        self.feed = ChangeFeed(self._seq)
+
+    def _index(self, session_id):
+        session = self.sessions[session_id]
+        self._updated.update(
+            session_id,
+            toTimestamp(session.get("last_updated") or session.get("start_datetime")),
+        )
+        self._status.update(session_id, [session.get("status")])
+        self._auth_id.update(session_id, [session.get("auth_id")])
+        location = session.get("location") or {}
+        places = [location.get("id")]
+        for evse in location.get("evses") or []:
+            places.append((location.get("id"), evse.get("uid")))
+        self._location.update(session_id, places)
+        self.periods.update(session_id, session)
+
+    def refresh(self):
+        """picks up the sessions which other worker processes wrote"""
+        self._refresh()
+
+    def _refresh(self):
+        """apply sessions which other worker processes wrote to the store"""
+        changes = self.store.changes(self._seq)
+        if changes:
+            with self.store.lock:
+                for seq, session_id, session in changes:
+                    if seq > self._seq:
+                        old = self.sessions.get(session_id)
+                        self.sessions[session_id] = session
+                        self._index(session_id)
+                        self.feed.publish(seq, sessionEvents(session_id, old, session))
+                        self._seq = seq
+
+    def _commit(self, session_id, old=None):
+        """
+        write the session to the store, must be called within a transaction,
+        old is the previous version of the session for the change feed
+        """
+        self._index(session_id)
+        session = self.sessions[session_id]
+        seq = self.store.put(session_id, session)
+        self._seq = max(self._seq, seq)
+        self.feed.publish(seq, sessionEvents(session_id, old, session))
 
     def getSessions(self, begin, end, offset, limit):
+        """
+        returns the sessions with begin <= last_updated < end,
+        ordered by last_updated
+        """
         log.debug("get sessions")
-        return list(self.sessions.values())[offset : offset + limit], {}
+        self._refresh()
+        begin, end = toRange(begin, end)
+        session_ids = self._updated.keys(begin, end, offset, limit)
+        headers = {
+            "X-Total-Count": self._updated.count(begin, end),
+            "X-Limit": limit,
+        }
+        return [self.sessions[session_id] for session_id in session_ids], headers
+
+    def iterSessions(self, begin, end, batch=500):
+        """
+        yields all sessions with begin <= last_updated < end,
+        ordered by last_updated, see iterLocations
+        """
+        log.debug("iterate sessions")
+        begin, end = toRange(begin, end)
+        after = None
+        while True:
+            self._refresh()
+            entries = self._updated.entriesAfter(after, begin, end, batch)
+            if not entries:
+                return
+            for _, session_id in entries:
+                session = self.sessions.get(session_id)
+                if session is not None:
+                    yield session
+            after = entries[-1]
+
+    def findSessions(self, status=None, auth_id=None, location_id=None, evse_uid=None):
+        """
+        returns all sessions matching every given criteria,
+        evse_uid requires location_id
+        """
+        self._refresh()
+        candidates = []
+        if status is not None:
+            candidates.append(self._status.get(status))
+        if auth_id is not None:
+            candidates.append(self._auth_id.get(auth_id))
+        if evse_uid is not None:
+            candidates.append(self._location.get((location_id, evse_uid)))
+        elif location_id is not None:
+            candidates.append(self._location.get(location_id))
+        if not candidates:
+            return list(self.sessions.values())
+        candidates.sort(key=len)
+        session_ids = candidates[0].intersection(*candidates[1:])
+        return [self.sessions[session_id] for session_id in session_ids]
+
+    def getEnergy(self, begin, end, by=None, interval=3600, location_id=None,
+                  country_code=None, party_id=None):
+        """
+        energy, time, number and cost of the sessions between begin and end
+        by location, party or interval of interval seconds, or in total.
+        Optionally only of a location or of a party (country_code and party_id).
+        """
+        if (country_code is None) != (party_id is None):
+            raise InvalidMissingParamsError("country_code and party_id go together")
+        self._refresh()
+        begin, end = int(toTimestamp(begin)), int(toTimestamp(end))
+        party = None if country_code is None else (country_code, party_id)
+        result = []
+        for group, values in self.periods.rollup(begin, end, by, interval, location_id, party):
+            if by == "location":
+                values["location_id"] = group
+            elif by == "party":
+                values["country_code"], values["party_id"] = group
+            elif by == "interval":
+                values["begin"] = datetime.fromtimestamp(group, timezone.utc)
+            result.append(values)
+        return result
+
+    def getActiveSessions(self, location_id, evse_uid=None):
+        return self.findSessions(status="ACTIVE", location_id=location_id, evse_uid=evse_uid)
 
     def getSession(self, country_id, party_id, session_id):
         log.debug(f"getting session {session_id}")
+        self._refresh()
         return self.sessions[session_id]
 
     def createSession(self, country_id, party_id, session):
         log.debug(f"create session {session['id']}")
-        self.sessions[session["id"]]=session
+        session = dict(session)
+        setParty(session, country_id, party_id)
+        with self.store.transaction():
+            self._refresh()
+            old = self.sessions.get(session["id"])
+            self.sessions[session["id"]]=session
+            self._commit(session["id"], old=old)
 
     def patchSession(self, country_id, party_id, session_id, sessionPart):
         log.debug("patch session")
-        self.sessions[session_id].update(sessionPart)
-
-
+        with self.store.transaction():
+            self._refresh()
+            # a new version, so the change feed can tell what changed
+            old = self.sessions[session_id]
+            self.sessions[session_id] = {**old, **sessionPart}
+            self._commit(session_id, old=old)
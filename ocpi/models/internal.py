@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 from flask_restx import Model, fields
+from ocpi.models.location import EVSE, Location, add_models_to_location_namespace, status
 from ocpi.models.version import version_number
 
 Register = Model(
@@ -12,7 +13,97 @@ Register = Model(
     }
 )
 
+BulkResult = Model(
+    "BulkResult",
+    {
+        "count": fields.Integer(description="The number of stored objects", required=True),
+    }
+)
+
+LocationMatch = Model(
+    "LocationMatch",
+    {
+        "distance": fields.Float(description="Distance in meters, only for a radius search"),
+        "location": fields.Nested(Location, required=True),
+    }
+)
+
+EvseMatch = Model(
+    "EvseMatch",
+    {
+        "location_id": fields.String(description="Id of the Location of the EVSE", required=True),
+        "evse": fields.Nested(EVSE, required=True),
+    }
+)
+
+StatusCounts = Model(
+    "StatusCounts",
+    {
+        "total": fields.Integer(default=0, description="The number of EVSEs"),
+        **{
+            value: fields.Integer(default=0, description=f"The number of {value} EVSEs")
+            for value in status
+        },
+    }
+)
+
+EnergyRollup = Model(
+    "EnergyRollup",
+    {
+        "location_id": fields.String(description="The location, if grouped by location"),
+        "country_code": fields.String(description="The party, if grouped by party"),
+        "party_id": fields.String(description="The party, if grouped by party"),
+        "begin": fields.DateTime(description="Start of the interval, if grouped by interval"),
+        "sessions": fields.Integer(default=0, description="The number of sessions started"),
+        "kwh": fields.Float(default=0, description="Energy of the charging periods in kWh"),
+        "hours": fields.Float(default=0, description="Charging time of the charging periods in hours"),
+        "parking_hours": fields.Float(default=0, description="Parking time of the charging periods in hours"),
+        "cost": fields.Raw(description="total_cost of the sessions started by currency"),
+    }
+)
+
+StatusSeconds = Model(
+    "StatusSeconds",
+    {value: fields.Integer(default=0, description=f"Seconds {value}") for value in status},
+)
+
+Utilization = Model(
+    "Utilization",
+    {
+        "evses": fields.Integer(description="The number of EVSEs"),
+        "observed_seconds": fields.Integer(description="Seconds with a known status, summed over the EVSEs"),
+        "seconds": fields.Nested(StatusSeconds, description="Seconds per status, summed over the EVSEs"),
+        "charging": fields.Float(description="Share of the observed time charging"),
+        "outage_minutes": fields.Float(description="Minutes OUTOFORDER or INOPERATIVE"),
+        "by_evse": fields.Raw(description="The same figures by EVSE uid, only for a location"),
+    }
+)
+
+Heatmap = Model(
+    "Heatmap",
+    {
+        "status": fields.String(enum=status, description="The status of the shares"),
+        "share": fields.List(
+            fields.List(fields.Float),
+            description="Share of the observed time in status by weekday (0 is Monday) and hour (UTC)",
+        ),
+    }
+)
+
+SyncState = Model(
+    "SyncState",
+    {
+        "running": fields.Boolean(required=True, description="Whether a sync is running"),
+        "started": fields.Boolean(description="Whether this request started the sync"),
+        "checkpoints": fields.Raw(
+            description="Date of the last successful sync by partner url and module"
+        ),
+    }
+)
+
 
 def add_models_to_internal_namespace(namespace):
-    for model in [Register]:
+    add_models_to_location_namespace(namespace)
+    for model in [Register, BulkResult, LocationMatch, EvseMatch, StatusCounts, EnergyRollup, SyncState,
+                  StatusSeconds, Utilization, Heatmap]:
         namespace.models[model.name] = model
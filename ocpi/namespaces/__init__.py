@@ -6,15 +6,21 @@ from __future__ import annotations
 # https://aaronluna.dev/series/flask-api-tutorial/part-4/
 import base64
 import logging
-from datetime import datetime,timezone
+import threading
+import time
 from functools import wraps
+from urllib.parse import urlencode
 
-from flask import request
-from flask_restx import reqparse
-from flask_restx.inputs import datetime_from_iso8601
+from flask import Response, current_app, request, stream_with_context
+from flask_restx import marshal, reqparse
+from flask_restx.inputs import boolean, datetime_from_iso8601
+from flask_restx.utils import merge, unpack
 from werkzeug.exceptions import Forbidden, Unauthorized
 
 import ocpi.exceptions as oe
+from ocpi.encoders import dumps, timestamp
+from ocpi.feed import matches
+from ocpi.serializers import compileModel
 
 log = logging.getLogger("ocpi")
 
@@ -43,6 +49,34 @@ def token_required(f):
     return decorated
 
 
+def marshal_compiled(namespace, model, code=200, description=None):
+    """
+    Drop-in for namespace.marshal_with(model), but serializes with the
+    function compiled from the model (see ocpi.serializers).
+    Requests with a field mask use the generic marshal,
+    flask Responses (e.g. cached or streamed ones) are passed through.
+    """
+    serialize = compileModel(model)
+
+    def wrapper(func):
+        @wraps(func)
+        def marshalled(*args, **kwargs):
+            result = func(*args, **kwargs)
+            if isinstance(result, Response):
+                return result
+            data, http_code, headers = unpack(result)
+            mask = request.headers.get(current_app.config["RESTX_MASK_HEADER"])
+            if mask:
+                return marshal(data, model, mask=mask), http_code, headers
+            return serialize(data), http_code, headers
+
+        doc = {"responses": {str(code): (description, model, {})}, "__mask__": True}
+        marshalled.__apidoc__ = merge(getattr(func, "__apidoc__", {}), doc)
+        return marshalled
+
+    return wrapper
+
+
 def pagination_parser():
     parser = reqparse.RequestParser()
     parser.add_argument(
@@ -51,8 +85,13 @@ def pagination_parser():
     parser.add_argument(
         "to", type=datetime_from_iso8601, default="2038-01-01T13:30:00+02:00"
     )
+    # parameter names of the OCPI specification, take precedence over from/to
+    parser.add_argument("date_from", type=datetime_from_iso8601)
+    parser.add_argument("date_to", type=datetime_from_iso8601)
     parser.add_argument("offset", type=int, default=0)
     parser.add_argument("limit", type=int, default=50)
+    # export everything as NDJSON instead of a page, also with Accept: application/x-ndjson
+    parser.add_argument("stream", type=boolean, default=False)
     return parser
 
 
@@ -114,13 +153,198 @@ def make_response(function, *args, **kwargs):
             "data": data,
             "status_code": status_code,
             #"status_message": status_message,
-            "timestamp": datetime.now(timezone.utc),
+            "timestamp": timestamp(),
         },
         http_code,
         headers,
     )
 
 
+def make_cached_response(manager, key, model, function, *args, **kwargs):
+    """
+    make_response for single objects, marshalled with the response model.
+    The marshalled data is kept as JSON in the cache of the manager
+    (its ResponseCache responses) under key, so that following requests
+    only wrap it into a fresh response envelope.
+    Errors and requests with a field mask are not cached.
+    """
+    data_model = model["data"].model
+    masked = request.headers.get(current_app.config["RESTX_MASK_HEADER"])
+    cache = getattr(manager, "responses", None)
+    if cache is not None:
+        # writes of other worker processes invalidate the cache when picked up
+        manager.refresh()
+    data = cache.get(key) if cache is not None and not masked else None
+    if data is None:
+        generation = cache.generation(key[2]) if cache is not None else 0
+        response, http_code, headers = make_response(function, *args, **kwargs)
+        if response["status_code"] != 1000 or masked:
+            return Response(
+                dumps(marshal(response, model, mask=masked)) + b"\n",
+                status=http_code,
+                headers=headers,
+                mimetype="application/json",
+            )
+        data = dumps(compileModel(data_model)(response["data"]))
+        if cache is not None:
+            cache.set(key, data, generation)
+    body = b"".join(
+        (
+            b'{"data": ',
+            data,
+            b', "status_code": 1000, "timestamp": "',
+            timestamp().encode("ascii"),
+            b'"}\n',
+        )
+    )
+    return Response(body, status=200, mimetype="application/json")
+
+
+def make_paginated_response(function, args):
+    """
+    make_response for the paginated list endpoints.
+    function is called with (date_from, date_to, offset, limit) and may
+    return a X-Total-Count header, then a Link header to the next page is added.
+    """
+    data, http_code, headers = make_response(
+        function,
+        args["date_from"] or args["from"],
+        args["date_to"] or args["to"],
+        args["offset"],
+        args["limit"],
+    )
+    headers = {key: str(value) for key, value in (headers or {}).items()}
+    total = int(headers.get("X-Total-Count", 0))
+    next_offset = args["offset"] + args["limit"]
+    if next_offset < total:
+        query = request.args.to_dict()
+        query["offset"] = next_offset
+        headers["Link"] = f'<{request.base_url}?{urlencode(query)}>; rel="next"'
+    return data, http_code, headers
+
+
+NDJSON = "application/x-ndjson"
+EVENT_STREAM = "text/event-stream"
+
+
+def wants_ndjson(args):
+    """whether the list should be streamed as NDJSON (see pagination_parser)"""
+    if args.get("stream"):
+        return True
+    accept = request.accept_mimetypes
+    return accept[NDJSON] > accept["application/json"]
+
+
+def make_ndjson_response(function, args, model):
+    """
+    streams all objects yielded by function(date_from, date_to) as NDJSON,
+    one object marshalled with model per line.
+    offset and limit are ignored, the objects are not collected in memory.
+    """
+    serialize = compileModel(model)
+    objects = function(args["date_from"] or args["from"], args["date_to"] or args["to"])
+
+    def generate():
+        count = 0
+        try:
+            for obj in objects:
+                yield dumps(serialize(obj)) + b"\n"
+                count += 1
+        except Exception as e:
+            # the status is already sent, the client sees a truncated stream
+            log.error(f"streaming stopped after {count} objects: {e}")
+        finally:
+            objects.close()
+
+    return Response(stream_with_context(generate()), status=200, mimetype=NDJSON)
+
+
+class StreamLimit:
+    """
+    Counts the open streams of this process. Every stream holds a thread
+    of the worker as long as the client stays connected.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.count >= self.limit:
+                return False
+            self.count += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.count -= 1
+
+
+def make_event_stream(
+    manager, since, serializers, streams=None, lifetime=300.0, poll=1.0, keepalive=15.0, **filters
+):
+    """
+    streams the events of the change feed of manager after the sequence
+    number since as Server-Sent Events, the event data is serialized with
+    serializers[event type]. filters are passed to ocpi.feed.matches.
+    Without since only new events are sent. A "reset" event tells the
+    client that events were missed, it has to reload and continue from there.
+    Changes of other worker processes are picked up every poll seconds.
+
+    With all streams (a StreamLimit) open the client gets a 503 to retry later.
+    A stream ends after lifetime seconds, the client reconnects with the
+    id of the last event it got.
+    """
+    if streams is not None and not streams.acquire():
+        response = Response(
+            dumps({"message": "too many open event streams, retry later"}) + b"\n",
+            status=503,
+            mimetype="application/json",
+        )
+        response.headers["Retry-After"] = "30"
+        return response
+    feed = manager.feed
+    seq = feed.seq if since is None else since
+
+    def event(name, seq, data):
+        return b"id: %d\nevent: %s\ndata: %s\n\n" % (seq, name.encode(), dumps(data))
+
+    def generate():
+        nonlocal seq
+        yield b"retry: 3000\n\n"
+        idle = 0.0
+        deadline = time.monotonic() + lifetime
+        while time.monotonic() < deadline:
+            manager.refresh()
+            events, last, complete = feed.since(seq)
+            if not complete:
+                yield event("reset", last, {"seq": last})
+            for e in events:
+                if matches(e, **filters):
+                    yield event(e["type"], e["seq"], {**e, "data": serializers[e["type"]](e["data"])})
+            if events or not complete:
+                idle = 0.0
+            seq = last
+            if not feed.wait(seq, min(poll, max(deadline - time.monotonic(), 0.0))):
+                idle += poll
+                if idle >= keepalive:
+                    idle = 0.0
+                    yield b": keepalive\n\n"
+
+    response = Response(
+        stream_with_context(generate()),
+        status=200,
+        mimetype=EVENT_STREAM,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    if streams is not None:
+        # also called if the client is gone before the stream started
+        response.call_on_close(streams.release)
+    return response
+
+
 if __name__ == "__main__":
 
     def raisUnsupVers(input_):
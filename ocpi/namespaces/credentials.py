@@ -18,6 +18,7 @@ from ocpi.namespaces import (
     _check_access_token,
     get_header_parser,
     make_response,
+    marshal_compiled,
     token_required,
 )
 import logging
@@ -37,7 +38,7 @@ class credentials(Resource):
         super().__init__(api, *args, **kwargs)
 
     @token_required
-    @credentials_ns.marshal_with(resp(credentials_ns, Credentials))
+    @marshal_compiled(credentials_ns, resp(credentials_ns, Credentials))
     @credentials_ns.expect(parser)
     def get(self):
         """
@@ -48,7 +49,7 @@ class credentials(Resource):
         return make_response(self.credentials_manager.getCredentials, decodedToken)
 
     @token_required
-    @credentials_ns.marshal_with(resp(credentials_ns, Credentials))
+    @marshal_compiled(credentials_ns, resp(credentials_ns, Credentials))
     @credentials_ns.expect(parser, Credentials)
     def post(self):
         log.info(f"get new credential")
@@ -66,7 +67,7 @@ class credentials(Resource):
         )
 
     @token_required
-    @credentials_ns.marshal_with(resp(credentials_ns, Credentials))
+    @marshal_compiled(credentials_ns, resp(credentials_ns, Credentials))
     @credentials_ns.expect(parser, Credentials)
     def put(self):
         """
@@ -1,11 +1,39 @@
 
+import json
 import secrets
-from flask_restx import Namespace, Resource
-from ocpi.namespaces import SingleCredMan, get_header_parser, make_response
-from ocpi.models import resp
+from datetime import datetime, timedelta, timezone
+from flask import request
+from flask_restx import Namespace, Resource, abort, reqparse
+from flask_restx.inputs import datetime_from_iso8601
+from ocpi.namespaces import (
+    NDJSON,
+    SingleCredMan,
+    StreamLimit,
+    get_header_parser,
+    make_event_stream,
+    make_response,
+    marshal_compiled,
+    token_required,
+)
+from ocpi.models import resp, respList
+import ocpi.models.location as ml
+from ocpi.models.location import EVSE, Location
+from ocpi.models.sessions import Session
+from ocpi.periods import GROUPS, MAX_INTERVALS
+from ocpi.serializers import compileModel
+from ocpi.validators import compileValidator
+from ocpi.views import EvseView, LocationView
 
 from ocpi.models.internal import (
+    BulkResult,
+    EnergyRollup,
+    EvseMatch,
+    Heatmap,
+    LocationMatch,
     Register,
+    StatusCounts,
+    SyncState,
+    Utilization,
     add_models_to_internal_namespace,
 )
 
@@ -27,7 +55,7 @@ class credentials(Resource):
     def post(self):
         client_url=internal_ns.payload["client_url"]
         man=SingleCredMan.getInstance()
-        current_tokens=man.readJson()
+        current_tokens=man.getTokens()
         if internal_ns.payload.get("client_token")==None:
             tokenB=[k for k,v in current_tokens.items() if v["client_url"]==client_url][0]
             tokenA=current_tokens[tokenB]["client_token"]
@@ -53,4 +81,420 @@ class credentials(Resource):
         except Exception as e:
             log.error(e)
             return {"error": f"{e}"}
-        
\ No newline at end of file
+        
+
+@internal_ns.route(
+    "/locations/<string:country_code>/<string:party_id>",
+    doc={"description": "bulk upload of locations, e.g. for the initial sync of a CPO"},
+)
+class bulk_locations(Resource):
+    def __init__(self, api=None, *args, **kwargs):
+        self.locationmanager = kwargs.get("locations")
+        super().__init__(api, *args, **kwargs)
+
+    @internal_ns.expect(parser)
+    @internal_ns.doc(
+        description="Body: a JSON array of locations or NDJSON (application/x-ndjson), one location per line."
+        " Nothing is stored if one of the locations is invalid."
+    )
+    @internal_ns.response(400, "Input payload validation failed")
+    @marshal_compiled(internal_ns, resp(internal_ns, BulkResult))
+    @token_required
+    def put(self, country_code, party_id):
+        """
+        Add/Replace many Locations at once
+        """
+        if self.locationmanager is None:
+            abort(404, "locations are not enabled")
+        try:
+            if request.mimetype == NDJSON:
+                lines = request.get_data().splitlines()
+                locations = [json.loads(line) for line in lines if line.strip()]
+            else:
+                locations = json.loads(request.get_data())
+        except ValueError as e:
+            abort(400, f"invalid JSON: {e}")
+        if not isinstance(locations, list):
+            abort(400, "expected an array of locations")
+
+        validator = compileValidator(Location)
+        errors = {}
+        for index, location in enumerate(locations):
+            for path, error in validator.errors(location).items():
+                errors[f"{index}.{path}" if path else str(index)] = error
+        if errors:
+            abort(400, "Input payload validation failed", errors=errors)
+
+        return make_response(
+            lambda: {"count": self.locationmanager.putLocations(country_code, party_id, locations)}
+        )
+
+
+search_parser = reqparse.RequestParser()
+for name in ["latitude", "longitude", "min_latitude", "min_longitude", "max_latitude", "max_longitude"]:
+    search_parser.add_argument(name, type=float)
+search_parser.add_argument("radius", type=float, help="in meters")
+search_parser.add_argument("limit", type=int, default=100)
+
+
+@internal_ns.route(
+    "/locations/search",
+    doc={"description": "locations within a radius or a bounding box"},
+)
+class search_locations(Resource):
+    def __init__(self, api=None, *args, **kwargs):
+        self.locationmanager = kwargs.get("locations")
+        super().__init__(api, *args, **kwargs)
+
+    @internal_ns.expect(parser, search_parser)
+    @internal_ns.doc(
+        description="Either latitude, longitude and radius: the locations nearest first,"
+        " or min_latitude, min_longitude, max_latitude and max_longitude."
+        " A box with min_longitude > max_longitude crosses the antimeridian."
+    )
+    @marshal_compiled(internal_ns, respList(internal_ns, LocationMatch))
+    @token_required
+    def get(self):
+        """
+        Find Locations by their coordinates
+        """
+        if self.locationmanager is None:
+            abort(404, "locations are not enabled")
+        args = search_parser.parse_args()
+        near = [args["latitude"], args["longitude"], args["radius"]]
+        box = [args[f"{m}_{c}"] for m in ("min", "max") for c in ("latitude", "longitude")]
+        if None not in near:
+            return make_response(
+                lambda: [
+                    {"distance": distance, "location": location}
+                    for distance, location in self.locationmanager.findLocationsNear(
+                        *near, limit=args["limit"]
+                    )
+                ]
+            )
+        if None not in box:
+            min_lat, min_lon, max_lat, max_lon = box
+            return make_response(
+                lambda: [
+                    {"location": location}
+                    for location in self.locationmanager.findLocationsInBox(
+                        min_lat, min_lon, max_lat, max_lon, limit=args["limit"]
+                    )
+                ]
+            )
+        abort(400, "either latitude, longitude and radius or a bounding box are required")
+
+
+evse_parser = reqparse.RequestParser()
+# repeat a parameter for several values
+evse_parser.add_argument("status", action="append", choices=ml.status)
+evse_parser.add_argument("capability", action="append", choices=ml.capability, help="all are required")
+evse_parser.add_argument("standard", action="append", choices=ml.connector_type)
+evse_parser.add_argument("format", action="append", choices=ml.connector_format)
+evse_parser.add_argument("power_type", action="append", choices=ml.power_type)
+evse_parser.add_argument("min_voltage", type=int)
+evse_parser.add_argument("min_amperage", type=int)
+evse_parser.add_argument("limit", type=int, default=100)
+
+
+@internal_ns.route("/evses/search", doc={"description": "EVSEs by status, capabilities and connectors"})
+class search_evses(Resource):
+    def __init__(self, api=None, *args, **kwargs):
+        self.locationmanager = kwargs.get("locations")
+        super().__init__(api, *args, **kwargs)
+
+    @internal_ns.expect(parser, evse_parser)
+    @internal_ns.doc(
+        description="An EVSE matches if it has one of the given statuses, standards, formats"
+        " and power types and all of the given capabilities."
+    )
+    @marshal_compiled(internal_ns, respList(internal_ns, EvseMatch))
+    @token_required
+    def get(self):
+        """
+        Find EVSEs by status, capabilities and connectors
+        """
+        if self.locationmanager is None:
+            abort(404, "locations are not enabled")
+        args = evse_parser.parse_args()
+        return make_response(
+            lambda: [
+                {"location_id": location_id, "evse": evse}
+                for location_id, evse in self.locationmanager.findEvses(
+                    status=args["status"] or (),
+                    capabilities=args["capability"] or (),
+                    standard=args["standard"] or (),
+                    format=args["format"] or (),
+                    power_type=args["power_type"] or (),
+                    min_voltage=args["min_voltage"],
+                    min_amperage=args["min_amperage"],
+                    limit=args["limit"],
+                )
+            ]
+        )
+
+
+@internal_ns.route("/stats", doc={"description": "number of EVSEs by status"})
+class stats(Resource):
+    def __init__(self, api=None, *args, **kwargs):
+        self.locationmanager = kwargs.get("locations")
+        super().__init__(api, *args, **kwargs)
+
+    @internal_ns.expect(parser)
+    @internal_ns.doc(
+        params={
+            "location_id": "of this location",
+            "country_code": "of the locations of this party",
+            "party_id": "of the locations of this party",
+            "city": "of the locations in this city",
+        },
+        description="Without parameters the EVSEs of all locations are counted.",
+    )
+    @marshal_compiled(internal_ns, resp(internal_ns, StatusCounts))
+    @token_required
+    def get(self):
+        """
+        Count the EVSEs by status
+        """
+        if self.locationmanager is None:
+            abort(404, "locations are not enabled")
+        country_code, party_id = request.args.get("country_code"), request.args.get("party_id")
+        if (country_code is None) != (party_id is None):
+            abort(400, "country_code and party_id must be given together")
+
+        def counts():
+            counts = self.locationmanager.getStatusCounts(
+                location_id=request.args.get("location_id"),
+                country_code=country_code,
+                party_id=party_id,
+                city=request.args.get("city"),
+            )
+            return {**counts, "total": sum(counts.values())}
+
+        return make_response(counts)
+
+
+history_parser = reqparse.RequestParser()
+history_parser.add_argument("from", type=datetime_from_iso8601, help="defaults to 30 days before to")
+history_parser.add_argument("to", type=datetime_from_iso8601, help="defaults to now")
+history_parser.add_argument("location_id")
+history_parser.add_argument("evse_uid", help="requires location_id")
+history_parser.add_argument("status", choices=ml.status, default="CHARGING", help="of the heatmap")
+
+
+def history_window(args):
+    end = args["to"] or datetime.now(timezone.utc)
+    begin = args["from"] or end - timedelta(days=30)
+    return begin, end
+
+
+HISTORY = (
+    " The status history is kept in the memory of each server process: it starts empty"
+    " with the process and only holds the status changes this process has seen, so with"
+    " several workers the answers can differ by worker."
+    " Only the time since the first status change seen is counted."
+)
+
+
+class history(Resource):
+    def __init__(self, api=None, *args, **kwargs):
+        self.locationmanager = kwargs.get("locations")
+        super().__init__(api, *args, **kwargs)
+
+    def window(self):
+        if self.locationmanager is None:
+            abort(404, "locations are not enabled")
+        args = history_parser.parse_args()
+        return args, *history_window(args)
+
+
+@internal_ns.route("/history/utilization", doc={"description": "utilization of the EVSEs"})
+class utilization(history):
+    @internal_ns.expect(parser, history_parser)
+    @internal_ns.doc(
+        description="Seconds per status, share of the time charging and outage minutes,"
+        " per EVSE as well for a location." + HISTORY
+    )
+    @marshal_compiled(internal_ns, resp(internal_ns, Utilization))
+    @token_required
+    def get(self):
+        """
+        Utilization of all EVSEs, of a location or of an EVSE
+        """
+        args, begin, end = self.window()
+        return make_response(
+            self.locationmanager.getUtilization, begin, end, args["location_id"], args["evse_uid"]
+        )
+
+
+@internal_ns.route("/history/heatmap", doc={"description": "share of the time in a status by hour of the week"})
+class heatmap(history):
+    @internal_ns.expect(parser, history_parser)
+    @internal_ns.doc(
+        description="Share of the time in status by weekday (0 is Monday) and hour (UTC)." + HISTORY
+    )
+    @marshal_compiled(internal_ns, resp(internal_ns, Heatmap))
+    @token_required
+    def get(self):
+        """
+        Heatmap of all EVSEs, of a location or of an EVSE
+        """
+        args, begin, end = self.window()
+
+        def heatmap():
+            share = self.locationmanager.getHeatmap(
+                begin, end, args["status"], args["location_id"], args["evse_uid"]
+            )
+            return {"status": args["status"], "share": share}
+
+        return make_response(heatmap)
+
+
+energy_parser = reqparse.RequestParser()
+energy_parser.add_argument("from", type=datetime_from_iso8601, help="defaults to 30 days before to")
+energy_parser.add_argument("to", type=datetime_from_iso8601, help="defaults to now")
+energy_parser.add_argument("by", choices=GROUPS, help="group by, in total if omitted")
+energy_parser.add_argument("interval", type=int, default=3600, help="in seconds, if grouped by interval")
+energy_parser.add_argument("location_id", help="only sessions of this location")
+energy_parser.add_argument("country_code", help="only sessions of this party")
+energy_parser.add_argument("party_id", help="only sessions of this party")
+
+
+@internal_ns.route("/sessions/energy", doc={"description": "energy and cost of the sessions"})
+class energy(Resource):
+    def __init__(self, api=None, *args, **kwargs):
+        self.sessionmanager = kwargs.get("sessions")
+        super().__init__(api, *args, **kwargs)
+
+    @internal_ns.expect(parser, energy_parser)
+    @internal_ns.doc(
+        description="Energy, charging and parking time of the charging periods starting"
+        " within the window, number and total_cost of the sessions starting within it."
+    )
+    @marshal_compiled(internal_ns, respList(internal_ns, EnergyRollup))
+    @token_required
+    def get(self):
+        """
+        Sum up the charging periods by location, party or interval
+        """
+        if self.sessionmanager is None:
+            abort(404, "sessions are not enabled")
+        args = energy_parser.parse_args()
+        if (args["country_code"] is None) != (args["party_id"] is None):
+            abort(400, "country_code and party_id must be given together")
+        begin, end = history_window(args)
+        if args["by"] == "interval" and (
+            args["interval"] <= 0 or (end - begin).total_seconds() / args["interval"] > MAX_INTERVALS
+        ):
+            abort(400, f"at most {MAX_INTERVALS} intervals are supported")
+        return make_response(
+            self.sessionmanager.getEnergy,
+            begin,
+            end,
+            args["by"],
+            args["interval"],
+            args["location_id"],
+            args["country_code"],
+            args["party_id"],
+        )
+
+
+sync_response = resp(internal_ns, SyncState)
+
+
+@internal_ns.route("/sync", doc={"description": "pull-sync of the partners' locations and sessions"})
+class sync(Resource):
+    def __init__(self, api=None, *args, **kwargs):
+        self.sync_client = kwargs.get("sync")
+        super().__init__(api, *args, **kwargs)
+
+    @internal_ns.expect(parser)
+    @internal_ns.doc(
+        params={"client_url": "only sync this partner"},
+        responses={409: "A sync is already running"},
+    )
+    @marshal_compiled(internal_ns, sync_response, code=202)
+    @token_required
+    def post(self):
+        """
+        Start a sync of everything changed since the last successful sync
+        """
+        started = not self.sync_client.running
+        if started:
+            self.sync_client.start(request.args.get("client_url"))
+        response, _, headers = make_response(lambda: {"running": True, "started": started})
+        return response, 202 if started else 409, headers
+
+    @internal_ns.expect(parser)
+    @marshal_compiled(internal_ns, sync_response)
+    @token_required
+    def get(self):
+        """
+        Dates of the last successful sync by partner and module
+        """
+        return make_response(
+            lambda: {
+                "running": self.sync_client.running,
+                "checkpoints": self.sync_client.readCheckpoints(),
+            }
+        )
+
+
+# open event streams of this process, each one holds a thread of the worker
+event_streams = StreamLimit(1)
+
+
+@internal_ns.route(
+    "/events/<any(locations, sessions):module>",
+    doc={"description": "change feed of the locations or sessions as Server-Sent Events"},
+)
+class events(Resource):
+    def __init__(self, api=None, *args, **kwargs):
+        self.managers = {
+            "locations": kwargs.get("locations"),
+            "sessions": kwargs.get("sessions"),
+        }
+        super().__init__(api, *args, **kwargs)
+
+    @internal_ns.expect(parser)
+    @internal_ns.doc(
+        description="Events are location, evse or session with the changed object as data,"
+        " the event id is the sequence number of the change."
+        " A reset event means that events were missed, reload and go on from its id."
+        " A stream ends after 5 minutes, reconnect with the id of the last event."
+        " With too many open streams the answer is 503 with Retry-After.",
+        responses={503: "Too many open event streams"},
+        params={
+            "since": "resume after this event id, the Last-Event-ID header takes precedence",
+            "country_code": "only changes of this party",
+            "party_id": "only changes of this party",
+            "location_id": "only changes of this location",
+        },
+    )
+    @token_required
+    def get(self, module):
+        """
+        Stream the changes as Server-Sent Events
+        """
+        manager = self.managers[module]
+        if manager is None:
+            abort(404, f"{module} are not enabled")
+        since = request.headers.get("Last-Event-ID") or request.args.get("since")
+        try:
+            since = None if since is None else int(since)
+        except ValueError:
+            abort(400, f"invalid event id {since}")
+        serializers = {
+            "location": lambda data: compileModel(Location)(LocationView(data)),
+            "evse": lambda data: compileModel(EVSE)(EvseView(data)),
+            "session": compileModel(Session),
+        }
+        return make_event_stream(
+            manager,
+            since,
+            serializers,
+            event_streams,
+            country_code=request.args.get("country_code"),
+            party_id=request.args.get("party_id"),
+            location_id=request.args.get("location_id"),
+        )
@@ -24,9 +24,14 @@ from ocpi.models.location import (
 )
 from ocpi.namespaces import (
     get_header_parser,
+    make_cached_response,
+    make_ndjson_response,
+    make_paginated_response,
     make_response,
+    marshal_compiled,
     pagination_parser,
     token_required,
+    wants_ndjson,
 )
 
 locations_ns = Namespace(name="locations", validate=True)
@@ -59,6 +64,9 @@ def receiver():
     #         return make_response(self.locationmanager.getLocation, "", "", location_id)
 
     # Receiver interface: eMSP and NSP.
+    location_response = resp(locations_ns, Location)
+    evse_response = resp(locations_ns, EVSE)
+    connector_response = resp(locations_ns, Connector)
 
     @locations_ns.route("/<string:country_code>/<string:party_id>/<string:location_id>")
     @locations_ns.expect(parser)
@@ -68,19 +76,25 @@ def receiver():
             super().__init__(api, *args, **kwargs)
 
         @token_required
-        @locations_ns.marshal_with(resp(locations_ns, Location))
+        @locations_ns.response(200, "Success", location_response)
         def get(self, country_code, party_id, location_id):
             """
             Get Location by ID
             """
 
-            return make_response(
-                self.locationmanager.getLocation, country_code, party_id, location_id
+            return make_cached_response(
+                self.locationmanager,
+                (country_code, party_id, location_id, None, None),
+                location_response,
+                self.locationmanager.getLocation,
+                country_code,
+                party_id,
+                location_id,
             )
 
         @token_required
         @locations_ns.expect(Location)
-        @locations_ns.marshal_with(respEmpty(locations_ns))
+        @marshal_compiled(locations_ns, respEmpty(locations_ns))
         def put(self, country_code, party_id, location_id):
             """
             Add/Replace Location by ID
@@ -96,7 +110,7 @@ def receiver():
 
         @token_required
         @locations_ns.expect(LocationOptional)
-        @locations_ns.marshal_with(respEmpty(locations_ns))
+        @marshal_compiled(locations_ns, respEmpty(locations_ns))
         def patch(self, country_code, party_id, location_id):
             """
             Partially update Location
@@ -120,13 +134,16 @@ def receiver():
             self.locationmanager = kwargs["locations"]
             super().__init__(api, *args, **kwargs)
 
-        @locations_ns.marshal_with(resp(locations_ns, EVSE))
+        @locations_ns.response(200, "Success", evse_response)
         def get(self, country_code, party_id, location_id, evse_uid):
             """
             Get EVSE by ID
             """
 
-            return make_response(
+            return make_cached_response(
+                self.locationmanager,
+                (country_code, party_id, location_id, evse_uid, None),
+                evse_response,
                 self.locationmanager.getEVSE,
                 country_code,
                 party_id,
@@ -136,7 +153,7 @@ def receiver():
 
         @token_required
         @locations_ns.expect(EVSE)
-        @locations_ns.marshal_with(respEmpty(locations_ns))
+        @marshal_compiled(locations_ns, respEmpty(locations_ns))
         def put(self, country_code, party_id, location_id, evse_uid):
             """
             Add/Replace EVSE by ID
@@ -153,7 +170,7 @@ def receiver():
 
         @token_required
         @locations_ns.expect(EVSEOptional)
-        @locations_ns.marshal_with(respEmpty(locations_ns))
+        @marshal_compiled(locations_ns, respEmpty(locations_ns))
         def patch(self, country_code, party_id, location_id, evse_uid):
             """
             Partially update EVSE
@@ -178,13 +195,16 @@ def receiver():
             self.locationmanager = kwargs["locations"]
             super().__init__(api, *args, **kwargs)
 
-        @locations_ns.marshal_with(resp(locations_ns, Connector))
+        @locations_ns.response(200, "Success", connector_response)
         def get(self, country_code, party_id, location_id, evse_uid, connector_id):
             """
             Get Connector by ID
             """
 
-            return make_response(
+            return make_cached_response(
+                self.locationmanager,
+                (country_code, party_id, location_id, evse_uid, connector_id),
+                connector_response,
                 self.locationmanager.getConnector,
                 country_code,
                 party_id,
@@ -195,7 +215,7 @@ def receiver():
 
         @token_required
         @locations_ns.expect(Connector)
-        @locations_ns.marshal_with(respEmpty(locations_ns))
+        @marshal_compiled(locations_ns, respEmpty(locations_ns))
         def put(self, country_code, party_id, location_id, evse_uid, connector_id):
             """
             Add/Replace Connector by ID
@@ -213,7 +233,7 @@ def receiver():
         
         @token_required
         @locations_ns.expect(ConnectorOptional)
-        @locations_ns.marshal_with(respEmpty(locations_ns))
+        @marshal_compiled(locations_ns, respEmpty(locations_ns))
         def patch(self, country_code, party_id, location_id, evse_uid, connector_id):
             """
             Partially update Connector
@@ -256,6 +276,14 @@ def sender():
                     "default": "2038-01-01T15:30:00+02:00",
                     "required": True,
                 },
+                "date_from": {
+                    "in": "query",
+                    "description": "only locations with last_updated after or equal to this date, overrides from",
+                },
+                "date_to": {
+                    "in": "query",
+                    "description": "only locations with last_updated before this date, overrides to",
+                },
                 "offset": {
                     "in": "query",
                     "description": "id offset for pagination",
@@ -266,9 +294,14 @@ def sender():
                     "description": "number of entries to get",
                     "default": "50",
                 },
+                "stream": {
+                    "in": "query",
+                    "description": "stream all locations as NDJSON (application/x-ndjson) instead of a page, same as Accept: application/x-ndjson",
+                    "default": "false",
+                },
             }
         )
-        @locations_ns.marshal_with(respList(locations_ns, Location))
+        @marshal_compiled(locations_ns, respList(locations_ns, Location))
         @token_required
         @locations_ns.header("Link", "Link to the next ressource")
         @locations_ns.header(
@@ -284,16 +317,11 @@ def sender():
             """
             parser = pagination_parser()
             args = parser.parse_args()
+            if wants_ndjson(args):
+                return make_ndjson_response(self.locationmanager.iterLocations, args, Location)
 
-            return make_response(
-                self.locationmanager.getLocations,
-                args["from"],
-                args["to"],
-                args["offset"],
-                args["limit"],
-            )
-            # TODO Link Header must contain a full url, which is quite bad abstraction-wise
-            # as the url should not be known to the managers
+            # the Link header is added here, as the url should not be known to the managers
+            return make_paginated_response(self.locationmanager.getLocations, args)
 
 
 def makeLocationNamespace(role):
@@ -18,9 +18,13 @@ from ocpi.models.sessions import (
 )
 from ocpi.namespaces import (
     get_header_parser,
+    make_ndjson_response,
+    make_paginated_response,
     make_response,
+    marshal_compiled,
     pagination_parser,
     token_required,
+    wants_ndjson,
 )
 
 sessions_ns = Namespace(name="sessions", validate=True)
@@ -49,6 +53,14 @@ def sender():
                     "default": "2038-01-01T15:30:00+02:00",
                     "required": True,
                 },
+                "date_from": {
+                    "in": "query",
+                    "description": "only sessions with last_updated after or equal to this date, overrides from",
+                },
+                "date_to": {
+                    "in": "query",
+                    "description": "only sessions with last_updated before this date, overrides to",
+                },
                 "offset": {
                     "in": "query",
                     "description": "id offset for pagination",
@@ -59,9 +71,14 @@ def sender():
                     "description": "number of entries to get",
                     "default": "50",
                 },
+                "stream": {
+                    "in": "query",
+                    "description": "stream all sessions as NDJSON (application/x-ndjson) instead of a page, same as Accept: application/x-ndjson",
+                    "default": "false",
+                },
             }
         )
-        @sessions_ns.marshal_with(respList(sessions_ns, Session))
+        @marshal_compiled(sessions_ns, respList(sessions_ns, Session))
         @token_required
         def get(self):
             """
@@ -69,13 +86,9 @@ def sender():
             """
             parser = pagination_parser()
             args = parser.parse_args()
-            return make_response(
-                self.sessionmanager.getSessions,
-                args["from"],
-                args["to"],
-                args["offset"],
-                args["limit"],
-            )
+            if wants_ndjson(args):
+                return make_ndjson_response(self.sessionmanager.iterSessions, args, Session)
+            return make_paginated_response(self.sessionmanager.getSessions, args)
 
     return sessions_ns
 
@@ -92,7 +105,7 @@ def receiver():
             self.session_manager = kwargs["sessions"]
             super().__init__(api, *args, **kwargs)
 
-        @sessions_ns.marshal_with(resp(sessions_ns, Session), code=200)
+        @marshal_compiled(sessions_ns, resp(sessions_ns, Session), code=200)
         @token_required
         def get(self, country_id, party_id, session_id):
             return make_response(
@@ -100,7 +113,7 @@ def receiver():
             )
 
         @sessions_ns.expect(Session)
-        @sessions_ns.marshal_with(respEmpty(sessions_ns), code=201)
+        @marshal_compiled(sessions_ns, respEmpty(sessions_ns), code=201)
         @token_required
         def put(self, country_id, party_id, session_id):
             """Add new Session"""
@@ -116,7 +129,7 @@ def receiver():
             )
 
         @sessions_ns.expect(Session, validate=False)
-        @sessions_ns.marshal_with(respEmpty(sessions_ns), code=201)
+        @marshal_compiled(sessions_ns, respEmpty(sessions_ns), code=201)
         @token_required
         def patch(self, country_id, party_id, session_id):
             session_id = session_id.upper()  # caseinsensitive
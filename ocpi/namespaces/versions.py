@@ -16,7 +16,7 @@ from ocpi.models.version import (
     VersionDetailsData,
     add_models_to_version_namespace,
 )
-from ocpi.namespaces import get_header_parser, make_response
+from ocpi.namespaces import get_header_parser, make_response, marshal_compiled
 import logging
 log = logging.getLogger("ocpi")
 
@@ -34,7 +34,7 @@ class get_versions(Resource):
         self.versionsmanager = kwargs["versions"]
         super().__init__(api, *args, **kwargs)
 
-    @versions_ns.marshal_with(respList(versions_ns, Version))
+    @marshal_compiled(versions_ns, respList(versions_ns, Version))
     def get(self):
         log.info(f"getting versions")
         return make_response(self.versionsmanager.versions)
@@ -47,7 +47,7 @@ class get_details(Resource):
         self.versionsmanager = kwargs["versions"]
         super().__init__(api, *args, **kwargs)
 
-    @versions_ns.marshal_with(resp(versions_ns, VersionDetailsData))
+    @marshal_compiled(versions_ns, resp(versions_ns, VersionDetailsData))
     def get(self):
         """
         Get Version Details
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Concurrent fan-out of the requests pushed to the partners.
+
+All pushes share one bounded thread pool. The requests of a partner are
+worked off by at most per_partner lanes, also across concurrent runs, so
+a slow partner only blocks its own lanes and the pushes to everybody
+else go on.
+
+Every run has a priority. A lane runs one job at a time and then queues
+up again, so the status updates of the sessions and connectors get the
+next free thread even while a large resync of the locations is running.
+
+Requests for the same object which are not sent yet are coalesced, so a
+burst of status PATCHes of a connector goes out as a single request.
+"""
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+from collections import deque
+
+log = logging.getLogger("ocpi")
+
+# priorities of the pushes, lower values are sent first
+HIGH, NORMAL, LOW = 0, 1, 2
+
+# methods whose requests for the same object can be merged
+COALESCED = {"PUT", "PATCH"}
+
+
+def classify(module: str, method: str) -> int:
+    """the priority of a push to a module"""
+    if module == "sessions" or method == "PATCH":
+        # session updates and status PATCHes are time critical
+        return HIGH
+    if module == "locations":
+        # full location data, e.g. a resync
+        return LOW
+    return NORMAL
+
+
+# lists of children which PATCHes merge by the key of the children
+MERGED_LISTS = {"evses": "uid", "connectors": "id"}
+
+
+def mergeBody(body: dict, patch: dict) -> dict:
+    """applies a PATCH body on top of an earlier PUT or PATCH body"""
+    merged = dict(body)
+    for name, value in patch.items():
+        key = MERGED_LISTS.get(name)
+        old = merged.get(name)
+        if key is not None and isinstance(value, list) and isinstance(old, list):
+            value = _mergeList(old, value, key)
+        merged[name] = value
+    return merged
+
+
+def _mergeList(children: list, patches: list, key: str) -> list:
+    merged = list(children)
+    positions = {child[key]: i for i, child in enumerate(merged) if child.get(key) is not None}
+    for patch in patches:
+        i = positions.get(patch.get(key))
+        if i is None:
+            if patch.get(key) is not None:
+                positions[patch[key]] = len(merged)
+            merged.append(patch)
+        else:
+            merged[i] = mergeBody(merged[i], patch)
+    return merged
+
+
+def coalesce(entries: list, key) -> list:
+    """
+    merges the PUT and PATCH requests {"method", "body", ...} for the same
+    object, key(entry) identifies the object or is None for requests not to merge.
+    A PATCH is merged into the earlier request of the object, a PUT replaces
+    it, a PATCH after a PUT stays a PUT of the merged body.
+    The merged request keeps the place and gets the highest priority of
+    them, other methods end the merging for their object.
+    Returns the remaining entries, the first entries are modified in place.
+    """
+    result = []
+    first = {}
+    for entry in entries:
+        k = key(entry)
+        if k is None or entry["method"] not in COALESCED:
+            first.pop(k, None)
+            result.append(entry)
+            continue
+        earlier = first.get(k)
+        if earlier is None:
+            first[k] = entry
+            result.append(entry)
+            continue
+        if entry["method"] == "PUT":
+            earlier["method"] = "PUT"
+            earlier["body"] = entry["body"]
+        else:
+            earlier["body"] = mergeBody(earlier["body"], entry["body"])
+        if "priority" in entry:
+            earlier["priority"] = min(earlier.get("priority", NORMAL), entry["priority"])
+    return result
+
+
+class _Batch:
+    """the results of a run, done once all its jobs ran"""
+
+    def __init__(self, jobs: dict):
+        self.results = {partner: [None] * len(partner_jobs) for partner, partner_jobs in jobs.items()}
+        self.remaining = sum(len(partner_jobs) for partner_jobs in jobs.values())
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not self.remaining:
+            self._done.set()
+
+    def finished(self):
+        with self._lock:
+            self.remaining -= 1
+            if not self.remaining:
+                self._done.set()
+
+    def wait(self) -> dict:
+        self._done.wait()
+        return self.results
+
+
+class _Lane:
+    """
+    works off the jobs of a partner, one job each time it is scheduled.
+    It takes the most urgent job of the partner, whichever run it belongs to.
+    """
+
+    def __init__(self, fanout, partner):
+        self.fanout = fanout
+        self.partner = partner
+
+    def __call__(self):
+        work = self.fanout._next(self.partner)
+        if work is None:
+            return
+        batch, index, job = work
+        try:
+            result = job()
+        except Exception as e:
+            log.exception("push job failed")
+            result = e
+        batch.results[self.partner][index] = result
+        batch.finished()
+        # back into the queue, more urgent lanes get the next free thread
+        self.fanout._reschedule(self)
+
+
+class FanOut:
+    def __init__(self, max_workers: int = 16, per_partner: int = 4):
+        self.max_workers = max_workers
+        self.per_partner = per_partner
+        self._queue = None
+        self._threads = []
+        self._pid = None
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        # partner: [number of lanes, heap of (priority, seq, batch, jobs)]
+        self._partners = {}
+        self._partners_lock = threading.Lock()
+
+    def _workers(self) -> queue.PriorityQueue:
+        # started on first use, e.g. after gunicorn forked the worker
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.PriorityQueue()
+                self._threads = []
+                self._partners = {}
+                self._pid = os.getpid()
+            if not self._threads:
+                for i in range(self.max_workers):
+                    thread = threading.Thread(
+                        target=self._work, args=(self._queue,), name=f"ocpi-push-{i}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+            return self._queue
+
+    @staticmethod
+    def _work(tasks):
+        while True:
+            _, _, lane = tasks.get()
+            if lane is None:
+                return
+            lane()
+
+    def _schedule(self, priority, lane):
+        self._workers().put((priority, next(self._seq), lane))
+
+    def _next(self, partner):
+        """(batch, index, job) of the most urgent job of the partner, None ends the lane"""
+        with self._partners_lock:
+            state = self._partners[partner]
+            pending = state[1]
+            if not pending:
+                self._endLane(partner, state)
+                return None
+            _, _, batch, jobs = pending[0]
+            index, job = jobs.popleft()
+            if not jobs:
+                heapq.heappop(pending)
+            return batch, index, job
+
+    def _reschedule(self, lane):
+        with self._partners_lock:
+            state = self._partners[lane.partner]
+            if not state[1]:
+                self._endLane(lane.partner, state)
+                return
+            priority = state[1][0][0]
+        self._schedule(priority, lane)
+
+    def _endLane(self, partner, state):
+        state[0] -= 1
+        if not state[0] and not state[1]:
+            del self._partners[partner]
+
+    def start(self, jobs: dict, priority: int = NORMAL) -> _Batch:
+        """starts the jobs like run, batch.wait() returns the results"""
+        batch = _Batch(jobs)
+        self._workers()
+        lanes = []
+        with self._partners_lock:
+            for partner, partner_jobs in jobs.items():
+                if not partner_jobs:
+                    continue
+                state = self._partners.setdefault(partner, [0, []])
+                heapq.heappush(
+                    state[1], (priority, next(self._seq), batch, deque(enumerate(partner_jobs)))
+                )
+                # the lanes of a partner are shared by all runs
+                new = min(self.per_partner - state[0], len(partner_jobs))
+                if new > 0:
+                    state[0] += new
+                    lanes.extend(_Lane(self, partner) for _ in range(new))
+        for lane in lanes:
+            self._schedule(priority, lane)
+        return batch
+
+    def run(self, jobs: dict, priority: int = NORMAL) -> dict:
+        """
+        runs {partner: [job, ...]}, where a job is a function without arguments,
+        returns {partner: [result, ...]} in the order of the jobs.
+        A job raising an exception has the exception as result.
+        Jobs of a lower priority value are started first.
+        """
+        return self.start(jobs, priority).wait()
+
+    def shutdown(self):
+        """stops the threads once the queued jobs are done"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            for _ in threads:
+                self._queue.put((float("inf"), next(self._seq), None))
+        for thread in threads:
+            thread.join()
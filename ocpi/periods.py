@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Columnar store of the charging periods of the sessions and energy rollups on it.
+
+Every CdrDimension of a charging period is a row of four columns: the
+session slot (array "i"), the start of the period in seconds since the
+epoch (array "I"), the dimension type code (array "B") and the volume
+(array "d"), 17 bytes per dimension. The location, party, currency, start
+and total_cost of a session are kept once per session slot.
+
+A session update usually resends all charging periods with one more at
+the end, so only the rows of the periods that changed are replaced. The
+rows of replaced periods are marked dead (slot -1) and dropped once they
+outnumber the live ones.
+
+The rollups filter and group all rows at once with numpy.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import threading
+from array import array
+
+from ocpi.indexes import toTimestamp
+from ocpi.models.sessions import cdr_dimension_type as DIMENSIONS
+
+import numpy as np
+
+log = logging.getLogger("ocpi")
+
+CODES = {value: code for code, value in enumerate(DIMENSIONS)}
+GROUPS = ("location", "party", "interval")
+# intervals a rollup may be split into
+MAX_INTERVALS = 100000
+# the time columns hold unsigned 32 bit seconds, earlier and later times are clamped
+MAX_TIME = 2**32 - 1
+
+
+def _seconds(value) -> int:
+    """a DateTime as seconds since the epoch within the range of the time columns"""
+    return min(max(int(toTimestamp(value)), 0), MAX_TIME)
+
+
+def _rows(period):
+    """start, dimension type codes and volumes of the rows of a charging period"""
+    codes, volumes = [], []
+    for dimension in period.get("dimensions") or ():
+        code = CODES.get(dimension.get("type"))
+        if code is not None:
+            codes.append(code)
+            volumes.append(float(dimension.get("volume") or 0))
+    return _seconds(period.get("start_date_time")), codes, volumes
+
+
+class _Names:
+    """interns strings to consecutive codes"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class ChargingPeriods:
+    def __init__(self, compact_after: int = 100000):
+        self.lock = threading.Lock()
+        self.compact_after = compact_after
+        # one row per dimension of a charging period
+        self._slot = array("i")
+        self._start = array("I")
+        self._type = array("B")
+        self._volume = array("d")
+        self._dead = 0
+        # one entry per session slot
+        self._slots = {}
+        self._location = array("i")
+        self._party = array("i")
+        self._currency = array("i")
+        self._began = array("I")
+        self._cost = array("d")
+        self.locations, self.parties, self.currencies = _Names(), _Names(), _Names()
+        # session id -> (charging periods, (first row, number of rows) per period)
+        self._rows = {}
+
+    def __len__(self):
+        return len(self._slot) - self._dead
+
+    def update(self, session_id, session: dict):
+        """takes over the charging periods and the totals of a new or changed session"""
+        location = session.get("location") or {}
+        cost = session.get("total_cost")
+        # everything is converted before the columns are touched,
+        # so a bad value cannot leave them with different lengths
+        began = _seconds(session.get("start_datetime"))
+        cost = math.nan if cost is None else float(cost)
+        periods = session.get("charging_periods") or []
+        with self.lock:
+            previous, rows = self._rows.get(session_id, ((), []))
+            # keep the rows of the periods sent unchanged again
+            kept = 0
+            if periods is not previous:
+                for old, new in zip(previous, periods):
+                    if old != new:
+                        break
+                    kept += 1
+                added = [_rows(period) for period in periods[kept:]]
+
+            slot = self._slots.get(session_id)
+            if slot is None:
+                slot = self._slots[session_id] = len(self._began)
+                for column in (self._location, self._party, self._currency, self._began):
+                    column.append(0)
+                self._cost.append(0.0)
+            self._location[slot] = self.locations.code(location.get("id"))
+            self._party[slot] = self.parties.code(
+                (session.get("country_code"), session.get("party_id"))
+            )
+            self._currency[slot] = self.currencies.code(session.get("currency"))
+            self._began[slot] = began
+            self._cost[slot] = cost
+
+            if periods is previous:
+                return
+            for first, count in rows[kept:]:
+                self._slot[first:first + count] = array("i", [-1] * count)
+                self._dead += count
+            rows = rows[:kept]
+            for start, codes, volumes in added:
+                rows.append((len(self._slot), len(codes)))
+                self._slot.extend([slot] * len(codes))
+                self._start.extend([start] * len(codes))
+                self._type.extend(codes)
+                self._volume.extend(volumes)
+            self._rows[session_id] = (periods, rows)
+            if self._dead > self.compact_after and self._dead > len(self):
+                self._compact()
+
+    def _compact(self):
+        log.debug(f"compacting charging periods, dropping {self._dead} rows")
+        columns = (array("i"), array("I"), array("B"), array("d"))
+        for session_id, (periods, rows) in self._rows.items():
+            moved = []
+            for first, count in rows:
+                moved.append((len(columns[0]), count))
+                for new, old in zip(columns, (self._slot, self._start, self._type, self._volume)):
+                    new += old[first:first + count]
+            self._rows[session_id] = (periods, moved)
+        self._slot, self._start, self._type, self._volume = columns
+        self._dead = 0
+
+    def _snapshot(self):
+        # copies, so the rollup does not block the writers
+        with self.lock:
+            return (
+                self._slot[:], self._start[:], self._type[:], self._volume[:],
+                self._location[:], self._party[:], self._currency[:], self._began[:], self._cost[:],
+            )
+
+    def rollup(self, begin: int, end: int, by=None, interval: int = 3600,
+               location_id=None, party=None) -> list:
+        """
+        energy (kWh), time and parking time (hours) of the charging periods
+        starting within [begin, end) and number and total cost by currency of
+        the sessions starting within it, grouped by location, party (country
+        code, party id), interval (start of each interval seconds long) or
+        not at all, optionally only of a location or a party.
+        Returns [(group, {"sessions", "kwh", "hours", "parking_hours", "cost"})]
+        of the groups with sessions or charging periods, intervals in order.
+        """
+        if by == "interval" and (interval <= 0 or (end - begin) / interval > MAX_INTERVALS):
+            raise ValueError(f"at most {MAX_INTERVALS} intervals are supported")
+        (slots, starts, types, volumes,
+         locations, parties, currencies, began, cost) = self._snapshot()
+        names = {"location": self.locations.values, "party": self.parties.values}.get(by)
+        wanted = {
+            "location": None if location_id is None else self.locations.codes.get(location_id, -1),
+            "party": None if party is None else self.parties.codes.get(tuple(party), -1),
+        }
+        sums = _rollup(
+            begin, end, by, interval, wanted,
+            slots, starts, types, volumes, locations, parties, currencies, began, cost,
+        )
+        result = []
+        for group in sorted(sums):
+            values = sums[group]
+            values["cost"] = {
+                self.currencies.values[code]: amount for code, amount in values["cost"].items()
+            }
+            if by == "interval":
+                group = begin + group * interval
+            elif names is not None:
+                group = names[group]
+            else:
+                group = None
+            result.append((group, values))
+        return result
+
+
+def _rollup(begin, end, by, interval, wanted,
+            slots, starts, types, volumes, locations, parties, currencies, began, cost):
+    columns = {
+        "location": np.frombuffer(locations, dtype=np.int32),
+        "party": np.frombuffer(parties, dtype=np.int32),
+    }
+    slots = np.frombuffer(slots, dtype=np.int32)
+    starts = np.frombuffer(starts, dtype=np.uint32).astype(np.int64)
+    selected = (slots >= 0) & (starts >= begin) & (starts < end)
+    session_starts = np.frombuffer(began, dtype=np.uint32).astype(np.int64)
+    session_selected = (session_starts >= begin) & (session_starts < end)
+    for name, code in wanted.items():
+        if code is not None:
+            column = columns[name]
+            selected[selected] = column[slots[selected]] == code
+            session_selected &= column == code
+    rows = np.flatnonzero(selected)
+    row_slots = slots[rows]
+    sessions = np.flatnonzero(session_selected)
+
+    def groupsOf(slot_indexes, start_values):
+        if by == "interval":
+            return (start_values - begin) // interval
+        if by in columns:
+            return columns[by][slot_indexes].astype(np.int64)
+        return np.zeros(len(slot_indexes), dtype=np.int64)
+
+    row_groups = groupsOf(row_slots, starts[rows])
+    session_groups = groupsOf(sessions, session_starts[sessions])
+    size = max(int(row_groups.max(initial=-1)), int(session_groups.max(initial=-1))) + 1
+    types = np.frombuffer(types, dtype=np.uint8)[rows]
+    volumes = np.frombuffer(volumes, dtype=np.float64)[rows]
+    totals = {}
+    for field, dimension in (("kwh", "ENERGY"), ("hours", "TIME"), ("parking_hours", "PARKING_TIME")):
+        of_type = types == CODES[dimension]
+        totals[field] = np.bincount(row_groups[of_type], weights=volumes[of_type], minlength=size)
+    counts = np.bincount(session_groups, minlength=size)
+    costs = np.frombuffer(cost, dtype=np.float64)[sessions]
+    priced = ~np.isnan(costs)
+    currency_codes = np.frombuffer(currencies, dtype=np.int32)
+    width = int(currency_codes.max(initial=-1)) + 1
+    cells = session_groups[priced] * width + currency_codes[sessions][priced]
+    by_currency = np.bincount(cells, weights=costs[priced], minlength=size * width)
+    priced_count = np.bincount(cells, minlength=size * width)
+    used = (counts > 0) | (np.bincount(row_groups, minlength=size) > 0)
+    sums = {}
+    for group in np.flatnonzero(used).tolist():
+        sums[group] = {
+            "sessions": int(counts[group]),
+            **{field: float(values[group]) for field, values in totals.items()},
+            "cost": {
+                code: float(by_currency[group * width + code])
+                for code in np.flatnonzero(priced_count[group * width:(group + 1) * width]).tolist()
+            },
+        }
+    return sums
+
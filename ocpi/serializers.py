@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Serializers compiled from the flask-restx models.
+
+flask-restx' marshal walks the fields of a model generically for every
+object. compileModel generates a plain Python function for a model
+instead, which produces exactly the output of marshal(data, model):
+simple fields are formatted inline, nested models call their own
+compiled function. Whenever the data does not look like what the
+generated code expects, or a field raises, the generic marshal is used,
+so errors stay the same as well.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Mapping
+from functools import lru_cache
+
+from flask_restx import Model, fields, marshal
+
+from ocpi.models.types import CaseInsensitiveString
+from ocpi.views import ValuesView
+
+log = logging.getLogger("ocpi")
+
+_compiled = {}
+
+# sequence types where iterating yields the same as indexing
+_sequences = (list, tuple, set, frozenset, ValuesView)
+_dict_attributes = set(dir(dict)) | set(dir(Mapping))
+
+
+def _none(key):
+    return None
+
+
+def _isPlainKey(key):
+    return (
+        isinstance(key, str) and "." not in key and key not in _dict_attributes
+    )
+
+
+class _Generator:
+    def __init__(self, model):
+        self.model = model
+        self.lines = []
+        self.namespace = {
+            "_Mapping": Mapping,
+            "_none": _none,
+            "_marshal": marshal,
+            "_sequences": _sequences,
+            "_model": model,
+        }
+        self.counter = 0
+
+    def constant(self, value, prefix="c"):
+        self.counter += 1
+        name = f"_{prefix}{self.counter}"
+        self.namespace[name] = value
+        return name
+
+    def emit(self, line, indent=1):
+        self.lines.append("    " * indent + line)
+
+    def value(self, key, field, target):
+        """emits the lines computing the output of field into target"""
+        name = field.attribute if field.attribute is not None else key
+        if getattr(field, "mask", None) or not _isPlainKey(name):
+            self.emit(f"{target} = {self.constant(field)}.output({key!r}, obj)")
+            return
+        self.emit(f"{target} = g({name!r})")
+        if isinstance(field, fields.Nested):
+            self.nested(key, field, target)
+        elif isinstance(field, fields.List):
+            self.list(key, field, target)
+        elif isinstance(field, fields.Raw) and type(field).output is fields.Raw.output:
+            self.raw(field, target)
+        else:
+            self.emit(f"{target} = {self.constant(field)}.output({key!r}, obj)")
+
+    def raw(self, field, target):
+        default = field.default
+        if callable(default):
+            c = self.constant(field)
+            missing = f"({c}.format({c}._v('default')) if {c}._v('default') else {c}._v('default'))"
+        else:
+            missing = self.constant(field.format(default) if default else default, "d")
+        self.emit(f"if {target} is None:")
+        self.emit(f"    {target} = {missing}")
+        self.emit("else:")
+        self.emit(f"    {target} = {self.format(field, target)}")
+
+    def format(self, field, value):
+        kind = type(field)
+        if kind is fields.String:
+            return f"str({value})"
+        if kind is CaseInsensitiveString:
+            return f"str({value}.upper())"
+        if kind is fields.Integer:
+            return f"int({value})"
+        if kind is fields.Float:
+            return f"float({value})"
+        if kind is fields.Boolean:
+            c = self.constant(field.format)
+            return f"({value} if {value} is True or {value} is False else {c}({value}))"
+        if kind is fields.DateTime:
+            # parsing the timestamps is expensive and its result only depends on the value
+            c = self.constant(lru_cache(maxsize=65536)(field.format))
+            return f"{c}({value})"
+        return f"{self.constant(field.format)}({value})"
+
+    def nested(self, key, field, target):
+        if field.skip_none:
+            self.emit(f"{target} = {self.constant(field)}.output({key!r}, obj)")
+            return
+        serializer = self.constant(compileModel(field.model), "s")
+        self.emit(f"if {target} is None:")
+        if field.allow_null:
+            self.emit(f"    {target} = None")
+        elif field.default is not None:
+            self.emit(f"    {target} = {self.constant(field)}.default")
+        else:
+            self.emit(f"    {target} = {serializer}(None)")
+        self.emit("else:")
+        self.emit(f"    {target} = {serializer}({target})")
+
+    def list(self, key, field, target):
+        container = field.container
+        if (
+            not isinstance(container, fields.Nested)
+            or container.skip_none
+            or container.attribute is not None
+        ):
+            self.emit(f"if {target} is not None:")
+            self.emit(f"    {target} = {self.constant(field)}.output({key!r}, obj)")
+            return
+        serializer = self.constant(compileModel(container.model), "s")
+        if container.allow_null:
+            missing = "None"
+        elif container.default is not None:
+            missing = f"{self.constant(container)}.default"
+        else:
+            missing = f"{serializer}(None)"
+        self.emit(f"if {target} is None:")
+        self.emit(f"    {target} = {self.constant(field)}._v('default')")
+        self.emit(f"elif type({target}) in _sequences:")
+        self.emit(
+            f"    {target} = [{missing} if i is None else {serializer}(i) for i in {target}]"
+        )
+        self.emit("else:")
+        self.emit(f"    {target} = {self.constant(field)}.output({key!r}, obj)")
+
+    def build(self):
+        model = self.model
+        name = "serialize_" + "".join(
+            c if c.isalnum() else "_" for c in getattr(model, "name", "fields")
+        )
+        resolved = getattr(model, "resolved", model)
+        self.emit(f"def {name}(obj):", 0)
+        self.emit("if type(obj) is dict or isinstance(obj, _Mapping):")
+        self.emit("    g = obj.get")
+        self.emit("elif obj is None:")
+        self.emit("    g = _none")
+        self.emit("elif isinstance(obj, (list, tuple)):")
+        self.emit(f"    return [{name}(o) for o in obj]")
+        self.emit("else:")
+        self.emit("    return _marshal(obj, _model)")
+        self.emit("try:")
+        start = len(self.lines)
+        targets = []
+        for index, (key, field) in enumerate(resolved.items()):
+            target = f"v{index}"
+            targets.append((key, target))
+            if isinstance(field, type):
+                field = field()
+            if isinstance(field, dict):
+                self.emit(f"{target} = {self.constant(compileModel(field), 's')}(obj)")
+            else:
+                self.value(key, field, target)
+        # the field lines belong into the try block
+        self.lines[start:] = ["    " + line for line in self.lines[start:]]
+        self.emit("except Exception:")
+        self.emit("    return _marshal(obj, _model)")
+        result = ", ".join(f"{key!r}: {target}" for key, target in targets)
+        self.emit(f"return {{{result}}}")
+        source = "\n".join(self.lines)
+        exec(compile(source, f"<serializer {name}>", "exec"), self.namespace)
+        function = self.namespace[name]
+        function.__source__ = source
+        return function
+
+
+def _generic(model):
+    def serialize(obj):
+        return marshal(obj, model)
+
+    return serialize
+
+
+def compileModel(model):
+    """
+    returns a function serializing data exactly like marshal(data, model).
+    Results are cached per model.
+    """
+    key = id(model)
+    if key in _compiled:
+        return _compiled[key][1]
+    resolved = getattr(model, "resolved", model)
+    if getattr(model, "__mask__", None) or any(
+        isinstance(field, fields.Wildcard) for field in resolved.values()
+    ):
+        serializer = _generic(model)
+    else:
+        # placeholder for self referencing models
+        _compiled[key] = (model, _generic(model))
+        serializer = _Generator(model).build()
+    # keep a reference to the model, so its id is not reused
+    _compiled[key] = (model, serializer)
+    return serializer
+
+
+def compileModels(*modules):
+    """compiles all models defined in the given modules, e.g. at startup"""
+    count = 0
+    for module in modules:
+        for value in vars(module).values():
+            if isinstance(value, Model):
+                compileModel(value)
+                count += 1
+    log.debug(f"compiled {count} serializers")
+    return count
+
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk spool for the pushes to the partners.
+
+The web workers only append the requests to the spool and return. A
+separate worker process (python -m ocpi.spool <directory>) sends them,
+retries failed ones on a schedule and moves requests which cannot be
+delivered to dead.jsonl.
+
+Layout of the spool directory:
+
+queue/<pid>.jsonl
+    appended by the web workers, one request per line.
+    A file is claimed by the worker by renaming it to claimed/.
+claimed/
+    taken over by the worker, removed once stored in pending.jsonl
+pending.jsonl
+    requests the worker still has to send, rewritten atomically
+dead.jsonl
+    requests given up, appended
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import os
+import signal
+import time
+import uuid
+
+import requests
+
+from ocpi.client import OcpiClient
+from ocpi.managers import createOcpiHeader
+from ocpi.outbound import HIGH, NORMAL, FanOut, coalesce
+
+log = logging.getLogger("ocpi")
+
+# seconds to wait before the n-th retry, a request is given up after the last one
+RETRY_SCHEDULE = (10, 30, 60, 300, 900, 3600, 3600, 3600)
+# answers worth retrying, other 4xx answers will not get better
+RETRY_STATUS = {408, 425, 429}
+
+
+class Spool:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.queue = os.path.join(directory, "queue")
+        self.claimed = os.path.join(directory, "claimed")
+        self.pending = os.path.join(directory, "pending.jsonl")
+        self.dead = os.path.join(directory, "dead.jsonl")
+        os.makedirs(self.queue, exist_ok=True)
+        os.makedirs(self.claimed, exist_ok=True)
+
+    @staticmethod
+    def request(method, url, token, body, merge=False, priority=NORMAL) -> dict:
+        """
+        a request as stored in the spool,
+        merge if the url is that of the object, so it can be coalesced
+        """
+        now = time.time()
+        return {
+            "id": uuid.uuid4().hex,
+            "method": method,
+            "url": url,
+            "token": token,
+            "body": body,
+            "merge": merge,
+            "priority": priority,
+            "created": now,
+            "attempts": 0,
+            "next": now,
+        }
+
+    # writer side, called by the web workers
+
+    def append(self, requests_: list):
+        """appends requests to the queue file of this process"""
+        if not requests_:
+            return
+        data = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in requests_)
+        path = os.path.join(self.queue, f"{os.getpid()}.jsonl")
+        while True:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    # the worker may have claimed the file since it was opened
+                    if os.fstat(fd).st_ino != os.stat(path).st_ino:
+                        continue
+                except FileNotFoundError:
+                    continue
+                os.write(fd, data.encode("utf-8"))
+                os.fsync(fd)
+                return
+            finally:
+                os.close(fd)
+
+    # worker side
+
+    def claim(self) -> list:
+        """moves the queue files to claimed/, returns all claimed files"""
+        for name in os.listdir(self.queue):
+            path = os.path.join(self.queue, name)
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                # wait for a writer still appending to the file
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                target = os.path.join(self.claimed, f"{time.time_ns()}-{name}")
+                os.rename(path, target)
+            finally:
+                os.close(fd)
+        return sorted(os.path.join(self.claimed, name) for name in os.listdir(self.claimed))
+
+    @staticmethod
+    def readLines(path) -> list:
+        entries = []
+        try:
+            with open(path, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        # a partly written last line of a crashed writer
+                        log.error(f"skipping broken line in {path}")
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def writePending(self, entries: list):
+        tmp = self.pending + ".tmp"
+        with open(tmp, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.pending)
+
+    def appendDead(self, entries: list):
+        if not entries:
+            return
+        with open(self.dead, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+
+class SpoolWorker:
+    """
+    Sends the requests of a spool. Requests to the same url are sent in
+    the order they were spooled, a later request waits while an earlier
+    one is retried.
+
+    New requests are held back for window seconds, PUTs and PATCHes of the
+    same object arriving meanwhile are coalesced into one request.
+
+    Urgent requests (outbound.HIGH) are sent first. The others are only sent
+    for round_time seconds per round, so new status updates do not wait for
+    the end of a large resync.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        client: OcpiClient = None,
+        schedule=RETRY_SCHEDULE,
+        interval: float = 1.0,
+        workers: int = 16,
+        per_partner: int = 4,
+        window: float = 2.0,
+        round_time: float = 5.0,
+    ):
+        self.spool = spool
+        self.client = client or OcpiClient()
+        self.schedule = schedule
+        self.interval = interval
+        self.window = window
+        self.round_time = round_time
+        self.fanout = FanOut(workers, per_partner)
+        self.pending = Spool.readLines(spool.pending)
+        self.running = True
+
+    def send(self, entry) -> str:
+        """sends a request, returns "sent", "retry" or "dead" """
+        try:
+            response = self.client.request(
+                entry["method"],
+                entry["url"],
+                headers=createOcpiHeader(entry["token"]),
+                json=entry["body"],
+            )
+        except requests.exceptions.RequestException as e:
+            entry["error"] = str(e)
+            return "retry"
+        if response.ok:
+            return "sent"
+        entry["error"] = f"HTTP {response.status_code} - {response.text[:200].strip()}"
+        if response.status_code >= 500 or response.status_code in RETRY_STATUS:
+            return "retry"
+        return "dead"
+
+    def _sendSequence(self, entries, now, deadline=None):
+        """
+        sends the due requests of an url in order,
+        stops at the first failure or after the deadline (time.monotonic)
+        """
+        results = []
+        for entry in entries:
+            if entry["next"] > now or (deadline is not None and time.monotonic() > deadline):
+                break
+            outcome = self.send(entry)
+            results.append((entry, outcome))
+            if outcome != "sent":
+                break
+        return results
+
+    @staticmethod
+    def _mergeKey(entry):
+        if entry.get("merge"):
+            return entry["token"], entry["url"]
+        return None
+
+    def collect(self):
+        """takes over the queued requests into pending"""
+        claimed = self.spool.claim()
+        if not claimed:
+            return
+        # claimed files left behind by a crash after pending was written
+        known = {entry["id"] for entry in self.pending}
+        for path in claimed:
+            for entry in Spool.readLines(path):
+                if entry["id"] in known:
+                    continue
+                known.add(entry["id"])
+                if entry["attempts"] == 0:
+                    entry["next"] = max(entry["next"], entry["created"] + self.window)
+                self.pending.append(entry)
+        count = len(self.pending)
+        self.pending = coalesce(self.pending, self._mergeKey)
+        if count > len(self.pending):
+            log.debug(f"coalesced {count - len(self.pending)} requests")
+        # the claimed files may only go once the requests are safe in pending
+        self.spool.writePending(self.pending)
+        for path in claimed:
+            os.remove(path)
+
+    def process(self, now=None) -> dict:
+        """sends all due requests once, returns the counts by outcome"""
+        now = time.time() if now is None else now
+        by_url = {}
+        for entry in self.pending:
+            by_url.setdefault(entry["url"], []).append(entry)
+        jobs = {}
+        deadline = time.monotonic() + self.round_time
+        for url, entries in by_url.items():
+            if entries[0]["next"] <= now:
+                # a later urgent request makes the whole sequence urgent, it is sent in order
+                priority = min(entry.get("priority", NORMAL) for entry in entries)
+                jobs.setdefault(priority, {}).setdefault(OcpiClient.partner(url), []).append(
+                    lambda entries=entries, limit=None if priority == HIGH else deadline:
+                    self._sendSequence(entries, now, limit)
+                )
+        counts = {"sent": 0, "retry": 0, "dead": 0}
+        if not jobs:
+            return counts
+        done, dead = set(), []
+        batches = [self.fanout.start(jobs[priority], priority) for priority in sorted(jobs)]
+        for results in (r for batch in batches for r in batch.wait().values()):
+            for result in results:
+                if isinstance(result, Exception):
+                    continue
+                for entry, outcome in result:
+                    if outcome == "sent":
+                        counts["sent"] += 1
+                        done.add(entry["id"])
+                        continue
+                    entry["attempts"] += 1
+                    if entry["attempts"] > len(self.schedule):
+                        outcome = "dead"
+                    counts[outcome] += 1
+                    if outcome == "dead":
+                        log.warning(f"giving up {entry['method']} {entry['url']}: {entry.get('error')}")
+                        done.add(entry["id"])
+                        dead.append(entry)
+                    else:
+                        entry["next"] = now + self.schedule[entry["attempts"] - 1]
+        self.spool.appendDead(dead)
+        self.pending = [entry for entry in self.pending if entry["id"] not in done]
+        self.spool.writePending(self.pending)
+        return counts
+
+    def run(self):
+        log.info(f"spool worker started on {self.spool.directory}, {len(self.pending)} pending")
+        while self.running:
+            try:
+                self.collect()
+                counts = self.process()
+                if any(counts.values()):
+                    log.info(f"spool: {counts}, {len(self.pending)} pending")
+            except Exception:
+                log.exception("spool worker failed")
+            time.sleep(self.interval)
+        self.fanout.shutdown()
+
+    def stop(self, *args):
+        self.running = False
+
+
+def main(argv=None):
+    import sys
+
+    argv = sys.argv[1:] if argv is None else argv
+    directory = argv[0] if argv else os.getenv("PUSH_SPOOL", "spool")
+    logging.basicConfig(level=logging.INFO)
+    worker = SpoolWorker(
+        Spool(directory),
+        window=float(os.getenv("PUSH_WINDOW", "2")),
+        round_time=float(os.getenv("PUSH_ROUND_TIME", "5")),
+    )
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Storage backends for the LocationManager and SessionManager.
+
+The managers keep their documents in plain dicts of the current process.
+A store persists every written document and hands out a monotonically
+increasing sequence number, so a manager can pick up what other worker
+processes wrote since it last looked.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger("ocpi")
+
+
+def localConnection(local: threading.local, filename: str, timeout: float) -> sqlite3.Connection:
+    """
+    the connection to the SQLite file in WAL mode kept on local. Connections
+    can neither be shared between threads nor survive a fork, so there is
+    one per thread and process.
+    """
+    con = getattr(local, "con", None)
+    if con is None or local.pid != os.getpid():
+        con = sqlite3.connect(filename, timeout=timeout)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        local.con = con
+        local.pid = os.getpid()
+    return con
+
+
+class MemoryStore:
+    """
+    Default store: the documents only exist in the managers of this process.
+    """
+
+    def __init__(self):
+        # guards the in-process documents of the manager using this store
+        self.lock = threading.RLock()
+        # numbers the writes of this process, e.g. for the change feeds
+        self._seq = 0
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            yield
+
+    def load(self):
+        """returns the current sequence number and all stored (key, document) pairs"""
+        return 0, []
+
+    def changes(self, since: int):
+        """returns (seq, key, document) for all writes after seq since"""
+        return []
+
+    def put(self, key: str, document: dict) -> int:
+        with self.lock:
+            self._seq += 1
+            return self._seq
+
+    def putMany(self, items) -> int:
+        """writes all (key, document) pairs at once, returns the last sequence number"""
+        with self.lock:
+            self._seq += len(list(items))
+            return self._seq
+
+
+class SqliteStore(MemoryStore):
+    """
+    Shares the documents of a manager between processes through a SQLite
+    table in WAL mode.
+    Writes are serialized by an immediate transaction, readers only query
+    the rows with a sequence number higher than the one they already know.
+    """
+
+    def __init__(self, filename: str, table: str, timeout: float = 30.0):
+        super().__init__()
+        if not table.isidentifier():
+            raise ValueError(f"invalid table name {table}")
+        self.filename = filename
+        self.table = table
+        self.timeout = timeout
+        self._local = threading.local()
+        con = self._connection()
+        with con:
+            con.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                "key TEXT PRIMARY KEY, "
+                "seq INTEGER NOT NULL, "
+                "document TEXT NOT NULL)"
+            )
+            con.execute(f"CREATE INDEX IF NOT EXISTS {table}_seq ON {table} (seq)")
+
+    def _connection(self):
+        return localConnection(self._local, self.filename, self.timeout)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            con = self._connection()
+            if getattr(self._local, "depth", 0):
+                self._local.depth += 1
+                try:
+                    yield
+                finally:
+                    self._local.depth -= 1
+                return
+            # take the write lock of the database right away, so the
+            # changes read inside the transaction cannot get stale
+            con.execute("BEGIN IMMEDIATE")
+            self._local.depth = 1
+            try:
+                yield
+            except BaseException:
+                con.rollback()
+                raise
+            else:
+                con.commit()
+            finally:
+                self._local.depth = 0
+
+    def load(self):
+        con = self._connection()
+        seq = con.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {self.table}").fetchone()[0]
+        rows = con.execute(
+            f"SELECT key, document FROM {self.table} WHERE seq <= ?", (seq,)
+        )
+        return seq, [(key, json.loads(document)) for key, document in rows]
+
+    def changes(self, since):
+        rows = self._connection().execute(
+            f"SELECT seq, key, document FROM {self.table} WHERE seq > ? ORDER BY seq",
+            (since,),
+        )
+        return [(seq, key, json.loads(document)) for seq, key, document in rows]
+
+    def put(self, key, document):
+        with self.transaction():
+            con = self._connection()
+            seq = con.execute(
+                f"SELECT COALESCE(MAX(seq), 0) + 1 FROM {self.table}"
+            ).fetchone()[0]
+            con.execute(
+                f"INSERT INTO {self.table} (key, seq, document) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "seq = excluded.seq, document = excluded.document",
+                (key, seq, json.dumps(document, separators=(",", ":"))),
+            )
+        return seq
+
+    def putMany(self, items):
+        items = list(items)
+        if not items:
+            return 0
+        with self.transaction():
+            con = self._connection()
+            first = con.execute(
+                f"SELECT COALESCE(MAX(seq), 0) + 1 FROM {self.table}"
+            ).fetchone()[0]
+            con.executemany(
+                f"INSERT INTO {self.table} (key, seq, document) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "seq = excluded.seq, document = excluded.document",
+                (
+                    (key, first + i, json.dumps(document, separators=(",", ":")))
+                    for i, (key, document) in enumerate(items)
+                ),
+            )
+        return first + len(items) - 1
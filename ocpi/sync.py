@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pull-sync of the locations and sessions of the registered partners.
+
+For every partner with a SENDER locations or sessions module the pages
+of objects changed since the last successful sync are fetched and stored
+in the LocationManager/SessionManager page by page. If the partner sends
+X-Total-Count and X-Limit, the remaining pages are requested concurrently,
+otherwise the Link header is followed.
+
+The time of the last successful sync of each partner and module is kept
+in a JSON file, so a sync after an outage only fetches what changed.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from ocpi.client import OcpiClient
+from ocpi.managers import createOcpiHeader
+from ocpi.models.location import Location
+from ocpi.models.sessions import Session
+from ocpi.validators import compileValidator
+
+log = logging.getLogger("ocpi")
+
+_link = re.compile(r'<([^>]*)>\s*;\s*rel="?next"?')
+
+
+def nextLink(headers) -> str | None:
+    """the url of the next page from a Link header"""
+    match = _link.search(headers.get("Link", ""))
+    return match.group(1) if match else None
+
+
+def withQuery(url: str, **params) -> str:
+    """url with the given query parameters set/replaced"""
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    query.update({key: str(value) for key, value in params.items() if value is not None})
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def dropNone(value):
+    """
+    removes null values and objects without any value. Senders (this
+    server as well) marshal absent optional fields as null or as an object
+    of nulls, which the models do not accept.
+    """
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            item = dropNone(item)
+            if item is not None and item != {}:
+                result[key] = item
+        return result
+    if isinstance(value, list):
+        return [item for item in map(dropNone, value) if item is not None]
+    return value
+
+
+class SyncClient:
+    """
+    Pulls the objects of the partners registered in credentials_manager
+    into the given managers. modules without manager are not synced.
+    """
+
+    def __init__(
+        self,
+        credentials_manager,
+        locations=None,
+        sessions=None,
+        filename: str = "ocpi_sync.json",
+        workers: int = 4,
+        limit: int = None,
+        timeout: float = 30.0,
+    ):
+        self.credentials_manager = credentials_manager
+        self.managers = {"locations": locations, "sessions": sessions}
+        self.filename = filename
+        self.workers = workers
+        self.limit = limit
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self._running = threading.Lock()
+        self.http = OcpiClient(timeout=timeout, pool_maxsize=workers)
+
+    # checkpoints
+
+    def readCheckpoints(self) -> dict:
+        """{client_url: {module: date of the last successful sync}}"""
+        try:
+            with open(self.filename, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _saveCheckpoint(self, client_url, module, date):
+        with self.lock:
+            checkpoints = self.readCheckpoints()
+            checkpoints.setdefault(client_url, {})[module] = date
+            tmp = f"{self.filename}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(checkpoints, f, indent=2)
+            os.replace(tmp, self.filename)
+
+    # fetching
+
+    def _getPage(self, url, token):
+        response = self.http.get(url, headers=createOcpiHeader(token), timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        if body.get("status_code", 1000) != 1000:
+            raise Exception(f"{url} answered with status_code {body.get('status_code')}")
+        return body.get("data") or [], response.headers
+
+    def _pages(self, url, token):
+        """yields the pages of the module, the first page decides how to continue"""
+        data, headers = self._getPage(url, token)
+        yield data
+        total, limit = headers.get("X-Total-Count"), headers.get("X-Limit")
+        if total is not None and limit is not None and int(limit) > 0:
+            # the number of pages is known, fetch the remaining ones concurrently
+            total, limit = int(total), int(limit)
+            offset = int(dict(parse_qsl(urlsplit(url).query)).get("offset", 0))
+            urls = [
+                withQuery(url, offset=o, limit=limit)
+                for o in range(offset + limit, total, limit)
+            ]
+            # at most window pages are requested ahead of the one being stored,
+            # so a slow store does not pile up all pages of a large partner in memory
+            window = self.workers * 2
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                pending = deque()
+                try:
+                    for u in urls:
+                        if len(pending) >= window:
+                            yield pending.popleft().result()[0]
+                        pending.append(pool.submit(self._getPage, u, token))
+                    # pages are stored in order
+                    while pending:
+                        yield pending.popleft().result()[0]
+                finally:
+                    for future in pending:
+                        future.cancel()
+            return
+        url = nextLink(headers)
+        while url:
+            data, headers = self._getPage(url, token)
+            yield data
+            url = nextLink(headers)
+
+    # storing
+
+    def _store(self, module, objects):
+        manager = self.managers[module]
+        model = Location if module == "locations" else Session
+        validator = compileValidator(model)
+        valid = []
+        for obj in map(dropNone, objects):
+            errors = validator.errors(obj)
+            if errors:
+                log.warning(f"skipping invalid {module} {obj.get('id')}: {errors}")
+            else:
+                valid.append(obj)
+        if module == "locations":
+            manager.putLocations(None, None, valid)
+        else:
+            for session in valid:
+                manager.createSession(
+                    session.get("country_code"), session.get("party_id"), session
+                )
+        return len(valid)
+
+    def syncModule(self, client_url, client_token, module, url) -> int:
+        """
+        fetches everything changed since the last checkpoint,
+        returns the number of stored objects
+        """
+        started = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        checkpoint = self.readCheckpoints().get(client_url, {}).get(module)
+        first = withQuery(url, date_from=checkpoint, offset=0, limit=self.limit)
+        count = 0
+        for page in self._pages(first, client_token):
+            count += self._store(module, page)
+        # only a complete sync moves the checkpoint
+        self._saveCheckpoint(client_url, module, started)
+        log.info(f"synced {count} {module} from {client_url} since {checkpoint}")
+        return count
+
+    def syncPartner(self, client_url, client_token, endpoints) -> dict:
+        """syncs all modules of a partner, returns {module: count or error}"""
+        result = {}
+        for endpoint in endpoints or []:
+            module = endpoint.get("identifier")
+            # OCPI 2.2 lists both roles, only the partner's SENDER modules have data
+            if self.managers.get(module) is None or endpoint.get("role", "SENDER") != "SENDER":
+                continue
+            try:
+                result[module] = self.syncModule(
+                    client_url, client_token, module, endpoint["url"]
+                )
+            except Exception as e:
+                log.error(f"sync of {module} from {client_url} failed: {e}")
+                result[module] = f"failed: {e}"
+        return result
+
+    @property
+    def running(self) -> bool:
+        return self._running.locked()
+
+    def syncAll(self, client_url=None) -> dict:
+        """
+        syncs all (or the given) registered partners, returns {client_url: result}.
+        Returns None if a sync is already running.
+        """
+        if not self._running.acquire(blocking=False):
+            log.info("sync is already running")
+            return None
+        try:
+            results = {}
+            for credentials in self.credentials_manager.getTokens().values():
+                url = credentials.get("client_url")
+                if not url or url in results or client_url not in (None, url):
+                    continue
+                results[url] = self.syncPartner(
+                    url, credentials.get("client_token"), credentials.get("endpoints")
+                )
+            return results
+        finally:
+            self._running.release()
+
+    def start(self, client_url=None) -> threading.Thread:
+        """runs syncAll in a background thread"""
+        thread = threading.Thread(
+            target=self.syncAll, args=(client_url,), name="ocpi-sync", daemon=True
+        )
+        thread.start()
+        return thread
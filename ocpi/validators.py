@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Request validators compiled once from the flask-restx models.
+
+For every expected payload flask-restx rebuilds the JSON schema of the
+model, creates a new Draft4Validator and resolves the $refs against the
+swagger document of the whole Api. A Session embeds a full Location,
+so this is most of the cost of a session update.
+
+compileValidator builds the schema once, with all referenced models
+inlined, and generates a plain Python function checking it. Payloads it
+rejects are validated by jsonschema again, so the error response stays
+the same. installValidators makes the models use these validators.
+"""
+
+from __future__ import annotations
+
+import logging
+from http import HTTPStatus
+from numbers import Number
+
+from flask_restx import abort
+from flask_restx.model import ModelBase
+from jsonschema import Draft4Validator
+
+log = logging.getLogger("ocpi")
+
+_validators = {}
+_missing = object()
+
+# keywords without effect on the validation (format is only checked with a format checker)
+_annotations = {"default", "description", "example", "format", "readOnly", "title"}
+
+# Draft 4 types as checked by jsonschema
+_types = {
+    "string": "isinstance({v}, str)",
+    "integer": "(isinstance({v}, int) and not isinstance({v}, bool))",
+    "number": "(isinstance({v}, _Number) and not isinstance({v}, bool))",
+    "boolean": "isinstance({v}, bool)",
+    "object": "isinstance({v}, dict)",
+    "array": "isinstance({v}, list)",
+    "null": "{v} is None",
+}
+
+
+class _Unsupported(Exception):
+    pass
+
+
+def _inlineRefs(schema, definitions, stack=()):
+    """replaces #/definitions/ references by the (inlined) referenced schema"""
+    if isinstance(schema, list):
+        return [_inlineRefs(item, definitions, stack) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    ref = schema.get("$ref")
+    if isinstance(ref, str) and ref.startswith("#/definitions/"):
+        name = ref[len("#/definitions/") :]
+        # keep references of recursive models, they are resolved by the definitions
+        if name in definitions and name not in stack:
+            return _inlineRefs(definitions[name], definitions, stack + (name,))
+        return schema
+    return {key: _inlineRefs(value, definitions, stack) for key, value in schema.items()}
+
+
+def _definitions(model, definitions=None):
+    """collects the schemas of all models referenced by model"""
+    definitions = {} if definitions is None else definitions
+    if model.name in definitions:
+        return definitions
+    definitions[model.name] = model.__schema__
+    for field in model.values():
+        field = field() if isinstance(field, type) else field
+        while hasattr(field, "container"):
+            field = field.container
+        nested = getattr(field, "model", None)
+        if isinstance(nested, ModelBase):
+            _definitions(nested, definitions)
+    for parent in model.__parents__:
+        _definitions(parent, definitions)
+    return definitions
+
+
+class _Generator:
+    """
+    generates a function returning whether data is valid against a schema.
+    Only the keywords generated by flask-restx are supported, any other
+    keyword raises _Unsupported.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.lines = []
+        self.namespace = {"_Number": Number, "_missing": _missing}
+        self.counter = 0
+
+    def constant(self, value):
+        self.counter += 1
+        name = f"_c{self.counter}"
+        self.namespace[name] = value
+        return name
+
+    def variable(self):
+        self.counter += 1
+        return f"v{self.counter}"
+
+    def emit(self, line, indent):
+        self.lines.append("    " * indent + line)
+
+    def fail(self, condition, indent):
+        self.emit(f"if {condition}:", indent)
+        self.emit("    return False", indent)
+
+    def check(self, schema, value, indent):
+        """emits the lines returning False if value does not match schema"""
+        if not isinstance(schema, dict):
+            raise _Unsupported(schema)
+        unknown = set(schema) - _annotations - {
+            "allOf", "type", "enum", "maxLength", "minLength",
+            "required", "properties", "items",
+        }
+        if unknown:
+            raise _Unsupported(unknown)
+        for subschema in schema.get("allOf", ()):
+            self.check(subschema, value, indent)
+        if "type" in schema:
+            types = schema["type"]
+            types = [types] if isinstance(types, str) else types
+            if any(t not in _types for t in types):
+                raise _Unsupported(types)
+            checks = " or ".join(_types[t].format(v=value) for t in types)
+            self.fail(f"not ({checks})", indent)
+        if "enum" in schema:
+            enum = schema["enum"]
+            if not all(isinstance(e, str) for e in enum):
+                raise _Unsupported(enum)
+            self.fail(f"not (isinstance({value}, str) and {value} in {self.constant(frozenset(enum))})", indent)
+        if "maxLength" in schema:
+            self.fail(f"isinstance({value}, str) and len({value}) > {int(schema['maxLength'])}", indent)
+        if "minLength" in schema:
+            self.fail(f"isinstance({value}, str) and len({value}) < {int(schema['minLength'])}", indent)
+        if "required" in schema or "properties" in schema:
+            mark = len(self.lines)
+            self.emit(f"if isinstance({value}, dict):", indent)
+            for name in schema.get("required", ()):
+                self.fail(f"{name!r} not in {value}", indent + 1)
+            for name, subschema in schema.get("properties", {}).items():
+                self.property(name, subschema, value, indent + 1)
+            if len(self.lines) == mark + 1:
+                del self.lines[mark:]
+        if "items" in schema:
+            if not isinstance(schema["items"], dict):
+                raise _Unsupported(schema["items"])
+            item = self.variable()
+            mark = len(self.lines)
+            self.emit(f"if isinstance({value}, list):", indent)
+            self.emit(f"    for {item} in {value}:", indent)
+            self.check(schema["items"], item, indent + 2)
+            if len(self.lines) == mark + 2:
+                del self.lines[mark:]
+
+    def property(self, name, schema, value, indent):
+        variable = self.variable()
+        mark = len(self.lines)
+        self.emit(f"{variable} = {value}.get({name!r}, _missing)", indent)
+        self.emit(f"if {variable} is not _missing:", indent)
+        self.check(schema, variable, indent + 1)
+        if len(self.lines) == mark + 2:
+            del self.lines[mark:]
+
+    def build(self, name):
+        self.emit(f"def {name}(data):", 0)
+        self.check(self.schema, "data", 1)
+        self.emit("return True", 1)
+        source = "\n".join(self.lines)
+        exec(compile(source, f"<validator {name}>", "exec"), self.namespace)
+        function = self.namespace[name]
+        function.__source__ = source
+        return function
+
+
+class CompiledValidator:
+    """
+    validates payloads against a model with a function generated from its
+    schema. Only invalid payloads go through jsonschema, for the errors.
+    """
+
+    def __init__(self, model: ModelBase):
+        self.model = model
+        definitions = _definitions(model)
+        schema = _inlineRefs(model.__schema__, definitions, (model.name,))
+        schema["definitions"] = definitions
+        Draft4Validator.check_schema(schema)
+        self.schema = schema
+        self.validator = Draft4Validator(schema)
+        name = "validate_" + "".join(c if c.isalnum() else "_" for c in model.name)
+        try:
+            self.isValid = _Generator(
+                {k: v for k, v in schema.items() if k != "definitions"}
+            ).build(name)
+        except _Unsupported as e:
+            log.debug(f"validating {model.name} with jsonschema, unsupported: {e}")
+            self.isValid = self.validator.is_valid
+
+    def validate(self, data, resolver=None, format_checker=None):
+        """same behaviour as ModelBase.validate, the resolver is not needed"""
+        if format_checker is not None:
+            return ModelBase.validate(self.model, data, resolver, format_checker)
+        if self.isValid(data):
+            return
+        abort(
+            HTTPStatus.BAD_REQUEST,
+            message="Input payload validation failed",
+            errors=self.errors(data),
+        )
+
+    def errors(self, data) -> dict:
+        """the validation errors of data by path, like flask-restx reports them"""
+        if self.isValid(data):
+            return {}
+        return dict(self.model.format_error(e) for e in self.validator.iter_errors(data))
+
+
+def compileValidator(model: ModelBase) -> CompiledValidator:
+    """returns the validator of the model, compiled on first use"""
+    validator = _validators.get(model.name)
+    if validator is None or validator.model is not model:
+        validator = CompiledValidator(model)
+        _validators[model.name] = validator
+    return validator
+
+
+def installValidators(*models: ModelBase):
+    """
+    let the models validate payloads with their compiled validator,
+    e.g. for namespaces with validate=True
+    """
+    for model in models:
+        # the instance attribute takes precedence over ModelBase.validate
+        model.validate = compileValidator(model).validate
+    log.debug(f"installed {len(models)} compiled validators")
+
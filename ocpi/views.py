@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Read only views on the locations stored by the LocationManager.
+
+The manager keeps the EVSEs of a location as a dict by uid and the
+connectors of an EVSE as a dict by id. The OCPI models expect lists,
+so the views present these dicts as lists without copying or changing
+the stored objects.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Mapping, Sequence
+
+
+class ValuesView(Sequence):
+    """
+    list-like view on the values of a dict, optionally wrapped in a view.
+    The values are only collected once they are accessed by index.
+    """
+
+    __slots__ = ("_mapping", "_wrap", "_values")
+
+    def __init__(self, mapping: dict, wrap=None):
+        self._mapping = mapping
+        self._wrap = wrap
+        self._values = None
+
+    def __len__(self):
+        return len(self._mapping)
+
+    def __iter__(self):
+        if self._wrap is None:
+            return iter(self._mapping.values())
+        return map(self._wrap, self._mapping.values())
+
+    def __getitem__(self, index):
+        if self._values is None:
+            self._values = tuple(self)
+        return self._values[index]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self)!r})"
+
+
+class DocumentView(Mapping):
+    """
+    read only view on a stored document,
+    the dicts below the keys in _lists are presented as lists
+    """
+
+    __slots__ = ("_document",)
+    _lists = {}
+
+    def __init__(self, document: dict):
+        self._document = document
+
+    def __getitem__(self, key):
+        value = self._document[key]
+        if key in self._lists and isinstance(value, dict):
+            return ValuesView(value, self._lists[key])
+        return value
+
+    def __iter__(self):
+        return iter(self._document)
+
+    def __len__(self):
+        return len(self._document)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class EvseView(DocumentView):
+    __slots__ = ()
+    _lists = {"connectors": None}
+
+
+class LocationView(DocumentView):
+    __slots__ = ()
+    _lists = {"evses": EvseView}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures: an app with the OCPI blueprint around given managers.
+"""
+
+from __future__ import annotations
+
+import base64
+import copy
+
+import pytest
+from flask import Flask
+
+import ocpi.managers as om
+from ocpi import createOcpiBlueprint
+
+TOKEN = "TESTTOKEN"
+HEADERS = {
+    "Authorization": "Token " + base64.b64encode(TOKEN.encode()).decode(),
+    "X-Request-ID": "1",
+}
+
+LOCATION = {
+    "id": "LOC1",
+    "address": "Korenmarkt 1",
+    "city": "Gent",
+    "postal_code": "9000",
+    "country": "BEL",
+    "coordinates": {"latitude": "51.05", "longitude": "3.72"},
+    "last_updated": "2024-01-01T00:00:00Z",
+    "evses": [
+        {
+            "uid": "E1",
+            "status": "AVAILABLE",
+            "last_updated": "2024-01-01T00:00:00Z",
+            "connectors": [
+                {
+                    "id": "1",
+                    "standard": "IEC_62196_T2",
+                    "format": "SOCKET",
+                    "power_type": "AC_3_PHASE",
+                    "voltage": 230,
+                    "amperage": 32,
+                    "last_updated": "2024-01-01T00:00:00Z",
+                }
+            ],
+        }
+    ],
+}
+
+
+@pytest.fixture
+def location():
+    return copy.deepcopy(LOCATION)
+
+
+@pytest.fixture
+def credentials(tmp_path, monkeypatch):
+    # the credentials manager keeps its file in the working directory
+    monkeypatch.chdir(tmp_path)
+    cm = om.CredentialsDictMan(
+        [{"role": "EMSP", "business_details": {"name": "test"}, "party_id": "SBE", "country_code": "BE"}],
+        "http://localhost/ocpi",
+    )
+    cm._updateToken(TOKEN, None, None)
+    return cm
+
+
+@pytest.fixture
+def make_client(credentials):
+    """returns a test client of an app serving the given managers as RECEIVER"""
+    apps = []
+
+    def make_client(locations=None, sessions=None, role="RECEIVER"):
+        injected = {
+            "internal": {"role": "RECEIVER", "object": None},
+            "credentials": {"role": "SENDER", "object": credentials},
+            "locations": {"role": role, "object": om.LocationManager() if locations is None else locations},
+            "sessions": {"role": role, "object": om.SessionManager() if sessions is None else sessions},
+        }
+        app = Flask(__name__)
+        app.register_blueprint(
+            createOcpiBlueprint("http://localhost/ocpi", injected, url_prefix="/ocpi")
+        )
+        apps.append(app)
+        return app.test_client()
+
+    yield make_client
+    # the namespaces are module globals, so the routes of every new blueprint
+    # are added to the apps created before, which flask refuses once they served
+    for app in apps:
+        app._got_first_request = False
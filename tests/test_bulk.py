@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The bulk upload of locations: the internal endpoint and LocationManager.putLocations.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+
+import pytest
+
+import ocpi.managers as om
+from ocpi.storage import SqliteStore
+
+from conftest import HEADERS, LOCATION
+
+URL = "/ocpi/2.1.1/internal/locations/BE/ABC"
+
+
+def location(location_id, city="Gent"):
+    location = copy.deepcopy(LOCATION)
+    location.update(id=location_id, city=city)
+    return location
+
+
+@pytest.fixture
+def manager():
+    return om.LocationManager()
+
+
+def test_json_array(make_client, manager):
+    client = make_client(locations=manager)
+    response = client.put(URL, json=[location("LOC1"), location("LOC2")], headers=HEADERS)
+    assert response.status_code == 200
+    assert response.get_json()["data"] == {"count": 2}
+    assert sorted(manager.locations) == ["LOC1", "LOC2"]
+    stored = manager.getLocation("BE", "ABC", "LOC1")
+    assert stored["country_code"] == "BE" and stored["party_id"] == "ABC"
+    assert stored["evses"][0]["connectors"][0]["id"] == "1"
+
+
+def test_ndjson(make_client, manager):
+    client = make_client(locations=manager)
+    body = "\n".join(json.dumps(location(f"LOC{i}")) for i in range(3)) + "\n\n"
+    response = client.put(
+        URL, data=body, headers={**HEADERS, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    assert response.get_json()["data"] == {"count": 3}
+    assert sorted(manager.locations) == ["LOC0", "LOC1", "LOC2"]
+
+
+@pytest.mark.parametrize(
+    "body, content_type",
+    [
+        (json.dumps([location("LOC1"), {**location("LOC2"), "coordinates": None}]), "application/json"),
+        (json.dumps(location("LOC1")) + "\n" + json.dumps({"id": "LOC2"}), "application/x-ndjson"),
+        (json.dumps(location("LOC1")) + "\n{not json", "application/x-ndjson"),
+        (json.dumps({"id": "LOC1"}), "application/json"),
+    ],
+)
+def test_nothing_stored_when_invalid(make_client, manager, body, content_type):
+    client = make_client(locations=manager)
+    response = client.put(URL, data=body, headers={**HEADERS, "Content-Type": content_type})
+    assert response.status_code == 400
+    assert manager.locations == {}
+
+
+def test_errors_name_the_location(make_client, manager):
+    client = make_client(locations=manager)
+    invalid = location("LOC2")
+    del invalid["city"]
+    response = client.put(URL, json=[location("LOC1"), invalid], headers=HEADERS)
+    assert response.status_code == 400
+    assert all(path.startswith("1") for path in response.get_json()["errors"])
+
+
+def test_last_one_wins(make_client, manager):
+    client = make_client(locations=manager)
+    locations = [location("LOC1", "Gent"), location("LOC2"), location("LOC1", "Brugge")]
+    response = client.put(URL, json=locations, headers=HEADERS)
+    assert response.get_json()["data"] == {"count": 2}
+    assert manager.getLocation("BE", "ABC", "LOC1")["city"] == "Brugge"
+
+
+def test_put_locations_shared(tmp_path):
+    filename = str(tmp_path / "store.db")
+    writer = om.LocationManager(SqliteStore(filename, "locations"))
+    reader = om.LocationManager(SqliteStore(filename, "locations"))
+    writer.putLocation("BE", "ABC", "LOC1", location("LOC1", "Gent"))
+    locations = [location("LOC1", "Antwerpen"), location("LOC2"), location("LOC1", "Brugge")]
+    assert writer.putLocations("BE", "ABC", locations) == 2
+    # replaces the stored location, the last of the duplicates wins
+    assert reader.getLocation("BE", "ABC", "LOC1")["city"] == "Brugge"
+    assert sorted(reader.locations) == ["LOC1", "LOC2"]
+    # a new manager loads the same documents
+    loaded = om.LocationManager(SqliteStore(filename, "locations"))
+    assert loaded.getLocation("BE", "ABC", "LOC1")["city"] == "Brugge"
+    assert writer.putLocations("BE", "ABC", []) == 0
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The cached location responses across worker processes sharing a store.
+"""
+
+from __future__ import annotations
+
+import threading
+
+import ocpi.managers as om
+from ocpi.cache import ResponseCache
+from ocpi.storage import SqliteStore
+
+from conftest import HEADERS
+
+URL = "/ocpi/2.1.1/locations/BE/ABC/LOC1"
+
+
+def test_write_of_other_worker_invalidates_cached_get(tmp_path, make_client, location):
+    filename = str(tmp_path / "store.db")
+    # two workers, each with its own manager and cache on the same store
+    writer = make_client(om.LocationManager(SqliteStore(filename, "locations")))
+    reader = make_client(om.LocationManager(SqliteStore(filename, "locations")))
+
+    assert writer.put(URL, json=location, headers=HEADERS).status_code == 200
+    for _ in range(2):
+        # the second GET is served from the cache
+        response = reader.get(URL + "/E1", headers=HEADERS)
+        assert response.json["data"]["status"] == "AVAILABLE"
+
+    writer.patch(
+        URL + "/E1",
+        json={"status": "CHARGING", "last_updated": "2024-01-02T00:00:00Z"},
+        headers=HEADERS,
+    )
+    assert reader.get(URL + "/E1", headers=HEADERS).json["data"]["status"] == "CHARGING"
+    assert reader.get(URL, headers=HEADERS).json["data"]["evses"][0]["status"] == "CHARGING"
+
+
+def test_value_rendered_before_a_write_is_not_kept():
+    cache = ResponseCache()
+    key = ("BE", "ABC", "LOC1", None, None)
+    generation = cache.generation("LOC1")
+    cache.invalidate("LOC1")
+    cache.set(key, b"old", generation)
+    assert cache.get(key) is None
+    cache.set(key, b"new", cache.generation("LOC1"))
+    assert cache.get(key) == b"new"
+
+
+def test_invalidate_between_check_and_store(monkeypatch):
+    cache = ResponseCache()
+    key = ("BE", "ABC", "LOC1", "E1", None)
+    generation = cache.generation("LOC1")
+    writer = threading.Thread(target=cache.invalidate, args=("LOC1", "E1"))
+    checked = cache.generation
+
+    def generation_then_write(location_id):
+        # a writer commits right after the reader checked the generation
+        value = checked(location_id)
+        if threading.current_thread() is not writer:
+            writer.start()
+            writer.join(0.2)
+        return value
+
+    monkeypatch.setattr(cache, "generation", generation_then_write)
+    cache.set(key, b"stale", generation)
+    writer.join()
+    assert cache.get(key) is None
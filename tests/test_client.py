@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The HTTP client of the pushes: retries, timeouts and the circuit breakers.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import ocpi.client as oc
+from ocpi.client import CircuitBreaker, CircuitOpenError, OcpiClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_PUT(self):
+        self.server.requests.append(self.path)
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/stall":
+            time.sleep(1.5)
+            return
+        if self.path == "/busy":
+            self.send_response(503)
+            self.send_header("Retry-After", "100")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.server_port}{path}"
+
+
+def test_read_timeout_is_not_retried(server):
+    client = OcpiClient(retries=2)
+    server.requests.clear()
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.put(url(server, "/stall"), json={}, timeout=(1, 0.3))
+    assert time.monotonic() - start < 1
+    assert server.requests == ["/stall"]
+
+
+def test_retry_after_is_capped(server):
+    client = OcpiClient(retries=2, backoff_max=0.1)
+    server.requests.clear()
+    start = time.monotonic()
+    response = client.put(url(server, "/busy"), json={})
+    assert response.status_code == 503
+    assert server.requests == ["/busy"] * 3
+    assert time.monotonic() - start < 2
+
+
+def test_push_reports_timeout(server, credentials):
+    credentials._client = OcpiClient()
+    credentials.push_timeout = (1, 0.3)
+    result = credentials._pushObject({}, "PUT", "token", url(server, "/stall"), with_path=False)
+    assert result["error"] == "timeout"
+    result = credentials._pushObject({}, "PUT", "token", url(server, "/ok"), with_path=False)
+    assert (result["status"], result["error"]) == (200, None)
+
+
+def test_sessions_per_partner():
+    client = OcpiClient()
+    first = client._get(client.partner("https://a.example/ocpi/2.1.1/locations"))
+    assert client._get(client.partner("https://a.example/ocpi/other")) == first
+    other = client._get(client.partner("https://b.example/ocpi/2.1.1/locations"))
+    assert other[0] is not first[0] and other[1] is not first[1]
+    # a forked worker does not share the connections of its parent
+    client._pid = -1
+    assert client._get("https://a.example")[0] is not first[0]
+
+
+def test_circuit_breaker(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(oc.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.failure()
+    assert breaker.state == "closed"
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] += 30
+    assert breaker.state == "half-open"
+    # a single probe is let through
+    assert breaker.allow() and not breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] += 30
+    assert breaker.allow()
+    breaker.release()
+    # the probe proved nothing, the next request probes again
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed" and breaker.allow() and breaker.allow()
+
+
+def test_open_circuit_is_not_sent(server):
+    client = OcpiClient(failure_threshold=1)
+    client.breaker(url(server, "/")).failure()
+    server.requests.clear()
+    with pytest.raises(CircuitOpenError):
+        client.put(url(server, "/ok"), json={})
+    assert server.requests == []
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The token lookups of the credentials managers, across worker processes.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+import ocpi.managers as om
+
+ROLES = [{"role": "EMSP", "business_details": {"name": "test"}, "party_id": "SBE", "country_code": "BE"}]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(om.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / "ocpi_creds.json")
+
+
+def test_tokens_of_another_process(filename):
+    first = om.CredentialsDictMan(ROLES, "http://localhost", filename=filename)
+    second = om.CredentialsDictMan(ROLES, "http://localhost", filename=filename)
+    assert first.getTokens() == {}
+    tokens = first._loadTokens()
+    # unchanged file, the index is not read again
+    assert first._loadTokens() is tokens
+
+    second._updateToken("T1", "https://partner", "C1")
+    assert first.isAuthenticated("T1")
+    assert first.getTokens()["T1"]["client_token"] == "C1"
+    second._deleteToken("T1")
+    assert not first.isAuthenticated("T1")
+
+
+def test_own_writes_clear_the_negative_cache(filename, clock):
+    manager = om.CredentialsDictMan(ROLES, "http://localhost", filename=filename)
+    assert not manager.isAuthenticated("T1")
+    manager._updateToken("T1", "https://partner", "C1")
+    assert manager.isAuthenticated("T1")
+    manager._deleteToken("T1")
+    assert not manager.isAuthenticated("T1")
+
+
+def test_negative_entries_expire(filename, clock, monkeypatch):
+    manager = om.CredentialsDictMan(ROLES, "http://localhost", filename=filename, negative_ttl=5)
+    other = om.CredentialsDictMan(ROLES, "http://localhost", filename=filename)
+    assert not manager.isAuthenticated("T1")
+    other._updateToken("T1", "https://partner", "C1")
+    with monkeypatch.context() as m:
+        # the unknown token is remembered for negative_ttl, the file is not looked at
+        m.setattr(manager, "_loadTokens", lambda: pytest.fail("tokens read"))
+        assert not manager.isAuthenticated("T1")
+    clock[0] += 5
+    assert manager.isAuthenticated("T1")
+
+
+def test_negative_cache_is_bounded(filename, clock):
+    manager = om.CredentialsDictMan(ROLES, "http://localhost", filename=filename, negative_max=3)
+    for n in range(10):
+        assert not manager.isAuthenticated(f"UNKNOWN{n}")
+        assert len(manager._negative) <= 3
+    assert "UNKNOWN9" in manager._negative
+
+
+def test_sqlite_tokens(tmp_path):
+    filename = str(tmp_path / "ocpi_creds.db")
+    manager = om.CredentialsSqliteMan(ROLES, "http://localhost", filename=filename)
+    assert manager.getTokens() == {}
+    assert not manager.isAuthenticated("T1")
+    endpoints = [{"identifier": "locations", "url": "https://partner/locations"}]
+    manager._updateToken("T1", "https://partner", "C1", endpoints)
+    manager._updateToken("T2", "https://other", "C2")
+    assert manager.isAuthenticated("T1")
+    assert manager.getTokens() == {
+        "T1": {"client_url": "https://partner", "client_token": "C1", "endpoints": endpoints},
+        "T2": {"client_url": "https://other", "client_token": "C2", "endpoints": []},
+    }
+    # upsert
+    manager._updateToken("T1", "https://partner", "C3")
+    assert manager.getTokens()["T1"] == {"client_url": "https://partner", "client_token": "C3", "endpoints": []}
+    manager._deleteToken("T1")
+    manager._deleteToken("UNKNOWN")
+    assert not manager.isAuthenticated("T1")
+    assert list(manager.getTokens()) == ["T2"]
+
+
+def test_sqlite_tokens_of_another_process(tmp_path):
+    filename = str(tmp_path / "ocpi_creds.db")
+    first = om.CredentialsSqliteMan(ROLES, "http://localhost", filename=filename)
+    second = om.CredentialsSqliteMan(ROLES, "http://localhost", filename=filename)
+    assert not first.isAuthenticated("T1")
+    second._updateToken("T1", "https://partner", "C1")
+    assert first.isAuthenticated("T1")
+    first._updateToken("T1", "https://partner", "C2")
+    assert second.getTokens()["T1"]["client_token"] == "C2"
+    second._deleteToken("T1")
+    assert not first.isAuthenticated("T1")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The JSON encoders of the responses.
+"""
+
+from __future__ import annotations
+
+import json
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+import ocpi.managers as om
+from ocpi.encoders import orjson, orjsonDumps, stdlibDumps, timestamp
+
+from conftest import LOCATION
+
+
+@pytest.fixture
+def data():
+    manager = om.LocationManager()
+    manager.putLocation("BE", "ABC", "LOC1", LOCATION)
+    return {
+        # the read-only views of the managers are Mappings and Sequences
+        "data": [manager.getLocation("BE", "ABC", "LOC1")],
+        "status_code": 1000,
+        "timestamp": timestamp(),
+        "values": {
+            "tuple": (1, 2),
+            "set": {3},
+            "date": date(2024, 1, 1),
+            "datetime": datetime(2024, 1, 1, 12, 30, 15, 250, tzinfo=timezone.utc),
+            "decimal": Decimal("1.5"),
+            "unicode": "Liège €",
+            "none": None,
+            1: "non-string key",
+        },
+    }
+
+
+def test_stdlib(data):
+    decoded = json.loads(stdlibDumps(data))
+    assert decoded["data"][0]["evses"][0]["uid"] == "E1"
+    assert decoded["values"]["datetime"] == "2024-01-01T12:30:15.000250+00:00"
+    assert decoded["values"]["decimal"] == 1.5
+    assert decoded["values"]["1"] == "non-string key"
+    with pytest.raises(TypeError):
+        stdlibDumps({"value": object()})
+
+
+@pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+def test_orjson_encodes_like_stdlib(data):
+    assert json.loads(orjsonDumps(data)) == json.loads(stdlibDumps(data))
+    with pytest.raises(TypeError):
+        orjsonDumps({"value": object()})
+
+
+def test_timestamp():
+    value = datetime.fromisoformat(timestamp())
+    assert value.tzinfo == timezone.utc
+    assert abs((datetime.now(timezone.utc) - value).total_seconds()) < 2
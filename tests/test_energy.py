@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The energy rollups of the sessions.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from conftest import HEADERS
+
+URL = "/ocpi/2.1.1/internal/sessions/energy?from=2023-12-01T00:00:00Z&to=2024-02-01T00:00:00Z"
+
+
+@pytest.fixture
+def client(make_client, location):
+    client = make_client()
+    session = {
+        "id": "S1",
+        "start_datetime": "2024-01-01T00:00:00Z",
+        "kwh": 5.5,
+        "auth_id": "A",
+        "location": location,
+        "currency": "EUR",
+        "status": "ACTIVE",
+        "last_updated": "2024-01-01T00:00:00Z",
+        "charging_periods": [
+            {
+                "start_date_time": "2024-01-01T00:00:00Z",
+                "dimensions": [{"type": "ENERGY", "volume": 3.5}, {"type": "TIME", "volume": 0.5}],
+            }
+        ],
+    }
+    client.put("/ocpi/2.1.1/sessions/BE/ABC/S1", json=session, headers=HEADERS)
+    periods = session["charging_periods"] + [
+        {"start_date_time": "2024-01-01T01:00:00Z", "dimensions": [{"type": "ENERGY", "volume": 2}]}
+    ]
+    client.patch(
+        "/ocpi/2.1.1/sessions/BE/ABC/S1",
+        json={"charging_periods": periods, "total_cost": 4.2},
+        headers=HEADERS,
+    )
+    return client
+
+
+def test_energy(client):
+    [total] = client.get(URL, headers=HEADERS).json["data"]
+    assert total["sessions"] == 1
+    assert total["kwh"] == 5.5
+    assert total["hours"] == 0.5
+    assert total["cost"] == {"EUR": 4.2}
+
+
+def test_energy_by_interval(client):
+    data = client.get(URL + "&by=interval&interval=3600", headers=HEADERS).json["data"]
+    assert [(row["begin"], row["kwh"]) for row in data] == [
+        ("2024-01-01T00:00:00+00:00", 3.5),
+        ("2024-01-01T01:00:00+00:00", 2.0),
+    ]
+    assert client.get(URL + "&by=interval&interval=1", headers=HEADERS).status_code == 400
+
+
+def test_energy_of_party(client):
+    [row] = client.get(URL + "&by=party&country_code=BE&party_id=ABC", headers=HEADERS).json["data"]
+    assert (row["country_code"], row["party_id"], row["kwh"]) == ("BE", "ABC", 5.5)
+    assert client.get(URL + "&country_code=BE", headers=HEADERS).status_code == 400
+    assert client.get(URL + "&party_id=ABC", headers=HEADERS).status_code == 400
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The Server-Sent Events change feeds.
+"""
+
+from __future__ import annotations
+
+import functools
+
+import ocpi.namespaces.internal as internal
+
+from conftest import HEADERS
+
+URL = "/ocpi/2.1.1/internal/events/locations"
+
+
+def test_stream_limit(make_client, monkeypatch):
+    monkeypatch.setattr(internal.event_streams, "limit", 1)
+    client = make_client()
+    first = client.get(URL, headers=HEADERS, buffered=False)
+    assert first.status_code == 200
+    second = client.get(URL, headers=HEADERS, buffered=False)
+    assert second.status_code == 503
+    assert second.headers["Retry-After"]
+    first.close()
+    third = client.get(URL, headers=HEADERS, buffered=False)
+    assert third.status_code == 200
+    third.close()
+    assert internal.event_streams.count == 0
+
+
+def test_stream_ends_after_lifetime(make_client, monkeypatch, location):
+    monkeypatch.setattr(
+        internal,
+        "make_event_stream",
+        functools.partial(internal.make_event_stream, lifetime=0.3, poll=0.05),
+    )
+    client = make_client()
+    client.put("/ocpi/2.1.1/locations/BE/ABC/LOC1", json=location, headers=HEADERS)
+    # reads until the server ends the stream
+    response = client.get(URL + "?since=0", headers=HEADERS)
+    body = response.data.decode()
+    response.close()
+    assert "event: location" in body
+    assert "LOC1" in body
+    assert internal.event_streams.count == 0
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The status history and its analytics against brute force.
+"""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from ocpi.history import CODES, StatusHistory, summarize
+from ocpi.models.location import status as STATUSES
+
+from conftest import HEADERS
+
+START = 1_700_000_000
+
+
+@pytest.fixture(scope="module")
+def transitions():
+    rng = random.Random(3)
+    transitions = {}
+    for key in range(40):
+        t = START + rng.randint(0, 86400)
+        for _ in range(rng.randint(0, 60)):
+            transitions.setdefault(key, []).append((t, rng.choice(STATUSES)))
+            t += rng.randint(1, 6 * 3600)
+    return transitions
+
+
+@pytest.fixture(scope="module")
+def history(transitions):
+    history = StatusHistory()
+    for key, changes in transitions.items():
+        # every fifth transition arrives late
+        late = changes[::5]
+        for t, status in changes:
+            if (t, status) not in late:
+                history.record(key, t, status)
+        for t, status in late:
+            history.record(key, t, status)
+    return history
+
+
+def periods(changes, begin, end):
+    """(start, end, status) of the status periods of a key within the window"""
+    for (t, status), following in zip(changes, changes[1:] + [(end, None)]):
+        start, stop = max(t, begin), min(following[0], end)
+        if start < stop:
+            yield start, stop, status
+
+
+WINDOWS = [(START, START + 30 * 86400), (START + 86400 + 1234, START + 2 * 86400), (0, START)]
+
+
+@pytest.mark.parametrize("begin, end", WINDOWS)
+def test_utilization(history, transitions, begin, end):
+    keys = list(range(45))
+    seconds = history.utilization(keys, begin, end)
+    for key, result in zip(keys, seconds):
+        expected = [0] * len(STATUSES)
+        for start, stop, status in periods(transitions.get(key, []), begin, end):
+            expected[CODES[status]] += stop - start
+        assert result == expected
+
+
+@pytest.mark.parametrize("begin, end", WINDOWS)
+def test_heatmap(history, transitions, begin, end):
+    busy, observed = [0] * 168, [0] * 168
+    for changes in transitions.values():
+        for start, stop, status in periods(changes, begin, end):
+            for second in range(start - start % 3600, stop, 3600):
+                seconds = min(stop, second + 3600) - max(start, second)
+                cell = ((second // 86400 + 3) % 7) * 24 + (second // 3600) % 24
+                observed[cell] += seconds
+                if status == "CHARGING":
+                    busy[cell] += seconds
+    share = history.heatmap(list(transitions), begin, end, "CHARGING")
+    for day in range(7):
+        for hour in range(24):
+            cell = day * 24 + hour
+            expected = busy[cell] / observed[cell] if observed[cell] else 0.0
+            assert share[day][hour] == pytest.approx(expected)
+
+
+def test_record_out_of_range():
+    history = StatusHistory()
+    history.record("E1", -86400, "AVAILABLE")
+    history.record("E1", 2**40, "CHARGING")
+    # clamped to the range of the time column
+    assert history.transitions("E1") == [(0, "AVAILABLE"), (2**32 - 1, "CHARGING")]
+
+
+def test_summarize():
+    seconds = [[0] * len(STATUSES) for _ in range(2)]
+    seconds[0][CODES["CHARGING"]] = 3600
+    seconds[1][CODES["AVAILABLE"]] = 1800
+    seconds[1][CODES["OUTOFORDER"]] = 1800
+    summary = summarize(seconds)
+    assert summary["observed_seconds"] == 7200
+    assert summary["charging"] == 0.5
+    assert summary["outage_minutes"] == 30
+
+
+def test_history_endpoints(make_client, location):
+    client = make_client()
+    url = "/ocpi/2.1.1/locations/BE/ABC/LOC1"
+    client.put(url, json=location, headers=HEADERS)
+    client.patch(url + "/E1", json={"status": "CHARGING", "last_updated": "2024-01-01T06:00:00Z"}, headers=HEADERS)
+    window = "from=2024-01-01T00:00:00Z&to=2024-01-01T12:00:00Z&location_id=LOC1"
+
+    data = client.get(f"/ocpi/2.1.1/internal/history/utilization?{window}", headers=HEADERS).json["data"]
+    assert (data["evses"], data["observed_seconds"], data["charging"]) == (1, 43200, 0.5)
+    assert data["seconds"]["AVAILABLE"] == data["seconds"]["CHARGING"] == 21600
+    assert data["by_evse"]["E1"]["charging"] == 0.5
+
+    data = client.get(f"/ocpi/2.1.1/internal/history/heatmap?{window}", headers=HEADERS).json["data"]
+    # 2024-01-01 was a Monday
+    assert data["status"] == "CHARGING"
+    assert data["share"][0][:12] == [0.0] * 6 + [1.0] * 6
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The in-memory secondary indexes against brute force.
+"""
+
+from __future__ import annotations
+
+import math
+import random
+
+import pytest
+
+from ocpi.indexes import EARTH_RADIUS, BitmapIndex, GeoIndex
+
+
+def distance(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+
+@pytest.fixture(scope="module")
+def points():
+    rng = random.Random(7)
+    points = {}
+    for n in range(3000):
+        # dense around Gent, sparse elsewhere and around the antimeridian
+        if n % 3 == 0:
+            points[n] = (51 + rng.uniform(-1, 1), 3.7 + rng.uniform(-1, 1))
+        elif n % 3 == 1:
+            points[n] = (rng.uniform(-60, 60), rng.choice([-1, 1]) * rng.uniform(178, 180))
+        else:
+            points[n] = (rng.uniform(-89, 89), rng.uniform(-180, 180))
+    return points
+
+
+@pytest.fixture(scope="module")
+def index(points):
+    index = GeoIndex()
+    for key, point in points.items():
+        index.update(key, point)
+    # moved and removed points
+    for key in range(0, 300, 3):
+        index.update(key, None)
+    for key in range(1, 300, 3):
+        points[key] = (points[key][0] + 0.5, points[key][1])
+        index.update(key, points[key])
+    for key in range(0, 300, 3):
+        del points[key]
+    return index
+
+
+@pytest.mark.parametrize(
+    "latitude, longitude, meters",
+    [(51.05, 3.72, 20000), (51.05, 3.72, 150000), (0, 179.9, 500000), (89.5, 0, 200000), (10, 20, 3e7)],
+)
+def test_radius(index, points, latitude, longitude, meters):
+    found = index.radius(latitude, longitude, meters)
+    expected = {
+        key for key, (lat, lon) in points.items() if distance(latitude, longitude, lat, lon) <= meters
+    }
+    assert {key for _, key in found} == expected
+    assert [d for d, _ in found] == sorted(d for d, _ in found)
+
+
+@pytest.mark.parametrize(
+    "box",
+    [(50.5, 3, 51.5, 4.5), (-30, 170, 30, -170), (-90, -180, 90, 180), (10, 10, 10.1, 10.1)],
+)
+def test_box(index, points, box):
+    lat_min, lon_min, lat_max, lon_max = box
+
+    def inside(lat, lon):
+        if lon_min <= lon_max:
+            within = lon_min <= lon <= lon_max
+        else:
+            within = lon >= lon_min or lon <= lon_max
+        return lat_min <= lat <= lat_max and within
+
+    expected = {key for key, point in points.items() if inside(*point)}
+    assert set(index.box(*box)) == expected
+    assert len(index.box(*box, limit=5)) == min(5, len(expected))
+
+
+FIELDS = {
+    "status": ["AVAILABLE", "CHARGING", "BLOCKED"],
+    "capability": ["RFID_READER", "REMOTE_START_STOP_CAPABLE", "RESERVABLE"],
+    "voltage": [110, 230, 400, None, "230"],
+}
+
+
+def brute(values, field, test):
+    return {key for key, pairs in values.items() if any(f == field and test(v) for f, v in pairs)}
+
+
+def test_bitmap_index_against_brute_force():
+    rng = random.Random(5)
+    index = BitmapIndex()
+    values = {}
+    for _ in range(3000):
+        key = rng.randint(0, 300)
+        if rng.random() < 0.2:
+            index.remove(key)
+            values.pop(key, None)
+            continue
+        pairs = {(field, rng.choice(choices)) for field, choices in FIELDS.items() for _ in range(rng.randint(0, 2))}
+        index.update(key, pairs)
+        values[key] = pairs
+
+    assert len(index) == len(values)
+    assert set(index.keys(index.all)) == set(values)
+    # freed slots are reused, so the slots do not grow beyond the keys ever present at once
+    assert len(index._keys) <= 301
+    for field, choices in FIELDS.items():
+        for value in choices:
+            assert set(index.keys(index.get(field, value))) == brute(values, field, lambda v: v == value)
+        some = choices[:2]
+        assert set(index.keys(index.anyOf(field, some))) == brute(values, field, lambda v: v in some)
+        assert set(index.keys(index.allOf(field, some))) == (
+            brute(values, field, lambda v: v == some[0]) & brute(values, field, lambda v: v == some[1])
+        )
+    for minimum in (0, 200, 400, 401):
+        assert set(index.keys(index.atLeast("voltage", minimum))) == brute(
+            values, "voltage", lambda v: isinstance(v, int) and v >= minimum
+        )
+    assert index.allOf("status", []) == index.all
+    keys = index.keys(index.all)
+    assert index.keys(index.all, limit=5) == keys[:5]
+
+
+def test_bitmap_slot_reuse():
+    index = BitmapIndex()
+    index.update("a", [("status", "AVAILABLE")])
+    index.update("b", [("status", "AVAILABLE")])
+    index.remove("a")
+    index.remove("a")
+    assert index.keys(index.get("status", "AVAILABLE")) == ["b"]
+    index.update("c", [("status", "CHARGING")])
+    # c took the slot of a, which lost all its values
+    assert index._slots["c"] == 0
+    assert index.keys(index.get("status", "AVAILABLE")) == ["b"]
+    assert index.keys(index.all) == ["c", "b"]
+    assert index._bitmaps.keys() == {("status", "AVAILABLE"), ("status", "CHARGING")}
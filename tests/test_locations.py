@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The LocationManager: date windows, merges of patches and the stored documents.
+"""
+
+from __future__ import annotations
+
+import copy
+
+import pytest
+
+import ocpi.managers as om
+
+from conftest import LOCATION
+
+
+def stored(location_id, last_updated, **values):
+    location = copy.deepcopy(LOCATION)
+    location.update(id=location_id, last_updated=last_updated, **values)
+    return location
+
+
+@pytest.fixture
+def manager():
+    manager = om.LocationManager()
+    for day in range(1, 6):
+        location_id = f"LOC{day}"
+        manager.putLocation("BE", "ABC", location_id, stored(location_id, f"2024-01-0{day}T00:00:00Z"))
+    return manager
+
+
+@pytest.mark.parametrize(
+    "begin, end, expected",
+    [
+        (None, None, ["LOC1", "LOC2", "LOC3", "LOC4", "LOC5"]),
+        ("2024-01-03T00:00:00Z", None, ["LOC3", "LOC4", "LOC5"]),
+        (None, "2024-01-03T00:00:00Z", ["LOC1", "LOC2"]),
+        ("2024-01-02T00:00:00Z", "2024-01-04T00:00:00Z", ["LOC2", "LOC3"]),
+        ("2025-01-01T00:00:00Z", None, []),
+    ],
+)
+def test_date_window(manager, begin, end, expected):
+    locations, headers = manager.getLocations(begin, end, 0, 10)
+    assert [location["id"] for location in locations] == expected
+    assert headers["X-Total-Count"] == len(expected)
+    assert [location["id"] for location in manager.iterLocations(begin, end, batch=2)] == expected
+
+
+def test_date_window_pages(manager):
+    locations, headers = manager.getLocations(None, None, 3, 10)
+    assert [location["id"] for location in locations] == ["LOC4", "LOC5"]
+    assert headers["X-Total-Count"] == 5
+
+
+def test_patch_with_evses_keeps_them_by_uid(manager):
+    manager.patchLocation(
+        "BE", "ABC", "LOC1",
+        {"evses": [{"uid": "E1", "status": "CHARGING", "connectors": [{"id": "1", "amperage": 16}]}]},
+    )
+    evse = manager.getEVSE("BE", "ABC", "LOC1", "E1")
+    assert evse["status"] == "CHARGING"
+    connector = manager.getConnector("BE", "ABC", "LOC1", "E1", "1")
+    # merged into the connector, not replacing it
+    assert (connector["amperage"], connector["voltage"]) == (16, 230)
+    assert isinstance(manager.locations["LOC1"]["evses"], dict)
+    assert isinstance(manager.locations["LOC1"]["evses"]["E1"]["connectors"], dict)
+
+
+def test_patch_adds_new_evses_and_connectors(manager):
+    manager.patchLocation(
+        "BE", "ABC", "LOC1",
+        {"evses": [{"uid": "E2", "status": "AVAILABLE", "connectors": [{"id": "9", "voltage": 400}]}]},
+    )
+    manager.patchEVSE("BE", "ABC", "LOC1", "E1", {"connectors": [{"id": "2", "voltage": 110}]})
+    assert set(manager.locations["LOC1"]["evses"]) == {"E1", "E2"}
+    assert manager.getConnector("BE", "ABC", "LOC1", "E2", "9")["voltage"] == 400
+    assert set(manager.locations["LOC1"]["evses"]["E1"]["connectors"]) == {"1", "2"}
+    assert manager.getConnector("BE", "ABC", "LOC1", "E1", "2")["voltage"] == 110
+    assert manager.getConnector("BE", "ABC", "LOC1", "E1", "1")["voltage"] == 230
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        {"evses": [{"status": "CHARGING"}]},
+        {"evses": [{"uid": "E1", "connectors": [{"voltage": 110}]}]},
+    ],
+)
+def test_patch_without_uid_or_id(manager, patch):
+    before = manager.locations["LOC1"]
+    with pytest.raises(om.InvalidMissingParamsError):
+        manager.patchLocation("BE", "ABC", "LOC1", patch)
+    assert manager.locations["LOC1"] is before
+
+
+def test_last_updated_moves_up(manager):
+    def ids():
+        return [location["id"] for location in manager.getLocations(None, None, 0, 10)[0]]
+
+    manager.patchConnector("BE", "ABC", "LOC1", "E1", "1", {"last_updated": "2024-02-01T00:00:00Z"})
+    assert manager.getEVSE("BE", "ABC", "LOC1", "E1")["last_updated"] == "2024-02-01T00:00:00Z"
+    assert manager.getLocation("BE", "ABC", "LOC1")["last_updated"] == "2024-02-01T00:00:00Z"
+    assert ids() == ["LOC2", "LOC3", "LOC4", "LOC5", "LOC1"]
+
+    manager.patchLocation(
+        "BE", "ABC", "LOC2",
+        {"evses": [{"uid": "E1", "connectors": [{"id": "1", "last_updated": "2024-03-01T00:00:00Z"}]}]},
+    )
+    assert manager.getEVSE("BE", "ABC", "LOC2", "E1")["last_updated"] == "2024-03-01T00:00:00Z"
+    assert manager.getLocation("BE", "ABC", "LOC2")["last_updated"] == "2024-03-01T00:00:00Z"
+    assert ids() == ["LOC3", "LOC4", "LOC5", "LOC1", "LOC2"]
+
+    # an older child does not move the parent back
+    manager.patchEVSE("BE", "ABC", "LOC3", "E1", {"last_updated": "2023-01-01T00:00:00Z"})
+    assert manager.getLocation("BE", "ABC", "LOC3")["last_updated"] == "2024-01-03T00:00:00Z"
+    assert ids()[0] == "LOC3"
+
+
+def matching(manager, status=(), capabilities=(), standard=(), min_voltage=None):
+    """[(location_id, uid)] of the EVSEs matching, by scanning all locations"""
+    found = set()
+    for location_id, location in manager.locations.items():
+        for uid, evse in location["evses"].items():
+            connectors = list((evse.get("connectors") or {}).values())
+            if status and evse.get("status") not in status:
+                continue
+            if not set(capabilities) <= set(evse.get("capabilities") or []):
+                continue
+            if standard and not any(c.get("standard") in standard for c in connectors):
+                continue
+            if min_voltage is not None and not any((c.get("voltage") or 0) >= min_voltage for c in connectors):
+                continue
+            found.add((location_id, uid))
+    return found
+
+
+CRITERIA = [
+    {},
+    {"status": ["AVAILABLE"]},
+    {"status": ["CHARGING", "BLOCKED"]},
+    {"capabilities": ["RFID_READER", "RESERVABLE"]},
+    {"standard": ["CHADEMO"], "min_voltage": 400},
+    {"status": ["AVAILABLE"], "min_voltage": 231},
+]
+
+
+def test_find_evses_follows_the_writes(manager):
+    def check():
+        for criteria in CRITERIA:
+            found = {(location_id, evse["uid"]) for location_id, evse in manager.findEvses(**criteria)}
+            assert found == matching(manager, **criteria), criteria
+
+    check()
+    evse = copy.deepcopy(LOCATION["evses"][0])
+    evse.update(uid="E2", status="CHARGING", capabilities=["RFID_READER", "RESERVABLE"])
+    manager.putEVSE("BE", "ABC", "LOC1", "E2", evse)
+    check()
+    manager.patchEVSE("BE", "ABC", "LOC2", "E1", {"status": "BLOCKED", "capabilities": ["RFID_READER"]})
+    check()
+    manager.patchConnector("BE", "ABC", "LOC3", "E1", "1", {"standard": "CHADEMO", "voltage": 500})
+    check()
+    manager.patchEVSE(
+        "BE", "ABC", "LOC3", "E1", {"connectors": [{"id": "2", "standard": "IEC_62196_T2", "voltage": 400}]}
+    )
+    check()
+    # replacing a location drops the EVSEs it no longer has
+    manager.putLocation("BE", "ABC", "LOC1", stored("LOC1", "2024-01-01T00:00:00Z", evses=[]))
+    check()
+    assert {location_id for location_id, _ in manager.findEvses()} == {"LOC2", "LOC3", "LOC4", "LOC5"}
+    assert len(manager.findEvses(limit=2)) == 2
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lists streamed as NDJSON and the batched iteration behind them.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+
+import pytest
+
+import ocpi.managers as om
+
+from conftest import HEADERS, LOCATION
+
+
+def stored(location_id, day):
+    location = copy.deepcopy(LOCATION)
+    location.update(id=location_id, last_updated=f"2024-01-{day:02d}T00:00:00Z")
+    return location
+
+
+@pytest.fixture
+def manager():
+    manager = om.LocationManager()
+    for day in range(1, 8):
+        manager.putLocation("BE", "ABC", f"LOC{day}", stored(f"LOC{day}", day))
+    return manager
+
+
+def lines(response):
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    body = response.get_data(as_text=True)
+    assert body.endswith("\n")
+    return [json.loads(line) for line in body.splitlines()]
+
+
+@pytest.mark.parametrize(
+    "query, headers",
+    [
+        ("?stream=true", {}),
+        ("", {"Accept": "application/x-ndjson"}),
+        ("?limit=2&offset=3", {"Accept": "application/x-ndjson"}),
+    ],
+)
+def test_stream_locations(make_client, manager, query, headers):
+    client = make_client(locations=manager, role="SENDER")
+    response = client.get("/ocpi/2.1.1/locations/" + query, headers={**HEADERS, **headers})
+    # one location per line, all of them in order, offset and limit are ignored
+    locations = lines(response)
+    assert [location["id"] for location in locations] == [f"LOC{day}" for day in range(1, 8)]
+    assert locations[0]["evses"][0]["uid"] == "E1"
+    assert locations[0]["evses"][0]["connectors"][0]["voltage"] == 230
+
+
+def test_stream_date_window(make_client, manager):
+    client = make_client(locations=manager, role="SENDER")
+    response = client.get(
+        "/ocpi/2.1.1/locations/?stream=true&date_from=2024-01-03T00:00:00Z&date_to=2024-01-05T00:00:00Z",
+        headers=HEADERS,
+    )
+    assert [location["id"] for location in lines(response)] == ["LOC3", "LOC4"]
+
+
+def test_page_without_stream(make_client, manager):
+    client = make_client(locations=manager, role="SENDER")
+    response = client.get("/ocpi/2.1.1/locations/?limit=2", headers={**HEADERS, "Accept": "application/json"})
+    assert response.mimetype == "application/json"
+    assert [location["id"] for location in response.get_json()["data"]] == ["LOC1", "LOC2"]
+
+
+def test_stream_sessions(make_client):
+    sessions = om.SessionManager()
+    for day in (1, 2):
+        sessions.createSession(
+            "BE",
+            "ABC",
+            {
+                "id": f"S{day}",
+                "start_datetime": f"2024-01-0{day}T00:00:00Z",
+                "kwh": 1.0,
+                "auth_id": "A1",
+                "location": copy.deepcopy(LOCATION),
+                "currency": "EUR",
+                "status": "ACTIVE",
+                "last_updated": f"2024-01-0{day}T00:00:00Z",
+            },
+        )
+    client = make_client(sessions=sessions, role="SENDER")
+    response = client.get("/ocpi/2.1.1/sessions/", headers={**HEADERS, "Accept": "application/x-ndjson"})
+    assert [session["id"] for session in lines(response)] == ["S1", "S2"]
+
+
+def test_iterate_while_changed(manager):
+    locations = manager.iterLocations(None, None, batch=2)
+    seen = [next(locations)["id"] for _ in range(3)]
+    assert seen == ["LOC1", "LOC2", "LOC3"]
+    # an already yielded location moved to the end, a new one and
+    # one not yet yielded moved within the remaining range
+    manager.patchLocation("BE", "ABC", "LOC2", {"last_updated": "2024-01-20T00:00:00Z"})
+    manager.putLocation("BE", "ABC", "LOC8", stored("LOC8", 10))
+    manager.patchLocation("BE", "ABC", "LOC5", {"last_updated": "2024-01-15T00:00:00Z"})
+    rest = list(locations)
+    assert [location["id"] for location in rest] == ["LOC4", "LOC6", "LOC7", "LOC8", "LOC5", "LOC2"]
+    # the versions read after the change
+    assert rest[-1]["last_updated"] == "2024-01-20T00:00:00Z"
+    assert rest[-2]["last_updated"] == "2024-01-15T00:00:00Z"
+
+
+@pytest.mark.parametrize("batch", [1, 2, 3, 7, 100])
+def test_iterate_in_batches(manager, batch):
+    ids = [location["id"] for location in manager.iterLocations("2024-01-02T00:00:00Z", None, batch=batch)]
+    assert ids == [f"LOC{day}" for day in range(2, 8)]
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The fan-out and the coalescing of the pushes to the partners.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+import requests
+
+from ocpi.outbound import HIGH, LOW, NORMAL, FanOut, classify, coalesce, mergeBody
+from ocpi.spool import Spool, SpoolWorker
+
+
+@pytest.fixture
+def fanout():
+    fanout = FanOut(max_workers=8, per_partner=2)
+    yield fanout
+    fanout.shutdown()
+
+
+def test_results_in_order(fanout):
+    def job(value):
+        def run():
+            # later jobs finish first
+            time.sleep(0.01 * (5 - value % 5))
+            if value == 3:
+                raise ValueError("boom")
+            return value
+
+        return run
+
+    results = fanout.run({"a": [job(i) for i in range(10)], "b": [job(7)], "c": []})
+    assert results["a"][:3] == [0, 1, 2]
+    assert isinstance(results["a"][3], ValueError)
+    assert results["a"][4:] == list(range(4, 10))
+    assert results == {"a": results["a"], "b": [7], "c": []}
+
+
+def test_lanes_per_partner_across_runs(fanout):
+    active = {"a": 0, "b": 0}
+    most = {"a": 0, "b": 0}
+    lock = threading.Lock()
+
+    def job(partner):
+        def run():
+            with lock:
+                active[partner] += 1
+                most[partner] = max(most[partner], active[partner])
+            time.sleep(0.02)
+            with lock:
+                active[partner] -= 1
+            return partner
+
+        return run
+
+    # concurrent runs, e.g. of two request threads of a worker
+    runs = [
+        threading.Thread(target=fanout.run, args=({"a": [job("a")] * 6, "b": [job("b")] * 6},))
+        for _ in range(3)
+    ]
+    for run in runs:
+        run.start()
+    for run in runs:
+        run.join()
+    assert most == {"a": 2, "b": 2}
+    assert fanout._partners == {}
+
+
+def test_send_to_module_summary(credentials, monkeypatch):
+    for n in (1, 2):
+        credentials._updateToken(
+            f"TOKEN{n}",
+            f"https://partner{n}.example",
+            f"CLIENT{n}",
+            [{"identifier": "locations", "url": f"https://partner{n}.example/locations"}],
+        )
+
+    def push(obj, method, token, endpoint_url, with_path=True):
+        if token == "CLIENT2" and obj["id"] == "LOC2":
+            return {"url": endpoint_url, "method": method, "status": 500, "error": "HTTP 500"}
+        if obj["id"] == "LOC3":
+            raise RuntimeError("broken")
+        return {"url": endpoint_url, "method": method, "status": 200, "error": None}
+
+    monkeypatch.setattr(credentials, "_pushObject", push)
+    objects = [{"country_code": "BE", "party_id": "ABC", "id": f"LOC{i}"} for i in (1, 2, 3)]
+    summary = credentials.sendToModule(objects, "locations")
+    assert (summary["sent"], summary["failed"]) == (3, 3)
+    assert set(summary["results"]) == {"https://partner1.example", "https://partner2.example"}
+    results = summary["results"]["https://partner2.example"]
+    assert [r["error"] for r in results[:2]] == [None, "HTTP 500"]
+    assert isinstance(results[2], RuntimeError)
+
+
+def entries(*requests_):
+    return [{"method": method, "body": body, "id": n} for n, (method, body) in enumerate(requests_)]
+
+
+def key(entry):
+    return entry["body"].get("id")
+
+
+def test_patches_are_merged():
+    merged = coalesce(
+        entries(("PATCH", {"id": "E1", "status": "CHARGING"}), ("PATCH", {"id": "E1", "status": "AVAILABLE", "x": 1})),
+        key,
+    )
+    assert merged == [{"method": "PATCH", "body": {"id": "E1", "status": "AVAILABLE", "x": 1}, "id": 0}]
+
+
+def test_put_supersedes_patches():
+    merged = coalesce(
+        entries(("PATCH", {"id": "L1", "a": 1}), ("PATCH", {"id": "L1", "b": 2}), ("PUT", {"id": "L1", "c": 3})),
+        key,
+    )
+    assert [(e["method"], e["body"]) for e in merged] == [("PUT", {"id": "L1", "c": 3})]
+
+
+def test_patch_after_put_stays_put():
+    merged = coalesce(entries(("PUT", {"id": "L1", "a": 1}), ("PATCH", {"id": "L1", "b": 2})), key)
+    assert [(e["method"], e["body"]) for e in merged] == [("PUT", {"id": "L1", "a": 1, "b": 2})]
+
+
+def test_children_are_merged_by_uid_and_id():
+    body = {
+        "id": "L1",
+        "evses": [
+            {"uid": "E1", "status": "AVAILABLE", "connectors": [{"id": "1", "voltage": 230}, {"id": "2"}]},
+            {"uid": "E2", "status": "AVAILABLE"},
+        ],
+    }
+    patch = {
+        "id": "L1",
+        "evses": [
+            {"uid": "E1", "status": "CHARGING", "connectors": [{"id": "1", "amperage": 32}, {"id": "3"}]},
+            {"uid": "E3", "status": "BLOCKED"},
+        ],
+    }
+    assert mergeBody(body, patch)["evses"] == [
+        {
+            "uid": "E1",
+            "status": "CHARGING",
+            "connectors": [{"id": "1", "voltage": 230, "amperage": 32}, {"id": "2"}, {"id": "3"}],
+        },
+        {"uid": "E2", "status": "AVAILABLE"},
+        {"uid": "E3", "status": "BLOCKED"},
+    ]
+    # the earlier body is not changed
+    assert body["evses"][0]["status"] == "AVAILABLE"
+    # other lists are replaced
+    assert mergeBody({"images": [1, 2]}, {"images": [3]}) == {"images": [3]}
+
+
+def test_other_methods_end_the_merge():
+    merged = coalesce(
+        entries(
+            ("PATCH", {"id": "L1", "a": 1}),
+            ("POST", {"id": "L1"}),
+            ("PATCH", {"id": "L1", "b": 2}),
+            ("PATCH", {"id": "L2", "c": 3}),
+            ("PATCH", {"id": "L1", "d": 4}),
+            ("PATCH", {"e": 5}),
+            ("PATCH", {"e": 6}),
+        ),
+        key,
+    )
+    assert [(e["method"], e["body"]) for e in merged] == [
+        ("PATCH", {"id": "L1", "a": 1}),
+        ("POST", {"id": "L1"}),
+        ("PATCH", {"id": "L1", "b": 2, "d": 4}),
+        ("PATCH", {"id": "L2", "c": 3}),
+        # without a key nothing is merged
+        ("PATCH", {"e": 5}),
+        ("PATCH", {"e": 6}),
+    ]
+
+
+def test_merged_request_gets_the_highest_priority():
+    requests_ = entries(("PUT", {"id": "L1"}), ("PATCH", {"id": "L1", "status": "CHARGING"}))
+    requests_[0]["priority"], requests_[1]["priority"] = LOW, HIGH
+    [merged] = coalesce(requests_, key)
+    assert merged["priority"] == HIGH
+
+
+def test_coalesce_objects_of_a_push(credentials):
+    objects = [
+        {"country_code": "BE", "party_id": "ABC", "id": "L1", "evses": [{"uid": "E1", "status": "AVAILABLE"}]},
+        {"country_code": "BE", "party_id": "ABC", "id": "L2"},
+        {"country_code": "BE", "party_id": "ABC", "id": "L1", "evses": [{"uid": "E1", "status": "CHARGING"}]},
+    ]
+    assert credentials._coalesceObjects(objects, "PATCH") == [
+        {"country_code": "BE", "party_id": "ABC", "id": "L1", "evses": [{"uid": "E1", "status": "CHARGING"}]},
+        objects[1],
+    ]
+    # without the path the objects are sent to the url of the module, one by one
+    assert credentials._coalesceObjects(objects, "PATCH", with_path=False) == objects
+
+
+def test_classify():
+    assert classify("sessions", "PUT") == HIGH
+    assert classify("locations", "PATCH") == HIGH
+    assert classify("locations", "PUT") == LOW
+    assert classify("tariffs", "PUT") == NORMAL
+
+
+@pytest.mark.parametrize("high_partner", ["a", "b"])
+def test_high_runs_ahead_of_a_queued_resync(high_partner):
+    fanout = FanOut(max_workers=1, per_partner=1)
+    started, release = threading.Event(), threading.Event()
+    order = []
+
+    def blocked():
+        started.set()
+        release.wait(5)
+        order.append("low")
+
+    def job(name):
+        return lambda: order.append(name)
+
+    resync = fanout.start({"a": [blocked] + [job("low")] * 3}, LOW)
+    started.wait(5)
+    # a status update arrives while the single thread is busy with the resync
+    update = fanout.start({high_partner: [job("high")]}, HIGH)
+    release.set()
+    update.wait()
+    resync.wait()
+    fanout.shutdown()
+    assert order == ["low", "high", "low", "low", "low"]
+
+
+def test_spool_round_time_only_limits_normal_work(tmp_path):
+    spool = Spool(str(tmp_path))
+    for url, priority in [("https://p/resync", LOW), ("https://p/status", HIGH)]:
+        requests_ = [Spool.request("PUT", url, "token", {}, priority=priority) for _ in range(3)]
+        spool.append(requests_)
+
+    class Client:
+        def request(self, method, url, **kwargs):
+            response = requests.Response()
+            response.status_code = 200
+            return response
+
+    # the round is over before it started
+    worker = SpoolWorker(spool, Client(), window=0, round_time=-1)
+    worker.collect()
+    assert worker.process(now=time.time() + 1)["sent"] == 3
+    assert {entry["url"] for entry in worker.pending} == {"https://p/resync"}
+    worker.round_time = 5
+    assert worker.process(now=time.time() + 1)["sent"] == 3
+    worker.fanout.shutdown()
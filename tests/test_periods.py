@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The columns of the charging periods and their rollups against brute force.
+"""
+
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from ocpi.periods import ChargingPeriods
+
+START = 1_700_000_000
+FIELDS = {"ENERGY": "kwh", "TIME": "hours", "PARKING_TIME": "parking_hours"}
+
+
+def period(start, energy):
+    return {
+        "start_date_time": start,
+        "dimensions": [
+            {"type": "ENERGY", "volume": energy},
+            {"type": "TIME", "volume": 0.25},
+            {"type": "PARKING_TIME", "volume": 0.1},
+            {"type": "FLAT", "volume": 1},
+        ],
+    }
+
+
+@pytest.fixture(scope="module")
+def sessions():
+    return {}
+
+
+@pytest.fixture(scope="module")
+def periods(sessions):
+    """sessions updated the way a CPO does: appending, correcting and resending periods"""
+    rng = random.Random(3)
+    periods = ChargingPeriods(compact_after=50)
+    for _ in range(3000):
+        session_id = rng.randint(0, 150)
+        session = sessions.get(session_id) or {
+            "start_datetime": START + rng.randint(0, 30 * 86400),
+            "location": {"id": f"LOC{session_id % 7}"},
+            "country_code": "BE",
+            "party_id": f"P{session_id % 3}",
+            "currency": rng.choice(["EUR", "CHF"]),
+            "charging_periods": [],
+        }
+        session = dict(session)
+        if rng.random() < 0.3:
+            session["total_cost"] = round(rng.random() * 10, 2)
+        charging_periods = list(session["charging_periods"])
+        if charging_periods and rng.random() < 0.3:
+            charging_periods[-1] = period(charging_periods[-1]["start_date_time"], rng.random())
+        elif charging_periods and rng.random() < 0.05:
+            charging_periods = charging_periods[:1]
+        else:
+            last = charging_periods[-1]["start_date_time"] if charging_periods else session["start_datetime"]
+            charging_periods.append(period(last + 900, rng.random()))
+        session["charging_periods"] = charging_periods
+        sessions[session_id] = session
+        periods.update(session_id, session)
+    return periods
+
+
+def brute(sessions, begin, end, by, interval, location_id=None, party=None):
+    result = {}
+
+    def values(session, t):
+        group = {
+            "location": session["location"]["id"],
+            "party": (session["country_code"], session["party_id"]),
+            "interval": begin + (t - begin) // (interval or 1) * interval,
+        }.get(by)
+        return result.setdefault(
+            group, {"sessions": 0, "kwh": 0.0, "hours": 0.0, "parking_hours": 0.0, "cost": {}}
+        )
+
+    for session in sessions.values():
+        if location_id is not None and session["location"]["id"] != location_id:
+            continue
+        if party is not None and (session["country_code"], session["party_id"]) != party:
+            continue
+        for charging_period in session["charging_periods"]:
+            t = charging_period["start_date_time"]
+            if begin <= t < end:
+                for dimension in charging_period["dimensions"]:
+                    if dimension["type"] in FIELDS:
+                        values(session, t)[FIELDS[dimension["type"]]] += dimension["volume"]
+        t = session["start_datetime"]
+        if begin <= t < end:
+            group = values(session, t)
+            group["sessions"] += 1
+            if "total_cost" in session:
+                cost = group["cost"]
+                cost[session["currency"]] = cost.get(session["currency"], 0) + session["total_cost"]
+    return result
+
+
+@pytest.mark.parametrize(
+    "by, interval, location_id, party",
+    [
+        (None, 0, None, None),
+        ("location", 0, None, None),
+        ("party", 0, None, None),
+        ("interval", 86400, None, None),
+        ("interval", 3600, "LOC2", None),
+        ("location", 0, None, ("BE", "P1")),
+        (None, 0, "nope", None),
+    ],
+)
+@pytest.mark.parametrize("begin, end", [(START, START + 40 * 86400), (START + 5 * 86400, START + 9 * 86400)])
+def test_rollup(periods, sessions, begin, end, by, interval, location_id, party):
+    result = dict(periods.rollup(begin, end, by, interval, location_id, party))
+    expected = brute(sessions, begin, end, by, interval, location_id, party)
+    assert result.keys() == expected.keys()
+    for group, values in expected.items():
+        assert result[group]["sessions"] == values["sessions"]
+        for field in FIELDS.values():
+            assert result[group][field] == pytest.approx(values[field])
+        assert result[group]["cost"] == pytest.approx(values["cost"])
+
+
+def test_replaced_periods_are_compacted():
+    periods = ChargingPeriods(compact_after=5)
+    session = {"start_datetime": START, "currency": "EUR", "location": {"id": "LOC1"}}
+    for session_id in range(10):
+        periods.update(
+            session_id,
+            {**session, "charging_periods": [period(START + i, 1.0) for i in range(5)]},
+        )
+    for session_id in range(10):
+        periods.update(
+            session_id,
+            {**session, "charging_periods": [period(START, 1.0), period(START + 1, 2.0)]},
+        )
+    # 4 rows per period, the rows of the first periods were kept
+    assert len(periods) == 80
+    # without compaction there were 240 rows, 160 of them dead
+    assert len(periods._slot) < 240
+    [(_, values)] = periods.rollup(START, START + 10)
+    assert values["kwh"] == 30.0
+    assert values["sessions"] == 10
+
+
+def test_times_out_of_range_are_clamped():
+    periods = ChargingPeriods()
+    before_1970 = "1960-01-01T00:00:00Z"
+    periods.update(
+        "S1",
+        {"start_datetime": before_1970, "currency": "EUR", "charging_periods": [period(before_1970, 1.5)]},
+    )
+    with pytest.raises(ValueError):
+        periods.update("S2", {"start_datetime": "not a date", "charging_periods": [period(START, 1.0)]})
+    # the failed update left no rows behind
+    assert len({len(column) for column in (periods._slot, periods._start, periods._type, periods._volume)}) == 1
+    assert len(periods._began) == 1
+    [(_, values)] = periods.rollup(0, 1)
+    assert values["sessions"] == 1
+    assert values["kwh"] == 1.5
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The compiled serializers against flask-restx' marshal.
+"""
+
+from __future__ import annotations
+
+import copy
+
+import pytest
+from flask_restx import Namespace, marshal
+
+import ocpi.managers as om
+import ocpi.models.internal as mi
+import ocpi.models.location as ml
+import ocpi.models.sessions as ms
+from ocpi.models import resp, respList
+from ocpi.serializers import compileModel, compileModels
+
+from conftest import LOCATION
+
+NAMESPACE = Namespace("serializers")
+
+
+@pytest.fixture(scope="module")
+def locations():
+    manager = om.LocationManager()
+    for i in range(5):
+        location = copy.deepcopy(LOCATION)
+        location["id"] = f"LOC{i}"
+        location["evses"][0]["capabilities"] = ["RFID_READER"]
+        location["opening_times"] = {
+            "twentyfourseven": False,
+            "regular_hours": [{"weekday": 1, "period_begin": "08:00", "period_end": "20:00"}],
+        }
+        if i % 2:
+            # missing, None and unexpected values
+            location["operator"] = None
+            location["evses"][0]["connectors"][0]["voltage"] = "230"
+            location["evses"].append({"uid": "E2", "status": None, "connectors": None})
+        manager.putLocation("BE", "ABC", location["id"], location)
+    page, _ = manager.getLocations(None, None, 0, 5)
+    return page
+
+
+def test_page_of_locations(locations):
+    response = {"data": locations, "status_code": 1000, "timestamp": "2024-01-01T00:00:00Z"}
+    model = respList(NAMESPACE, ml.Location)
+    assert compileModel(model)(response) == marshal(response, model)
+
+
+def test_single_objects(locations):
+    location = locations[1]
+    assert compileModel(ml.Location)(location) == marshal(location, ml.Location)
+    evse = location["evses"][0]
+    assert compileModel(ml.EVSE)(evse) == marshal(evse, ml.EVSE)
+    assert compileModel(ml.EVSE)(None) == marshal(None, ml.EVSE)
+
+
+def test_session():
+    session = {
+        "id": "S1",
+        "start_datetime": "2024-01-01T00:00:00Z",
+        "kwh": 12.5,
+        "auth_id": "AUTH1",
+        "location": copy.deepcopy(LOCATION),
+        "currency": "EUR",
+        "charging_periods": [
+            {"start_date_time": "2024-01-01T00:00:00Z", "dimensions": [{"type": "ENERGY", "volume": 1.5}]}
+        ],
+        "status": "ACTIVE",
+        "last_updated": "2024-01-01T00:00:00Z",
+    }
+    model = resp(NAMESPACE, ms.Session)
+    response = {"data": session, "status_code": 1000, "timestamp": "2024-01-01T00:00:00Z"}
+    assert compileModel(model)(response) == marshal(response, model)
+
+
+def test_internal_models():
+    utilization = {"evses": 1, "seconds": {"CHARGING": 10}, "by_evse": {"E1": {"charging": 1.0}}}
+    assert compileModel(mi.Utilization)(utilization) == marshal(utilization, mi.Utilization)
+    heatmap = {"status": "CHARGING", "share": [[0.5] * 24] * 7}
+    assert compileModel(mi.Heatmap)(heatmap) == marshal(heatmap, mi.Heatmap)
+
+
+def test_models_compile():
+    assert compileModels(ml, ms, mi) > 0
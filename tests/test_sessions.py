@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The SessionManager: date windows and the lookups by status, token and place.
+"""
+
+from __future__ import annotations
+
+import copy
+
+import pytest
+
+import ocpi.managers as om
+
+from conftest import LOCATION
+
+
+def session(session_id, day, status="ACTIVE", auth_id="A1", location_id="LOC1", evse_uid="E1"):
+    location = copy.deepcopy(LOCATION)
+    location["id"] = location_id
+    location["evses"][0]["uid"] = evse_uid
+    return {
+        "id": session_id,
+        "start_datetime": f"2024-01-0{day}T00:00:00Z",
+        "kwh": 1.0,
+        "auth_id": auth_id,
+        "location": location,
+        "currency": "EUR",
+        "status": status,
+        "last_updated": f"2024-01-0{day}T00:00:00Z",
+    }
+
+
+@pytest.fixture
+def manager():
+    manager = om.SessionManager()
+    manager.createSession("BE", "ABC", session("S1", 1))
+    manager.createSession("BE", "ABC", session("S2", 2, auth_id="A2", evse_uid="E2"))
+    manager.createSession("BE", "ABC", session("S3", 3, status="COMPLETED", location_id="LOC2"))
+    return manager
+
+
+def ids(sessions):
+    return sorted(session["id"] for session in sessions)
+
+
+@pytest.mark.parametrize(
+    "begin, end, expected",
+    [
+        (None, None, ["S1", "S2", "S3"]),
+        ("2024-01-02T00:00:00Z", None, ["S2", "S3"]),
+        (None, "2024-01-02T00:00:00Z", ["S1"]),
+        ("2024-01-02T00:00:00Z", "2024-01-03T00:00:00Z", ["S2"]),
+    ],
+)
+def test_date_window(manager, begin, end, expected):
+    sessions, headers = manager.getSessions(begin, end, 0, 10)
+    assert [session["id"] for session in sessions] == expected
+    assert headers["X-Total-Count"] == len(expected)
+    assert [session["id"] for session in manager.iterSessions(begin, end, batch=1)] == expected
+
+
+def test_lookups(manager):
+    assert ids(manager.findSessions()) == ["S1", "S2", "S3"]
+    assert ids(manager.findSessions(status="ACTIVE")) == ["S1", "S2"]
+    assert ids(manager.findSessions(auth_id="A2")) == ["S2"]
+    assert ids(manager.findSessions(location_id="LOC1")) == ["S1", "S2"]
+    assert ids(manager.findSessions(location_id="LOC1", evse_uid="E2")) == ["S2"]
+    assert ids(manager.findSessions(status="COMPLETED", location_id="LOC1")) == []
+    assert ids(manager.getActiveSessions("LOC1", "E1")) == ["S1"]
+
+
+def test_lookups_follow_patches(manager):
+    manager.patchSession("BE", "ABC", "S1", {"status": "COMPLETED", "last_updated": "2024-01-05T00:00:00Z"})
+    assert ids(manager.findSessions(status="ACTIVE")) == ["S2"]
+    assert ids(manager.findSessions(status="COMPLETED")) == ["S1", "S3"]
+    assert ids(manager.getActiveSessions("LOC1")) == ["S2"]
+
+    manager.patchSession("BE", "ABC", "S2", {"location": session("S2", 2, location_id="LOC3")["location"]})
+    assert ids(manager.findSessions(location_id="LOC1")) == ["S1"]
+    assert ids(manager.findSessions(location_id="LOC3", evse_uid="E1")) == ["S2"]
+    assert ids(manager.findSessions(location_id="LOC1", evse_uid="E2")) == []
+
+    sessions, _ = manager.getSessions("2024-01-04T00:00:00Z", None, 0, 10)
+    assert [session["id"] for session in sessions] == ["S1"]
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The on-disk spool of the pushes and the worker sending them.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+
+import pytest
+
+import ocpi.spool as os_spool
+from ocpi.spool import RETRY_SCHEDULE, Spool, SpoolWorker
+
+NOW = 1_700_000_000.0
+
+
+class Response:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = ""
+
+
+class Client:
+    """answers every url with the next status of its list, the last one repeated"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.sent = []
+
+    def request(self, method, url, **kwargs):
+        self.sent.append((method, url, kwargs["json"]))
+        statuses = self.statuses.get(url, [200])
+        return Response(statuses.pop(0) if len(statuses) > 1 else statuses[0])
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(str(tmp_path / "spool"))
+
+
+def worker(spool, client, **kwargs):
+    return SpoolWorker(spool, client, window=0, **kwargs)
+
+
+def push(spool, url, n=1):
+    requests_ = [Spool.request("PUT", url, "token", {"n": i}) for i in range(n)]
+    for r in requests_:
+        r["next"] = r["created"] = NOW
+    spool.append(requests_)
+    return requests_
+
+
+def lines(directory):
+    return [
+        entry
+        for name in sorted(os.listdir(directory))
+        for entry in Spool.readLines(os.path.join(directory, name))
+    ]
+
+
+def test_append_while_the_file_is_claimed(spool, monkeypatch):
+    flock = os_spool.fcntl.flock
+    calls = []
+
+    def claimed_meanwhile(fd, operation):
+        # the worker claims the file between the writer's open and its lock
+        if not calls:
+            [name] = os.listdir(spool.queue)
+            os.rename(os.path.join(spool.queue, name), os.path.join(spool.claimed, name))
+        calls.append(fd)
+        return flock(fd, operation)
+
+    push(spool, "https://p/1")
+    monkeypatch.setattr(os_spool.fcntl, "flock", claimed_meanwhile)
+    push(spool, "https://p/2")
+    assert len(calls) == 2
+    # the second request went to a new queue file, not into the claimed one
+    assert [e["url"] for e in lines(spool.claimed)] == ["https://p/1"]
+    assert [e["url"] for e in lines(spool.queue)] == ["https://p/2"]
+
+
+def test_concurrent_appends_and_claims(spool):
+    def append():
+        for i in range(200):
+            push(spool, f"https://p/{threading.get_ident()}/{i}")
+
+    writers = [threading.Thread(target=append) for _ in range(4)]
+    for writer in writers:
+        writer.start()
+    while any(writer.is_alive() for writer in writers):
+        spool.claim()
+    spool.claim()
+    entries = lines(spool.claimed)
+    assert len(entries) == len({e["id"] for e in entries}) == 800
+    assert os.listdir(spool.queue) == []
+
+
+def test_recovers_claimed_files_of_a_crash(spool):
+    first = push(spool, "https://p/1", 2)
+    spool.claim()
+    # crashed after claiming: the requests are only in claimed/
+    second = worker(spool, Client({}))
+    second.collect()
+    assert [e["id"] for e in second.pending] == [e["id"] for e in first]
+    assert os.listdir(spool.claimed) == []
+
+    # crashed after writing pending but before removing the claimed file
+    third = push(spool, "https://p/2")
+    worker(spool, Client({})).collect()
+    with open(os.path.join(spool.claimed, "0-1.jsonl"), "w") as f, open(spool.pending) as pending:
+        f.write(pending.read())
+    restarted = worker(spool, Client({}))
+    restarted.collect()
+    assert [e["id"] for e in restarted.pending] == [e["id"] for e in first + third]
+    assert Spool.readLines(spool.pending) == restarted.pending
+
+
+@pytest.mark.parametrize("status", [500, 503, 429, 408])
+def test_retry_on_schedule(spool, status):
+    client = Client({"https://p/1": [status, 200]})
+    sender = worker(spool, client)
+    push(spool, "https://p/1")
+    sender.collect()
+    assert sender.process(now=NOW) == {"sent": 0, "retry": 1, "dead": 0}
+    [entry] = Spool.readLines(spool.pending)
+    assert (entry["attempts"], entry["next"]) == (1, NOW + RETRY_SCHEDULE[0])
+    assert entry["error"].startswith(f"HTTP {status}")
+    # not due yet
+    assert sender.process(now=NOW + 1) == {"sent": 0, "retry": 0, "dead": 0}
+    assert sender.process(now=NOW + RETRY_SCHEDULE[0]) == {"sent": 1, "retry": 0, "dead": 0}
+    assert Spool.readLines(spool.pending) == []
+    sender.fanout.shutdown()
+
+
+def test_client_error_is_dead(spool):
+    sender = worker(spool, Client({"https://p/1": [404]}))
+    push(spool, "https://p/1")
+    push(spool, "https://p/2")
+    sender.collect()
+    assert sender.process(now=NOW) == {"sent": 1, "retry": 0, "dead": 1}
+    [dead] = Spool.readLines(spool.dead)
+    assert (dead["url"], dead["error"]) == ("https://p/1", "HTTP 404 - ")
+    assert Spool.readLines(spool.pending) == []
+    sender.fanout.shutdown()
+
+
+def test_given_up_after_the_last_attempt(spool):
+    sender = worker(spool, Client({"https://p/1": [503]}), schedule=(10, 20))
+    push(spool, "https://p/1")
+    # a later request to the same url waits for the earlier one
+    push(spool, "https://p/1")
+    sender.collect()
+    assert sender.process(now=NOW)["retry"] == 1
+    assert sender.process(now=NOW + 10)["retry"] == 1
+    assert sender.process(now=NOW + 30) == {"sent": 0, "retry": 0, "dead": 1}
+    [dead] = Spool.readLines(spool.dead)
+    assert dead["attempts"] == 3
+    # the next request of the url is sent now
+    [entry] = Spool.readLines(spool.pending)
+    assert entry["attempts"] == 0
+    sender.fanout.shutdown()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The EVSEs counted by status.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+import ocpi.managers as om
+
+from conftest import HEADERS
+
+URL = "/ocpi/2.1.1/internal/stats"
+
+
+@pytest.fixture
+def manager(location):
+    manager = om.LocationManager()
+    location["evses"].append({"uid": "E2", "last_updated": "2024-01-01T00:00:00Z"})
+    manager.putLocation("BE", "ABC", "LOC1", location)
+    return manager
+
+
+def test_evses_without_status_are_not_counted(manager):
+    assert manager.getStatusCounts() == {"AVAILABLE": 1}
+    assert manager.getStatusCounts(country_code="BE", party_id="ABC") == {"AVAILABLE": 1}
+    with pytest.raises(om.InvalidMissingParamsError):
+        manager.getStatusCounts(country_code="BE")
+
+
+def test_stats(make_client, manager):
+    client = make_client(manager)
+    data = client.get(URL, headers=HEADERS).json["data"]
+    assert (data["AVAILABLE"], data["total"]) == (1, 1)
+    data = client.get(URL + "?country_code=BE&party_id=ABC", headers=HEADERS).json["data"]
+    assert data["total"] == 1
+    assert client.get(URL + "?country_code=BE", headers=HEADERS).status_code == 400
+    assert client.get(URL + "?party_id=ABC", headers=HEADERS).status_code == 400
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The SQLite store shared by the worker processes.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from ocpi.storage import SqliteStore
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / "store.db")
+
+
+def test_sequence_numbers(filename):
+    store = SqliteStore(filename, "locations")
+    assert store.load() == (0, [])
+    assert store.put("L1", {"v": 1}) == 1
+    assert store.put("L2", {"v": 1}) == 2
+    assert store.putMany([("L3", {"v": 1}), ("L1", {"v": 2}), ("L4", {"v": 1})]) == 5
+    assert store.putMany([]) == 0
+    assert store.changes(2) == [(3, "L3", {"v": 1}), (4, "L1", {"v": 2}), (5, "L4", {"v": 1})]
+    # a rewritten key only shows up with its last write
+    assert [(seq, key) for seq, key, _ in store.changes(0)] == [(2, "L2"), (3, "L3"), (4, "L1"), (5, "L4")]
+    assert store.changes(5) == []
+
+    # another process on the same file
+    other = SqliteStore(filename, "locations")
+    seq, documents = other.load()
+    assert seq == 5
+    assert dict(documents) == {"L1": {"v": 2}, "L2": {"v": 1}, "L3": {"v": 1}, "L4": {"v": 1}}
+    assert other.put("L2", {"v": 2}) == 6
+    assert store.changes(5) == [(6, "L2", {"v": 2})]
+    # tables are separate
+    assert SqliteStore(filename, "sessions").load() == (0, [])
+
+
+def test_invalid_table(filename):
+    with pytest.raises(ValueError):
+        SqliteStore(filename, "locations; DROP TABLE x")
+
+
+def test_nested_transaction(filename):
+    store = SqliteStore(filename, "locations")
+    other = SqliteStore(filename, "locations")
+    with store.transaction():
+        store.put("L1", {"v": 1})
+        with store.transaction():
+            store.put("L2", {"v": 1})
+        # committed only when the outermost transaction ends
+        assert other.changes(0) == []
+    assert [key for _, key, _ in other.changes(0)] == ["L1", "L2"]
+
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.put("L3", {"v": 1})
+            with store.transaction():
+                store.putMany([("L4", {"v": 1})])
+            raise RuntimeError("rolled back")
+    assert [key for _, key, _ in other.changes(0)] == ["L1", "L2"]
+    # the store is usable after the rollback
+    assert store.put("L5", {"v": 1}) == 3
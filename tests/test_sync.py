@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The internal endpoints of the pull-sync.
+"""
+
+from __future__ import annotations
+
+from ocpi.sync import SyncClient
+
+from conftest import HEADERS
+
+URL = "/ocpi/2.1.1/internal/sync"
+
+
+def test_sync_requires_token(make_client):
+    client = make_client()
+    assert client.get(URL).status_code == 401
+    assert client.post(URL).status_code == 401
+
+
+def test_sync_state(make_client):
+    response = make_client().get(URL, headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json["status_code"] == 1000
+    assert response.json["data"]["running"] is False
+    assert response.json["data"]["checkpoints"] == {}
+
+
+def test_sync_start(make_client, monkeypatch):
+    client = make_client()
+    response = client.post(URL, headers=HEADERS)
+    assert response.status_code == 202
+    assert response.json["data"]["started"] is True
+
+    monkeypatch.setattr(SyncClient, "running", True)
+    response = client.post(URL, headers=HEADERS)
+    assert response.status_code == 409
+    assert response.json["status_code"] == 1000
+    assert response.json["data"]["started"] is False
+
+
+def test_pages_are_fetched_in_a_bounded_window(monkeypatch):
+    client = SyncClient(None, workers=2)
+    requested = []
+
+    def get_page(url, token):
+        requested.append(url)
+        offset = int(url.split("offset=")[1].split("&")[0])
+        return [offset], {"X-Total-Count": "1000", "X-Limit": "10"}
+
+    monkeypatch.setattr(client, "_getPage", get_page)
+    pages = client._pages("http://partner/locations?offset=0&limit=10", "token")
+    assert next(pages) == [0]
+    assert next(pages) == [10]
+    # the first page, the stored one and at most workers * 2 ahead
+    assert len(requested) <= 2 + 4
+    assert [page for [page] in pages] == list(range(20, 1000, 10))
+    assert len(requested) == 100
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The compiled validators against flask-restx' validation.
+"""
+
+from __future__ import annotations
+
+import copy
+import warnings
+
+import pytest
+from flask_restx.model import ModelBase
+from werkzeug.exceptions import BadRequest
+
+import ocpi.models.location as ml
+import ocpi.models.sessions as ms
+from ocpi.validators import _definitions, compileValidator
+
+from conftest import LOCATION
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    from jsonschema import RefResolver
+
+SESSION = {
+    "id": "S1",
+    "start_datetime": "2024-01-01T00:00:00Z",
+    "kwh": 12.5,
+    "auth_id": "AUTH1",
+    "location": LOCATION,
+    "currency": "EUR",
+    "charging_periods": [
+        {"start_date_time": "2024-01-01T00:00:00Z", "dimensions": [{"type": "ENERGY", "volume": 1.5}]}
+    ],
+    "status": "ACTIVE",
+    "last_updated": "2024-01-01T00:00:00Z",
+}
+
+
+def mutations(payload):
+    """the payload and copies of it with one value missing, None or of another type"""
+    yield payload
+    paths = []
+
+    def walk(value, path):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                paths.append(path + (key,))
+                walk(item, path + (key,))
+        elif isinstance(value, list):
+            for index, item in enumerate(value):
+                walk(item, path + (index,))
+
+    walk(payload, ())
+    for path in paths:
+        for replace in ("missing", None, 7, "NOPE", [], {}, True, 1.5):
+            mutated = copy.deepcopy(payload)
+            parent = mutated
+            for key in path[:-1]:
+                parent = parent[key]
+            if replace == "missing":
+                del parent[path[-1]]
+            else:
+                parent[path[-1]] = replace
+            yield mutated
+
+
+def outcome(validate, payload):
+    try:
+        validate(payload)
+    except BadRequest as e:
+        return e.data["errors"]
+    return None
+
+
+@pytest.mark.parametrize(
+    "model, payload",
+    [
+        (ml.Connector, LOCATION["evses"][0]["connectors"][0]),
+        (ml.EVSE, LOCATION["evses"][0]),
+        (ml.Location, LOCATION),
+        (ms.Session, SESSION),
+    ],
+)
+def test_same_outcome_as_flask_restx(model, payload):
+    resolver = RefResolver.from_schema({"definitions": _definitions(model)})
+    compiled = compileValidator(model)
+    invalid = 0
+    for mutated in mutations(payload):
+        expected = outcome(lambda p: ModelBase.validate(model, p, resolver), mutated)
+        assert outcome(compiled.validate, mutated) == expected
+        assert compiled.errors(mutated) == (expected or {})
+        invalid += expected is not None
+    assert invalid > 0
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+The read only views on the stored locations.
+"""
+
+from __future__ import annotations
+
+import copy
+
+import pytest
+
+import ocpi.managers as om
+from ocpi.views import EvseView, LocationView, ValuesView
+
+from conftest import HEADERS, LOCATION
+
+URL = "/ocpi/2.1.1/locations/BE/ABC/LOC1"
+
+
+@pytest.fixture
+def manager():
+    manager = om.LocationManager()
+    location = copy.deepcopy(LOCATION)
+    evse = copy.deepcopy(location["evses"][0])
+    evse.update(uid="E2", status="CHARGING")
+    location["evses"].append(evse)
+    manager.putLocation("BE", "ABC", "LOC1", location)
+    return manager
+
+
+def test_values_view():
+    mapping = {"a": 1, "b": 2, "c": 3}
+    values = ValuesView(mapping)
+    assert len(values) == 3
+    assert list(values) == [1, 2, 3]
+    assert values[0] == 1 and values[-1] == 3 and values[1:] == (2, 3)
+    assert 2 in values and 4 not in values
+    with pytest.raises(IndexError):
+        values[3]
+    wrapped = ValuesView({"E1": {"uid": "E1"}}, EvseView)
+    assert isinstance(wrapped[0], EvseView) and wrapped[0]["uid"] == "E1"
+
+
+def test_views_are_read_only(manager):
+    location = manager.getLocation("BE", "ABC", "LOC1")
+    assert isinstance(location, LocationView)
+    with pytest.raises(TypeError):
+        location["city"] = "Brugge"
+    with pytest.raises(TypeError):
+        location["evses"][0]["status"] = "BLOCKED"
+    evses = location["evses"]
+    assert [evse["uid"] for evse in evses] == ["E1", "E2"]
+    assert [connector["id"] for connector in evses[1]["connectors"]] == ["1"]
+    # nothing is copied
+    assert location._document is manager.locations["LOC1"]
+
+
+def test_reads_leave_the_stored_dicts_unchanged(make_client, manager):
+    before = copy.deepcopy(manager.locations["LOC1"])
+    client = make_client(locations=manager)
+    response = client.get(URL, headers=HEADERS)
+    assert [evse["uid"] for evse in response.json["data"]["evses"]] == ["E1", "E2"]
+    assert client.get(URL + "/E2", headers=HEADERS).json["data"]["status"] == "CHARGING"
+    assert client.get(URL + "/E1/1", headers=HEADERS).json["data"]["voltage"] == 230
+    manager.getLocations(None, None, 0, 10)
+    list(manager.iterLocations(None, None))
+    manager.findEvses(status=["AVAILABLE"])
+
+    stored = manager.locations["LOC1"]
+    assert stored == before
+    assert isinstance(stored["evses"], dict) and list(stored["evses"]) == ["E1", "E2"]
+    assert isinstance(stored["evses"]["E1"]["connectors"], dict)
+    # the next write still finds the EVSE by uid
+    manager.patchEVSE("BE", "ABC", "LOC1", "E1", {"status": "BLOCKED"})
+    assert manager.getEVSE("BE", "ABC", "LOC1", "E1")["status"] == "BLOCKED"
+
+
+@pytest.mark.parametrize(
+    "write",
+    [
+        lambda m: m.patchLocation("BE", "ABC", "LOC1", {"city": "Brugge", "evses": [{"uid": "E1", "status": "BLOCKED"}]}),
+        lambda m: m.putLocation("BE", "ABC", "LOC1", {**copy.deepcopy(LOCATION), "city": "Brugge", "evses": []}),
+        lambda m: m.putEVSE("BE", "ABC", "LOC1", "E1", {**copy.deepcopy(LOCATION["evses"][0]), "status": "BLOCKED"}),
+        lambda m: m.patchEVSE("BE", "ABC", "LOC1", "E1", {"status": "BLOCKED"}),
+        lambda m: m.patchConnector("BE", "ABC", "LOC1", "E1", "1", {"voltage": 400}),
+    ],
+)
+def test_write_after_read_keeps_the_view(manager, write):
+    location = manager.getLocation("BE", "ABC", "LOC1")
+    evse = manager.getEVSE("BE", "ABC", "LOC1", "E1")
+    connector = manager.getConnector("BE", "ABC", "LOC1", "E1", "1")
+    page, _ = manager.getLocations(None, None, 0, 10)
+    before = copy.deepcopy(manager.locations["LOC1"])
+
+    write(manager)
+
+    assert manager.locations["LOC1"] != before
+    for held in (location, page[0]):
+        assert held["city"] == "Gent"
+        assert [evse["uid"] for evse in held["evses"]] == ["E1", "E2"]
+        assert held["evses"][0]["status"] == "AVAILABLE"
+        assert held["evses"][0]["connectors"][0]["voltage"] == 230
+    assert evse["status"] == "AVAILABLE"
+    assert connector["voltage"] == 230
+    assert location._document == before